@@ -0,0 +1,125 @@
+import argparse
+import csv
+import json
+import os
+import time
+
+from force_engine import create_force_engine
+from headless import MS_PER_DAY, relative_drift
+from integrator import INTEGRATORS, create_integrator
+from scenario import DEFAULT_SCENARIO, load_scenario
+from simulation import Simulation
+
+# Runs scenarios with every combination of integrator, force engine and step size and measures how well the energy
+# and the angular momentum are conserved and how much CPU time it takes. Settings that are neither more accurate nor
+# cheaper than another one are dropped from the Pareto front, and the fastest setting that meets the tolerance is chosen.
+
+SAMPLES = 20 # the errors are the largest of this many checks (symplectic integrators oscillate, the end alone can be lucky)
+DEFAULT_STEP_SIZES = (600, 3600, 21600, 86400) # in s
+DEFAULT_TOLERANCE = 1e-6
+FIELDS = ("scenario", "force_engine", "integrator", "step_size", "steps", "cpu_seconds", "energy_error", "angular_momentum_error", "pareto")
+
+def measure(scenario, force_engine_name, integrator_name, step_size, days, theta = 0.5, samples = SAMPLES):
+	# errors and CPU time of one setting, step_size in s
+	(bodies, inactive_bodies) = load_scenario(scenario)
+	force_engine = create_force_engine(force_engine_name, **({"theta": theta} if force_engine_name == "barnes-hut" else {}))
+	simulation = Simulation(force_engine, create_integrator(integrator_name), step_size * 1000, bodies, inactive_bodies)
+	step_count = max(1, round(days * MS_PER_DAY / simulation.step_size))
+
+	start_energy = simulation.calc_energy()
+	start_angular_momentum = simulation.calc_angular_momentum()
+	energy_error = 0.0
+	angular_momentum_error = 0.0
+	cpu_seconds = 0.0
+
+	for i in range(1, samples + 1):
+		start_time = time.process_time()
+		simulation.step(round(step_count * i / samples) - simulation.step_count)
+		cpu_seconds += time.process_time() - start_time # the checks aren't part of the cost
+
+		energy_error = max(energy_error, relative_drift(start_energy, simulation.calc_energy()))
+		angular_momentum_error = max(angular_momentum_error, relative_drift(start_angular_momentum, simulation.calc_angular_momentum()))
+
+	return {
+		"scenario": os.path.basename(scenario),
+		"force_engine": force_engine_name,
+		"integrator": integrator_name,
+		"step_size": step_size,
+		"steps": step_count,
+		"cpu_seconds": cpu_seconds,
+		"energy_error": float(energy_error),
+		"angular_momentum_error": float(angular_momentum_error),
+	}
+
+def get_error(result):
+	return max(result["energy_error"], result["angular_momentum_error"])
+
+def mark_pareto(results):
+	# a result is on the Pareto front if no other result of the same scenario is both cheaper and more accurate
+	for scenario in set(result["scenario"] for result in results):
+		best_error = float("inf")
+		for result in sorted((result for result in results if result["scenario"] == scenario), key=lambda result: (result["cpu_seconds"], get_error(result))):
+			result["pareto"] = get_error(result) < best_error
+			best_error = min(best_error, get_error(result))
+
+def choose_fastest(results, scenario, tolerance):
+	# cheapest setting whose errors stay below the tolerance or None
+	allowed = [result for result in results if result["scenario"] == scenario and get_error(result) <= tolerance]
+	return min(allowed, key=lambda result: result["cpu_seconds"], default=None)
+
+def print_table(results):
+	print(f"{'scenario':<20} {'engine':<11} {'integrator':<10} {'step s':>8} {'steps':>8} {'cpu s':>8} {'energy':>10} {'ang. mom.':>10}  pareto")
+	for result in sorted(results, key=lambda result: (result["scenario"], result["cpu_seconds"])):
+		print(
+			f"{result['scenario']:<20} {result['force_engine']:<11} {result['integrator']:<10} {result['step_size']:>8g} {result['steps']:>8} "
+			f"{result['cpu_seconds']:>8.3f} {result['energy_error']:>10.2e} {result['angular_momentum_error']:>10.2e}  {'*' if result['pareto'] else ''}"
+		)
+
+def save_results(path, results):
+	# .json or .csv with one row per setting
+	if path.lower().endswith(".json"):
+		with open(path, "w") as file:
+			json.dump(results, file, indent=4)
+	else:
+		with open(path, "w", newline="") as file:
+			writer = csv.DictWriter(file, FIELDS)
+			writer.writeheader()
+			writer.writerows(results)
+
+def main():
+	parser = argparse.ArgumentParser(description="Accuracy and cost of the integrators and force engines")
+	parser.add_argument("--scenarios", nargs="+", default=[DEFAULT_SCENARIO], help="scenario files (default: the solar system)")
+	parser.add_argument("--integrators", nargs="+", choices=INTEGRATORS.keys(), default=list(INTEGRATORS.keys()))
+	parser.add_argument("--force-engines", nargs="+", choices=["direct", "barnes-hut"], default=["direct", "barnes-hut"])
+	parser.add_argument("--theta", type=float, default=0.5, help="opening angle of the barnes-hut force engine")
+	parser.add_argument("--step-sizes", type=float, nargs="+", default=list(DEFAULT_STEP_SIZES), help="simulated seconds per step (default: 600 3600 21600 86400)")
+	parser.add_argument("--days", type=float, default=365, help="simulated time of every run (default: 365)")
+	parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help=f"largest allowed relative energy and angular momentum error (default: {DEFAULT_TOLERANCE})")
+	parser.add_argument("--output", help="save the results as .csv or .json")
+	args = parser.parse_args()
+
+	results = []
+	for scenario in args.scenarios:
+		for force_engine_name in args.force_engines:
+			for integrator_name in args.integrators:
+				for step_size in args.step_sizes:
+					results.append(measure(scenario, force_engine_name, integrator_name, step_size, args.days, args.theta))
+					print(f"{len(results)} / {len(args.scenarios) * len(args.force_engines) * len(args.integrators) * len(args.step_sizes)}", end="\r", flush=True)
+	print()
+	mark_pareto(results)
+
+	print_table(results)
+	print()
+	for scenario in args.scenarios:
+		fastest = choose_fastest(results, os.path.basename(scenario), args.tolerance)
+		if fastest is None:
+			print(f"{os.path.basename(scenario)}: no setting meets the tolerance {args.tolerance:g}")
+		else:
+			print(f"{os.path.basename(scenario)}: fastest setting with errors below {args.tolerance:g}: "
+				f"--force-engine {fastest['force_engine']} --integrator {fastest['integrator']} --step-size {fastest['step_size']:g}")
+
+	if args.output is not None:
+		save_results(args.output, results)
+
+if __name__ == "__main__":
+	main()
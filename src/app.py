@@ -1,35 +1,66 @@
-import math
-from datetime import datetime
+import time
 
 import pygame
 from pygame.constants import KMOD_LCTRL
 
 from utility import *
 from body import Body
+from body_renderer import BodyRenderer
+from checkpoint import load_checkpoint, save_checkpoint
+from clock import FrameClock
 from dynamic_background import DynamicBackground
+from frame_writer import FrameWriter
+from recording import TrajectoryReplay
+from profiler import Profiler
+from simulation import Simulation
+from simulation_worker import SimulationWorker
+from tiled_background import TiledBackground
+
+BACKGROUNDS = {
+	"dynamic": DynamicBackground, # random stars that get moved when they leave the view
+	"tiled": TiledBackground, # stars that always stay at the same place, drawn from cached tiles
+}
 
 class App:
-	GRAVITATIONAL_CONSTANT = 6.67384e-20 # for calculating force in kg * km / s^2
 	ZOOM_STEP = 1.03
 	TIME_STEP = 1.3
 	DRAW_FORCES_STEP = 1.2
+	REPLAY_SEEK_STEP = 0.01 # part of the whole recording
 
 
 	# init
 
-	def __init__(self):
+	def __init__(self, simulation: Simulation = None, replay: TrajectoryReplay = None, checkpoint_path = None, background = "dynamic", threaded = False, max_steps_per_second = 0, profile_path = None, target_fps = 120, vsync = False, window_size = (720, 600), offscreen = False, background_seed = None):
 		self.running = True
-		self.last_micros = 0
+		self.checkpoint_path = checkpoint_path # Ctrl + s saves the state into this file
+		self.clock = FrameClock(target_fps) # measures and paces the frames
+		self.vsync = vsync
+		self.offscreen = offscreen # draw into a surface instead of a window (for exports)
 		
-		self.window_width = 720 # size of the window
-		self.window_height = 600
+		(self.window_width, self.window_height) = window_size # size of the window
 		self.view_width = 350_000_000 # size of the model
 		self.view_start_x = -self.view_width / 2 # x-position (in the model) at the left edge of the window
 		self.view_start_y = self.view_start_x * self.window_height / self.window_width
 		self.fixed_body: Body = None # if this is a body, then the view always changes, so that the body is in a fixed place
 		
-		self.background = DynamicBackground(self.view_width, self.view_start_x, self.view_start_y, self.window_width / self.window_height, self.pos_to_screen_pos)
-		self.init_model()
+		self.background = BACKGROUNDS[background](self.view_width, self.view_start_x, self.view_start_y, self.window_width / self.window_height, self.pos_to_screen_pos, background_seed) # a random seed if None
+		self.replay = replay # if this is a recording, it gets played instead of simulating
+		if self.replay is not None:
+			self.simulation = Simulation(bodies=self.replay.create_bodies())
+			self.replay_time = self.replay.times[0]
+		else:
+			self.simulation = simulation if simulation is not None else Simulation()
+
+		# with a worker the simulation runs in its own thread and the app draws a copy of the bodies
+		self.worker: SimulationWorker = SimulationWorker(self.simulation, max_steps_per_second) if threaded and self.replay is None else None
+
+		# the time of every phase of a frame is measured, Ctrl + p shows it
+		self.profiler = Profiler()
+		self.profile_path = profile_path # the measured times are saved into this file at the end (.csv or .json)
+		self.draw_profiler = False
+		if self.worker is None:
+			self.simulation.profiler = self.profiler # the worker thread isn't measured (it doesn't run in frames)
+		self.body_renderer = BodyRenderer()
 		self.draw_forces = False
 		self.draw_forces_factor = 1.0
 
@@ -39,183 +70,121 @@ class App:
 
 		# init pygame
 		pygame.init()
-		self.screen = pygame.display.set_mode((self.window_width, self.window_height), pygame.HWSURFACE | pygame.DOUBLEBUF | pygame.RESIZABLE) # Create a window surface
-		pygame.display.set_caption("Gravity simulation")
-
-	def init_model(self):
-		self.sun = Body(
-			name = "sun",
-			mass = 1.989e30,
-			pos_x = 0, pos_y = 0,
-			velocity_x = 0, velocity_y = 0,
-			draw_radius = 25,
-			color = ORANGE,
-			pos_to_screen_pos = self.pos_to_screen_pos,
-		)
-
-		self.sun1 = Body(
-			name = "sun1",
-			mass = 9.945e29,
-			pos_x = 24_500_000, pos_y = 0,
-			velocity_x = 0, velocity_y = -21_248.66363,
-			draw_radius = 20,
-			color = ORANGE,
-			pos_to_screen_pos = self.pos_to_screen_pos,
-		)
-
-		self.sun2 = Body(
-			name = "sun2",
-			mass = 9.945e29,
-			pos_x = -24_500_000, pos_y = 0,
-			velocity_x = 0, velocity_y = 21_248.66363,
-			draw_radius = 20,
-			color = ORANGE,
-			pos_to_screen_pos = self.pos_to_screen_pos,
-		)
-
-		mercury = Body(
-			name = "mercury",
-			mass = 3.285e23,
-			pos_x = -69_817_000, pos_y = 0,
-			velocity_x = 0, velocity_y = -38_860,
-			draw_radius = 10,
-			color = (188, 167, 116),
-			pos_to_screen_pos = self.pos_to_screen_pos
-		)
-
-		venus = Body(
-			name = "venus",
-			mass = 4.8675e24,
-			pos_x = -108_939_000, pos_y = 0,
-			velocity_x = 0, velocity_y = -34_790,
-			draw_radius = 10,
-			color = (171, 105, 61),
-			pos_to_screen_pos = self.pos_to_screen_pos
-		)
-
-		earth = Body(
-			name = "earth",
-			mass = 5.9724e24,
-			pos_x = -152_099_000, pos_y = 0,
-			velocity_x = 0, velocity_y = -29_290,
-			draw_radius = 13,
-			color = BLUE,
-			pos_to_screen_pos = self.pos_to_screen_pos,
-		)
-
-		self.moon = Body(
-			name = "moon",
-			mass = 7.346e22,
-			pos_x = earth.pos_x - 363_300, pos_y = 0,
-			velocity_x = 0, velocity_y = earth.velocity_y - 970,
-			draw_radius = 6,
-			color = GREY,
-			pos_to_screen_pos = self.pos_to_screen_pos,
-		)
-
-		mars = Body(
-			name = "mars",
-			mass = 6.4171e23,
-			pos_x = -249_229_000, pos_y = 0,
-			velocity_x = 0, velocity_y = -21_970,
-			draw_radius = 10,
-			color = (220, 59, 36),
-			pos_to_screen_pos = self.pos_to_screen_pos
-		)
-
-		jupiter = Body(
-			name = "jupiter",
-			mass = 1898.19e24,
-			pos_x = -816_618_000, pos_y = 0,
-			velocity_x = 0, velocity_y = -12_440,
-			draw_radius = 15,
-			color = (184, 135, 125),
-			pos_to_screen_pos = self.pos_to_screen_pos
-		)
-
-		saturn = Body(
-			name = "saturn",
-			mass = 568.34e24,
-			pos_x = -1_514_504_000, pos_y = 0,
-			velocity_x = 0, velocity_y = -9_090,
-			draw_radius = 11,
-			color = (206, 177, 121),
-			pos_to_screen_pos = self.pos_to_screen_pos
-		)
-
-		uranus = Body(
-			name = "uranus",
-			mass = 86.813e24,
-			pos_x = -3_003_625_000, pos_y = 0,
-			velocity_x = 0, velocity_y = -6_490,
-			draw_radius = 10,
-			color = (0, 162, 252),
-			pos_to_screen_pos = self.pos_to_screen_pos
-		)
-
-		neptune = Body(
-			name = "neptune",
-			mass = 102.413e24,
-			pos_x = -4_545_671_000, pos_y = 0,
-			velocity_x = 0, velocity_y = - 5_370,
-			draw_radius = 10,
-			color = (46, 62, 159),
-			pos_to_screen_pos = self.pos_to_screen_pos
-		)
-
-		pluto = Body(
-			name = "pluto",
-			mass = 1.303e22,
-			pos_x = -7_304_326_000, pos_y = 0,
-			velocity_x = 0, velocity_y = - 3_710,
-			draw_radius = 7,
-			color = (149, 151, 163),
-			pos_to_screen_pos = self.pos_to_screen_pos
-		)
-
-		self.bodies = [pluto, neptune, uranus, saturn, jupiter, mars, self.moon, earth, venus, mercury, self.sun]
-
+		self.screen = self.create_screen() # Create a window surface
+		if not self.offscreen:
+			pygame.display.set_caption("Gravity simulation")
+
+	def create_screen(self):
+		if self.offscreen:
+			return pygame.Surface((self.window_width, self.window_height))
+
+		flags = pygame.HWSURFACE | pygame.DOUBLEBUF | pygame.RESIZABLE
+		if self.vsync:
+			try:
+				return pygame.display.set_mode((self.window_width, self.window_height), flags, vsync=1)
+			except pygame.error:
+				print("vsync is not supported, only the frame rate limit is used")
+		return pygame.display.set_mode((self.window_width, self.window_height), flags)
 
 	# game
 
 	def run(self):
+		if self.worker is not None:
+			self.worker.start()
+		try:
+			self.run_loop()
+		finally:
+			if self.worker is not None:
+				self.worker.stop()
+			if self.profile_path is not None:
+				self.profiler.save(self.profile_path)
+
+	def run_loop(self):
+		self.clock.reset()
 		while self.running:
 
-			# calculate delta time of last frame
-			delta = self.calc_delta()
-			#print("Delta: ", delta)
+			# wait for the next frame and calculate delta time of last frame
+			start = self.profiler.begin()
+			delta = self.clock.tick()
+			self.profiler.end("wait", start)
 
 			# handle input
+			start = self.profiler.begin()
 			for event in pygame.event.get():
 				self.handle_event(event)
+			self.profiler.end("events", start)
 
 			if not self.paused:
 				self.update(delta)
 
 			self.render()
 
+			start = self.profiler.begin()
 			pygame.display.flip()
-			#print("FPS: ", (1000 / delta) if (delta > 0) else "infinite")
-
-	def update(self, delta):
+			self.profiler.end("flip", start)
+			self.profiler.end_frame()
+
+	def export(self, path, frame_count, fps = 60, encoder = "ffmpeg"):
+		# renders frame_count frames with a fixed simulated time per frame (delta of 1 / fps s times the time factor) and writes them
+		# to a video or .png sequence, independent of the real time a frame takes
+		if self.worker is not None:
+			raise ValueError("an export can't run the simulation in its own thread (the frames wouldn't be reproducible)")
+		writer = FrameWriter(path, self.window_width, self.window_height, fps, encoder)
+		delta = 1000.0 / fps
+		start_time = time.perf_counter()
+		try:
+			for frame in range(frame_count):
+				if frame > 0:
+					self.update(delta, drop_time=False)
+
+				self.render()
+
+				start = self.profiler.begin()
+				writer.write(self.screen)
+				self.profiler.end("export", start)
+				self.profiler.end_frame()
+
+				if (frame + 1) % max(1, round(fps)) == 0 or frame + 1 == frame_count:
+					print(f"frame {frame + 1} / {frame_count}: {(frame + 1) / (time.perf_counter() - start_time):.1f} frames/s", end="\r", flush=True)
+		finally:
+			print()
+			writer.close()
+			if self.profile_path is not None:
+				self.profiler.save(self.profile_path)
+		elapsed = time.perf_counter() - start_time
+		print(f"Exported {frame_count} frames ({frame_count / fps:.1f} s of video) to {path} in {elapsed:.1f} s ({frame_count / fps / elapsed:.2f} x real time)")
+
+	def update(self, delta, drop_time = True):
 		# save the distance between fixed body and start values of the view
 		if self.fixed_body is not None:
 			last_pos_x = self.fixed_body.pos_x
 			last_pos_y = self.fixed_body.pos_y
 
-		# calculate forces
-		for body in self.bodies:
-			self.calc_force_on_body(body)
-
-		# update bodies
-		for body in self.bodies:
-			body.update(delta * self.time_factor)
+		# advance the simulation or the replay (the simulation measures forces and integration itself)
+		if self.replay is not None:
+			start = self.profiler.begin()
+			self.seek_replay(self.replay_time + delta * self.time_factor)
+			self.profiler.end("replay", start)
+		elif self.worker is not None:
+			start = self.profiler.begin()
+			self.worker.advance(delta * self.time_factor)
+			self.worker.update_bodies()
+			self.profiler.end("interpolation", start)
+		else:
+			self.simulation.advance(delta * self.time_factor, drop_time)
+
+		# the fixed body may have been merged into another body (with a worker the drawn bodies then get replaced)
+		if self.fixed_body is not None and self.fixed_body.system is not self.get_bodies():
+			name = self.fixed_body.name
+			self.fixed_body = self.get_bodies().find(name) if name is not None else None
 
 		# update the view for fixed body
 		if self.fixed_body is not None:
+			start = self.profiler.begin()
 			self.view_start_x += self.fixed_body.pos_x - last_pos_x
 			self.view_start_y += self.fixed_body.pos_y - last_pos_y
 			self.background.change_view_starts(self.view_start_x, self.view_start_y)
+			self.profiler.end("background", start)
 
 	def render(self):
 		# reset the screen to black
@@ -223,11 +192,20 @@ class App:
 
 		# draw background
 		if (self.draw_background):
+			start = self.profiler.begin()
 			self.background.draw(self.screen)
+			self.profiler.end("background", start)
 
-		# draw all bodies
-		for body in self.bodies:
-			body.draw(self.screen, self.draw_forces_factor if self.draw_forces else 0)
+		# draw the visible bodies (and their forces)
+		start = self.profiler.begin()
+		self.body_renderer.draw(self.screen, self.get_bodies(), self.pos_to_screen_pos, self.simulation.force_engine, self.draw_forces_factor if self.draw_forces else 0)
+		self.profiler.end("bodies", start)
+
+		# draw the measured times
+		if self.draw_profiler:
+			start = self.profiler.begin()
+			self.profiler.draw_overlay(self.screen)
+			self.profiler.end("overlay", start)
 
 
 	# input
@@ -289,34 +267,68 @@ class App:
 			elif key == pygame.K_b and (mod & pygame.KMOD_LCTRL):
 				self.draw_background = not self.draw_background
 
+			# Ctrl + p
+			elif key == pygame.K_p and (mod & pygame.KMOD_LCTRL):
+				self.draw_profiler = not self.draw_profiler
+
 			# Ctrl + d
 			elif key == pygame.K_d and (mod & pygame.KMOD_LCTRL):
-				if self.sun in self.bodies:
-					self.bodies.remove(self.sun)
-					self.bodies.append(self.sun1)
-					self.bodies.append(self.sun2)
-				else:
-					self.bodies.remove(self.sun1)
-					self.bodies.remove(self.sun2)
-					self.bodies.append(self.sun)
+				self.swap_suns()
 
 			# Ctrl + m
 			elif key == pygame.K_m and (mod & pygame.KMOD_LCTRL):
-				if self.fixed_body is not self.moon:
-					self.fixed_body = self.moon
+				moon = self.get_drawn_body(self.simulation.moon)
+				if self.fixed_body is not moon:
+					self.fixed_body = moon
 				else:
 					self.fixed_body = None
 
+			# Ctrl + s
+			elif key == pygame.K_s and (mod & pygame.KMOD_LCTRL) and self.checkpoint_path is not None and self.replay is None:
+				self.save_checkpoint(self.checkpoint_path)
+
+			# Ctrl + Left
+			elif key == pygame.K_LEFT and (mod & pygame.KMOD_LCTRL) and self.replay is not None:
+				self.replay_time -= App.REPLAY_SEEK_STEP * (self.replay.times[-1] - self.replay.times[0])
+				self.update(0)
+
+			# Ctrl + Right
+			elif key == pygame.K_RIGHT and (mod & pygame.KMOD_LCTRL) and self.replay is not None:
+				self.replay_time += App.REPLAY_SEEK_STEP * (self.replay.times[-1] - self.replay.times[0])
+				self.update(0)
+
+			# Ctrl + Home
+			elif key == pygame.K_HOME and (mod & pygame.KMOD_LCTRL) and self.replay is not None:
+				self.replay_time = self.replay.times[0]
+				self.update(0)
+
+			# Ctrl + End
+			elif key == pygame.K_END and (mod & pygame.KMOD_LCTRL) and self.replay is not None:
+				self.replay_time = self.replay.times[-1]
+				self.update(0)
+
 			# Ctrl + Escape
 			elif key == pygame.K_ESCAPE and (mod & pygame.KMOD_LCTRL):
 				self.running = False
 
 	def mouse_clicked(self, mouse_x, mouse_y):
-		for body in reversed(self.bodies):
-			if self.is_click_on_body(body, mouse_x, mouse_y):
-				self.fixed_body = body
-				return
-		self.fixed_body = None
+		# the clicked body with the highest index (it was drawn last) gets fixed
+		bodies = self.get_bodies()
+		if len(bodies) == 0:
+			self.fixed_body = None
+			return
+
+		# the spatial index of the simulation (with a worker the one of the latest snapshot) finds the bodies near the click
+		(pos_x, pos_y) = self.screen_pos_to_pos(mouse_x, mouse_y)
+		pixel_size = self.view_width / self.window_width # in km
+		radius = bodies.draw_radius.max() * pixel_size
+		if self.worker is not None:
+			near = self.worker.query_radius(pos_x, pos_y, radius)
+		else:
+			near = self.simulation.spatial_index.query_radius(pos_x, pos_y, radius)
+		distance_squared = (bodies.pos_x[near] - pos_x) ** 2 + (bodies.pos_y[near] - pos_y) ** 2
+		clicked = near[distance_squared <= (bodies.draw_radius[near] * pixel_size) ** 2]
+		self.fixed_body = bodies[int(clicked[-1])] if len(clicked) > 0 else None
 
 	def window_resize(self, new_width, new_height):
 		self.view_start_x += 0.5 * self.view_width * (1.0 / self.window_width - 1.0 / new_width) # the pixel (with / 2, _) will correspond to the same position in the model before and after window resize (is almost the same as having the pixel (0, _) => is almost the same as doing nothing)
@@ -325,42 +337,83 @@ class App:
 		self.window_width = new_width
 		self.window_height = new_height
 
-		# regenerate background (TODO implement other solution)
-		self.background.view_start_x = self.view_start_x
-		self.background.view_start_y = self.view_start_y
-		self.background.screen_ratio = self.window_width / self.window_height
-		self.background.stars = []
-		self.background.generate()
+		# only the newly visible parts of the background get new stars
+		self.background.resize(self.view_start_x, self.view_start_y, self.window_width / self.window_height)
 
 
 	# utility
 
-	def calc_force_on_body(self, body):
-		body.force_x = 0
-		body.force_y = 0
-		body.forces = []
-
-		for other_body in self.bodies:
-			if other_body is body: # don't calculate the force between the body and itself
-				continue
-
-			# vector from other_bodys positon to bodys position
-			vec_x = other_body.pos_x - body.pos_x
-			vec_y = other_body.pos_y - body.pos_y
-
-			# magnitude of the force
-			distance_squared = vec_x * vec_x + vec_y * vec_y
-			force_magnitude = App.GRAVITATIONAL_CONSTANT * body.mass * other_body.mass / distance_squared
-
-			# vector of the force
-			scale_factor = force_magnitude / math.sqrt(distance_squared)
-			force_x = vec_x * scale_factor
-			force_y = vec_y * scale_factor
-
-			body.forces.append((force_x, force_y))
-
-			body.force_x += force_x
-			body.force_y += force_y
+	def get_bodies(self):
+		# the bodies that get drawn
+		return self.worker.bodies if self.worker is not None else self.simulation.bodies
+
+	def get_drawn_body(self, body: Body):
+		# the drawn copy of a body of the simulation
+		if self.worker is None or body is None or body.system is None:
+			return body
+		return self.worker.bodies[body.index]
+
+	def swap_suns(self):
+		if self.worker is None:
+			self.simulation.swap_suns()
+			return
+
+		# the indices of the bodies change, the fixed body is found again by its name
+		fixed_name = self.fixed_body.name if self.fixed_body is not None else None
+		self.worker.modify(self.simulation.swap_suns)
+		self.fixed_body = self.worker.bodies.find(fixed_name) if fixed_name is not None else None
+
+	def seek_replay(self, time):
+		# jump to the frame of the recording at the simulated time
+		self.replay_time = min(max(time, self.replay.times[0]), self.replay.times[-1])
+		self.replay.load_frame(self.replay.frame_at(self.replay_time), self.simulation.bodies)
+		self.simulation.update_spatial_index()
+
+	def save_checkpoint(self, path):
+		app_state = {
+			"time_factor": self.time_factor,
+			"fixed_body": self.fixed_body.index if self.fixed_body is not None else None,
+			"view_width": self.view_width,
+			"view_start_x": self.view_start_x,
+			"view_start_y": self.view_start_y,
+			"background": self.background.get_state(),
+		}
+		if self.worker is not None:
+			with self.worker.simulation_lock:
+				save_checkpoint(path, self.simulation, {"app": app_state})
+		else:
+			save_checkpoint(path, self.simulation, {"app": app_state})
+		print(f"Saved checkpoint to {path}")
+
+	def load_checkpoint(self, path):
+		(self.simulation, extra_state) = load_checkpoint(path)
+		if self.worker is None:
+			self.simulation.profiler = self.profiler
+
+		# the worker has to run the new simulation
+		if self.worker is not None:
+			was_running = self.worker.thread is not None
+			self.worker.stop()
+			self.worker = SimulationWorker(self.simulation, self.worker.max_steps_per_second)
+			if was_running:
+				self.worker.start()
+
+		# checkpoints of headless runs don't have a view
+		app_state = extra_state.get("app")
+		if app_state is None:
+			self.fixed_body = None
+			return
+
+		self.time_factor = app_state["time_factor"]
+		self.fixed_body = self.get_bodies()[app_state["fixed_body"]] if app_state["fixed_body"] is not None else None
+		self.view_width = app_state["view_width"]
+		self.view_start_x = app_state["view_start_x"]
+		self.view_start_y = app_state["view_start_y"]
+
+		self.background.set_state(app_state["background"])
+		if self.background.screen_ratio != self.window_width / self.window_height:
+			# the window has another shape than when the checkpoint was saved
+			self.window_resize(self.window_width, self.window_height)
 
 	def zoom_in(self):
 		self.zoom(1 / App.ZOOM_STEP)
@@ -397,26 +450,6 @@ class App:
 		pos_y = self.view_width * (screen_y + 0.5) / self.window_width + self.view_start_y
 		return (pos_x, pos_y)
 
-	def is_click_on_body(self, body: Body, click_screen_x, click_screen_y):
-		(body_screen_x, body_screen_y) = self.pos_to_screen_pos(body.pos_x, body.pos_y)
-		screen_distance_squared = (body_screen_x - click_screen_x) ** 2 + (body_screen_y - click_screen_y) ** 2
-
-		return (screen_distance_squared <= body.draw_radius ** 2)
-
-	def calc_delta(self):
-		micros = datetime.now().microsecond
-
-		if self.last_micros == 0:
-			self.last_micros = micros
-			return 0
-		
-		delta = micros - self.last_micros
-		self.last_micros = micros
-		if delta < 0:
-			delta += 999999 # overflow
-
-		return delta / 1000.0 # delta in ms
-
 	def is_key_pressed(key) -> bool:
 		return pygame.key.get_mods() & key
 
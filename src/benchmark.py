@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pygame
+
+from body_system import BodySystem
+from dynamic_background import DynamicBackground
+from force_engine import create_force_engine
+from integrator import create_integrator
+from scenario import generate_disk, generate_plummer
+from simulation import Simulation
+
+# Microbenchmarks of parts of the app, they don't need a window (drawing uses the dummy video driver of SDL).
+
+VIEW_WIDTH = 350_000_000
+SCREEN_RATIO = 720 / 600
+PAN_PER_FRAME = 0.002 # part of the view width the view moves per frame (like following the moon)
+ZOOM_STEP = 1.03 # like App.ZOOM_STEP
+
+# sizes of the suite
+SUITE_DIRECT_BODIES = (100, 1_000)
+SUITE_BARNES_HUT_BODIES = (1_000, 10_000)
+SUITE_INTEGRATION_BODIES = (1_000, 100_000)
+SUITE_STARS = (1_000, 10_000, 100_000)
+SUITE_RENDER_BODIES = (1_000, 10_000)
+DEFAULT_TOLERANCE = 0.10 # a result that is this much slower than the baseline is a regression
+
+def benchmark_background_pan(star_count, frames = 500, seed = 0):
+	# time per frame of moving the view of the background while a body is fixed
+	view_start_x = -VIEW_WIDTH / 2
+	view_start_y = view_start_x / SCREEN_RATIO
+	background = DynamicBackground(VIEW_WIDTH, view_start_x, view_start_y, SCREEN_RATIO, None, seed, star_count)
+
+	start_time = time.perf_counter()
+	for i in range(frames):
+		view_start_x += PAN_PER_FRAME * VIEW_WIDTH
+		view_start_y -= 0.5 * PAN_PER_FRAME * VIEW_WIDTH
+		background.change_view_starts(view_start_x, view_start_y)
+	return (time.perf_counter() - start_time) / frames
+
+def benchmark_background_zoom(star_count, frames = 500, seed = 0):
+	# time per frame of zooming in and out around the center of the view
+	background = DynamicBackground(VIEW_WIDTH, -VIEW_WIDTH / 2, -VIEW_WIDTH / 2 / SCREEN_RATIO, SCREEN_RATIO, None, seed, star_count)
+
+	start_time = time.perf_counter()
+	for i in range(frames):
+		zoom_in = (i // 50) % 2 == 0 # 50 frames in, 50 frames out
+		view_width = background.view_width / ZOOM_STEP if zoom_in else background.view_width * ZOOM_STEP
+		(view_start_x, view_start_y) = (-view_width / 2, -view_width / 2 / SCREEN_RATIO)
+		if zoom_in:
+			background.zoom_in(view_width, view_start_x, view_start_y)
+		else:
+			background.zoom_out(view_width, view_start_x, view_start_y)
+	return (time.perf_counter() - start_time) / frames
+
+def benchmark_forces(body_count, engine, engine_options, workers, repeats = 3, seed = 0):
+	# best time of a force calculation for all bodies of a Plummer sphere
+	bodies = generate_plummer(body_count, 1e36, 1e10, seed)
+	if workers > 0:
+		force_engine = create_force_engine("parallel", workers=workers, engine=engine, engine_options=engine_options)
+	else:
+		force_engine = create_force_engine(engine, **engine_options)
+	force_engine.calc_accelerations(bodies["pos_x"], bodies["pos_y"], bodies["mass"]) # starts the worker processes
+
+	best_time = float("inf")
+	for i in range(repeats):
+		start_time = time.perf_counter()
+		force_engine.calc_accelerations(bodies["pos_x"], bodies["pos_y"], bodies["mass"])
+		best_time = min(best_time, time.perf_counter() - start_time)
+	return best_time
+
+def time_call(function, repeats = 5, number = 1):
+	# best mean time of number calls out of repeats tries
+	function() # warm up caches and lazily created things
+	best_time = float("inf")
+	for i in range(repeats):
+		start_time = time.perf_counter()
+		for j in range(number):
+			function()
+		best_time = min(best_time, (time.perf_counter() - start_time) / number)
+	return best_time
+
+def benchmark_integration(integrator_name, body_count, repeats):
+	# time of a step of the integrator alone, the accelerations are precomputed
+	columns = generate_plummer(body_count, 1e36, 1e10)
+	(pos_x, pos_y, vel_x, vel_y) = (columns["pos_x"], columns["pos_y"], columns["velocity_x"], columns["velocity_y"])
+	(acc_x, acc_y) = create_force_engine("barnes-hut").calc_accelerations(pos_x, pos_y, columns["mass"])
+	integrator = create_integrator(integrator_name)
+
+	def calc_accelerations(pos_x, pos_y, targets = None):
+		return (acc_x, acc_y) if targets is None else (acc_x[targets], acc_y[targets])
+
+	return time_call(lambda: integrator.step(pos_x, pos_y, vel_x, vel_y, Simulation.STEP_SIZE, calc_accelerations), repeats, 10)
+
+def benchmark_render(body_count, repeats):
+	# time of drawing a whole frame (background and bodies) of a disk that fills the view
+	from app import App # creates a window, so only imported when needed
+
+	bodies = BodySystem(body_count + 1)
+	bodies.add_many(**generate_disk(body_count, 1e7, 0.4 * VIEW_WIDTH, 2e30))
+	app = App(Simulation(bodies=bodies), background_seed=0) # the same stars in every run
+	return time_call(app.render, repeats, 10)
+
+def run_suite(repeats):
+	# all benchmarks as name -> seconds per call
+	results = {}
+	def add(name, seconds):
+		results[name] = seconds
+		print(f"{name:<32} {seconds * 1e3:>10.3f} ms", flush=True)
+
+	for body_count in SUITE_DIRECT_BODIES:
+		add(f"forces/direct/{body_count}", benchmark_forces(body_count, "direct", {}, 0, repeats))
+	for body_count in SUITE_BARNES_HUT_BODIES:
+		add(f"forces/barnes-hut/{body_count}", benchmark_forces(body_count, "barnes-hut", {"theta": 0.5}, 0, repeats))
+	for integrator_name in ("leapfrog", "yoshida", "rk4"):
+		for body_count in SUITE_INTEGRATION_BODIES:
+			add(f"integration/{integrator_name}/{body_count}", benchmark_integration(integrator_name, body_count, repeats))
+	for star_count in SUITE_STARS:
+		add(f"background/pan/{star_count}", min(benchmark_background_pan(star_count, 200) for i in range(repeats)))
+		add(f"background/zoom/{star_count}", min(benchmark_background_zoom(star_count, 200) for i in range(repeats)))
+	for body_count in SUITE_RENDER_BODIES:
+		add(f"render/{body_count}", benchmark_render(body_count, repeats))
+	return results
+
+def compare_results(results, baseline, tolerance):
+	# prints the change against the baseline, returns the names of the regressions
+	regressions = []
+	print(f"{'benchmark':<32} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+	for (name, seconds) in results.items():
+		if name not in baseline:
+			print(f"{name:<32} {'-':>12} {seconds * 1e3:>12.3f} {'new':>8}")
+			continue
+		change = seconds / baseline[name] - 1.0
+		regression = change > tolerance
+		if regression:
+			regressions.append(name)
+		print(f"{name:<32} {baseline[name] * 1e3:>12.3f} {seconds * 1e3:>12.3f} {change * 100:>+7.1f}%{'  REGRESSION' if regression else ''}")
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description="Microbenchmarks of the gravity simulation")
+	subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+	background_parser = subparsers.add_parser("background", help="cost per frame of panning the star field")
+	background_parser.add_argument("--frames", type=int, default=500, help="number of frames per measurement (default: 500)")
+
+	forces_parser = subparsers.add_parser("forces", help="scaling of the parallel force engine with the number of worker processes")
+	forces_parser.add_argument("--bodies", type=int, default=100_000, help="number of bodies (default: 100000)")
+	forces_parser.add_argument("--engine", choices=["direct", "barnes-hut"], default="barnes-hut", help="force engine of the workers (default: barnes-hut)")
+	forces_parser.add_argument("--theta", type=float, default=0.5)
+	forces_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="numbers of worker processes (default: 1 2 4 8)")
+	forces_parser.add_argument("--repeats", type=int, default=3)
+
+	suite_parser = subparsers.add_parser("suite", help="forces, integration, background and drawing over a range of sizes")
+	suite_parser.add_argument("--output", help="save the results as JSON (e.g. as a baseline for later runs)")
+	suite_parser.add_argument("--baseline", help="compare with the results of an earlier run, exits with 1 if something got slower")
+	suite_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help=f"allowed relative slowdown before a result counts as a regression (default: {DEFAULT_TOLERANCE})")
+	suite_parser.add_argument("--repeats", type=int, default=5, help="the best of this many measurements is used (default: 5)")
+	args = parser.parse_args()
+
+	if args.benchmark == "background":
+		print("background panning")
+		print(f"{'stars':>8} {'µs / frame':>12} {'ns / star':>10}")
+		for star_count in (1_000, 10_000, 100_000):
+			seconds = benchmark_background_pan(star_count, args.frames)
+			print(f"{star_count:>8} {seconds * 1e6:>12.1f} {seconds * 1e9 / star_count:>10.2f}")
+
+	elif args.benchmark == "forces":
+		engine_options = {"theta": args.theta} if args.engine == "barnes-hut" else {}
+		single_time = benchmark_forces(args.bodies, args.engine, engine_options, 0, args.repeats)
+		print(f"{args.engine} force calculation of {args.bodies} bodies")
+		print(f"{'workers':>8} {'s / call':>10} {'speedup':>8}")
+		print(f"{'-':>8} {single_time:>10.3f} {1.0:>8.2f}")
+		for workers in args.workers:
+			seconds = benchmark_forces(args.bodies, args.engine, engine_options, workers, args.repeats)
+			print(f"{workers:>8} {seconds:>10.3f} {single_time / seconds:>8.2f}")
+
+	elif args.benchmark == "suite":
+		os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+		results = run_suite(args.repeats)
+
+		if args.output is not None:
+			data = {
+				"python": platform.python_version(),
+				"numpy": np.__version__,
+				"pygame": pygame.version.ver,
+				"machine": platform.platform(),
+				"results": results, # seconds per call
+			}
+			with open(args.output, "w") as file:
+				json.dump(data, file, indent=4)
+
+		if args.baseline is not None:
+			with open(args.baseline, "r") as file:
+				baseline = json.load(file)["results"]
+			print()
+			regressions = compare_results(results, baseline, args.tolerance)
+			if regressions:
+				print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+				sys.exit(1)
+			print("no regressions")
+
+if __name__ == "__main__":
+	main()
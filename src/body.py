@@ -1,52 +1,72 @@
-from types import MethodType
+import utility
 
-import pygame
+def stored_property(field):
+	# reads and writes the value in the arrays of the body system or in the own state while detached
+	def get(self):
+		if self.system is None:
+			return self.state[field]
+		return self.system.arrays[field][self.index]
 
-import utility
+	def set(self, value):
+		if self.system is None:
+			self.state[field] = value
+		else:
+			self.system.arrays[field][self.index] = value
+
+	return property(get, set)
 
 class Body:
-	FORCE_TO_PIXELS = 1e-18
-
-	def __init__(self, name, mass, pos_x: int, pos_y: int, velocity_x, velocity_y, draw_radius, color, pos_to_screen_pos: MethodType):
-		self.name = name
-		self.mass = mass # in kg
-		self.pos_x: int = pos_x
-		self.pos_y: int = pos_y
-		self.velocity_x = velocity_x # in m / s
-		self.velocity_y = velocity_y # in m / s
-		self.draw_radius = draw_radius
-		self.color = color
-
-		self.pos_to_screen_pos: MethodType = pos_to_screen_pos
-
-		self.force_x = 0 # in kg * km / s^2
-		self.force_y = 0 # in kg * km / s^2
-		self.forces = []
-
-	def update(self, delta_time):
-		# update velocity
-		self.velocity_x = self.velocity_x + self.force_x * delta_time / self.mass
-		self.velocity_y = self.velocity_y + self.force_y * delta_time / self.mass
-
-		# update position
-		self.pos_x = int(self.pos_x + delta_time / 1_000_000 * self.velocity_x) # need conversion because velocity is in m/s and not in km/ms
-		self.pos_y = int(self.pos_y + delta_time / 1_000_000 * self.velocity_y) # need conversion because velocity is in m/s and not in km/ms
-
-	def draw(self, screen, draw_forces_factor):
-		# convert position in the model to coordinates on screen
-		(pos_screen_x, pos_screen_y) = self.pos_to_screen_pos(self.pos_x, self.pos_y)
-
-		# draw forces
-		if draw_forces_factor > 0:
-			self.draw_force(screen, pos_screen_x, pos_screen_y, self.force_x, self.force_y, draw_forces_factor, 2)
-
-			for (force_x, force_y) in self.forces:
-				self.draw_force(screen, pos_screen_x, pos_screen_y, force_x, force_y, draw_forces_factor)
-
-		# draw the body
-		pygame.draw.circle(screen, self.color, (pos_screen_x, pos_screen_y), self.draw_radius)
-
-	def draw_force(self, screen, pos_screen_x, pos_screen_y, force_x, force_y, draw_force_factor, line_width = 1):
-		(force_screen_x, force_screen_y) = (force_x * Body.FORCE_TO_PIXELS * draw_force_factor, force_y * Body.FORCE_TO_PIXELS * draw_force_factor)
-		pygame.draw.line(screen, self.color, (pos_screen_x, pos_screen_y), (pos_screen_x + force_screen_x, pos_screen_y + force_screen_y), line_width)
-		
\ No newline at end of file
+	# A light handle to one body in a BodySystem. A body that isn't part of a system (yet or anymore)
+	# keeps its state itself, so it can be added again later (like the sun when it gets replaced by 2 suns).
+	__slots__ = ("system", "index", "state", "state_name")
+
+	def __init__(self, name, mass, pos_x: float, pos_y: float, velocity_x: float, velocity_y: float, draw_radius, color):
+		self.system = None
+		self.index = -1
+		self.state_name = name
+		self.state = {
+			"mass": float(mass), # in kg
+			"pos_x": float(pos_x), # in km
+			"pos_y": float(pos_y), # in km
+			"velocity_x": float(velocity_x), # in m / s
+			"velocity_y": float(velocity_y), # in m / s
+			"draw_radius": draw_radius,
+			"color": color,
+		}
+
+	def create_handle(system, index):
+		body = Body.__new__(Body)
+		body.state = None
+		body.state_name = None
+		body.attach(system, index)
+		return body
+
+	def attach(self, system, index):
+		self.system = system
+		self.index = index
+		self.state = None
+
+	def detach(self):
+		# copy the state out of the arrays
+		self.state = {field: self.system.arrays[field][self.index].item() for field in self.system.FLOAT_FIELDS}
+		self.state["color"] = self.color
+		self.state_name = self.name
+		self.system = None
+		self.index = -1
+
+	mass = stored_property("mass")
+	pos_x = stored_property("pos_x")
+	pos_y = stored_property("pos_y")
+	velocity_x = stored_property("velocity_x")
+	velocity_y = stored_property("velocity_y")
+	draw_radius = stored_property("draw_radius")
+
+	@property
+	def name(self):
+		return self.state_name if self.system is None else self.system.names[self.index]
+
+	@property
+	def color(self):
+		if self.system is None:
+			return self.state["color"]
+		return tuple(self.system.arrays["color"][self.index].tolist())
@@ -0,0 +1,76 @@
+import numpy as np
+import pygame
+
+from body_system import BodySystem
+from force_engine import ForceEngine
+
+class BodyRenderer:
+	# Draws the bodies with array operations, so that the cost of a frame depends on what is visible and not on the number of bodies.
+	# Bodies outside of the view are skipped. Bodies with a draw radius of at most POINT_RADIUS are added up into single pixels
+	# (dense regions get brighter) instead of drawing a circle for each of them. Forces are only drawn for the MAX_FORCE_BODIES heaviest
+	# visible bodies, with the total force and the TOP_FORCES strongest single forces of each.
+
+	POINT_RADIUS = 1 # in pixels
+	TOP_FORCES = 8
+	MAX_FORCE_BODIES = 32
+	FORCE_TO_PIXELS = 1e-18
+
+	def draw(self, screen, bodies: BodySystem, pos_to_screen_pos, force_engine: ForceEngine, draw_forces_factor):
+		(screen_width, screen_height) = screen.get_size()
+		(screen_x, screen_y) = pos_to_screen_pos(bodies.pos_x, bodies.pos_y)
+		radius = bodies.draw_radius
+
+		# culling
+		visible = (screen_x + radius >= 0) & (screen_x - radius < screen_width) & (screen_y + radius >= 0) & (screen_y - radius < screen_height)
+		points = np.flatnonzero(visible & (radius <= BodyRenderer.POINT_RADIUS))
+		circles = np.flatnonzero(visible & (radius > BodyRenderer.POINT_RADIUS))
+
+		BodyRenderer.draw_points(screen, screen_x[points], screen_y[points], bodies.color[points])
+
+		if draw_forces_factor > 0 and len(points) + len(circles) > 0:
+			force_bodies = np.flatnonzero(visible)
+			if len(force_bodies) > BodyRenderer.MAX_FORCE_BODIES:
+				heaviest = np.argpartition(bodies.mass[force_bodies], -BodyRenderer.MAX_FORCE_BODIES)[-BodyRenderer.MAX_FORCE_BODIES:]
+				force_bodies = np.sort(force_bodies[heaviest])
+			self.draw_forces(screen, bodies, screen_x, screen_y, force_engine, force_bodies, draw_forces_factor)
+
+		# bigger bodies are drawn in the order of the body system
+		colors = bodies.color[circles].tolist()
+		for (x, y, r, color) in zip(screen_x[circles].tolist(), screen_y[circles].tolist(), radius[circles].tolist(), colors):
+			pygame.draw.circle(screen, color, (x, y), r)
+
+	def draw_points(screen, screen_x, screen_y, colors):
+		# adds the colors of all bodies in the same pixel (the pixel that contains the center of the body)
+		(screen_width, screen_height) = screen.get_size()
+		pixel_x = np.floor(screen_x).astype(np.int64)
+		pixel_y = np.floor(screen_y).astype(np.int64)
+		inside = (pixel_x >= 0) & (pixel_x < screen_width) & (pixel_y >= 0) & (pixel_y < screen_height)
+		if not inside.any():
+			return
+
+		(pixels, inverse) = np.unique(pixel_x[inside] * screen_height + pixel_y[inside], return_inverse=True)
+		(unique_x, unique_y) = np.divmod(pixels, screen_height)
+		colors = colors[inside]
+
+		screen_pixels = pygame.surfarray.pixels3d(screen) # locks the screen until it is deleted
+		for channel in range(3):
+			added = np.bincount(inverse, weights=colors[:, channel], minlength=len(pixels))
+			screen_pixels[unique_x, unique_y, channel] = np.minimum(screen_pixels[unique_x, unique_y, channel] + added, 255)
+		del screen_pixels
+
+	def draw_forces(self, screen, bodies: BodySystem, screen_x, screen_y, force_engine: ForceEngine, force_bodies, draw_forces_factor):
+		# total force (thick) and the strongest single forces (thin) of the force bodies
+		(pos_x, pos_y, mass) = (bodies.pos_x, bodies.pos_y, bodies.mass)
+		(force_x, force_y) = force_engine.calc_forces(pos_x, pos_y, mass, force_bodies)
+		(pair_force_x, pair_force_y) = force_engine.calc_strongest_pair_forces(pos_x, pos_y, mass, force_bodies, BodyRenderer.TOP_FORCES)
+
+		scale = BodyRenderer.FORCE_TO_PIXELS * draw_forces_factor
+		start_x = screen_x[force_bodies]
+		start_y = screen_y[force_bodies]
+		colors = bodies.color[force_bodies].tolist()
+
+		for (i, color) in enumerate(colors):
+			start = (start_x[i], start_y[i])
+			for (line_x, line_y) in zip((pair_force_x[i] * scale).tolist(), (pair_force_y[i] * scale).tolist()):
+				pygame.draw.line(screen, color, start, (start[0] + line_x, start[1] + line_y))
+			pygame.draw.line(screen, color, start, (start[0] + force_x[i] * scale, start[1] + force_y[i] * scale), 2)
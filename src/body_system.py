@@ -0,0 +1,169 @@
+import numpy as np
+
+from body import Body
+
+class BodySystem:
+	# Stores the state of all bodies in contiguous arrays (structure of arrays).
+	# The arrays have spare capacity, so adding a body doesn't reallocate them every time, and removing
+	# a body moves the last body into its place (O(1), but the order of the bodies changes).
+	# Body objects are only light handles into these arrays and get created when they are needed.
+
+	INITIAL_CAPACITY = 16
+	FLOAT_FIELDS = ("mass", "pos_x", "pos_y", "velocity_x", "velocity_y", "draw_radius")
+
+	def __init__(self, capacity = INITIAL_CAPACITY):
+		self.count = 0
+		self.capacity = max(1, capacity)
+		self.arrays = {field: np.zeros(self.capacity) for field in BodySystem.FLOAT_FIELDS}
+		self.arrays["color"] = np.zeros((self.capacity, 3), dtype=np.uint8)
+		self.names = [] # may contain None for bodies without a name
+		self.handles = [] # None until a handle is requested
+
+	# views of the used part of the arrays, they become invalid when the arrays grow
+
+	@property
+	def mass(self):
+		return self.arrays["mass"][:self.count] # in kg
+
+	@property
+	def pos_x(self):
+		return self.arrays["pos_x"][:self.count] # in km
+
+	@property
+	def pos_y(self):
+		return self.arrays["pos_y"][:self.count] # in km
+
+	@property
+	def velocity_x(self):
+		return self.arrays["velocity_x"][:self.count] # in m / s
+
+	@property
+	def velocity_y(self):
+		return self.arrays["velocity_y"][:self.count] # in m / s
+
+	@property
+	def draw_radius(self):
+		return self.arrays["draw_radius"][:self.count] # in pixels
+
+	@property
+	def color(self):
+		return self.arrays["color"][:self.count]
+
+
+	# add and remove
+
+	def append(self, body):
+		# stores the state of a detached body in the arrays and attaches the body to them
+		if body.system is not None:
+			raise ValueError(f"body '{body.name}' is already part of a body system")
+
+		self.reserve(self.count + 1)
+		index = self.count
+		for (field, value) in body.state.items():
+			self.arrays[field][index] = value
+		self.names.append(body.state_name)
+		self.handles.append(body)
+		self.count += 1
+
+		body.attach(self, index)
+		return body
+
+	def add_many(self, mass, pos_x, pos_y, velocity_x, velocity_y, draw_radius, color, names = None):
+		# adds many bodies at once without creating a Python object per body, returns their indices
+		count = len(mass)
+		self.reserve(self.count + count)
+		new = slice(self.count, self.count + count)
+
+		self.arrays["mass"][new] = mass
+		self.arrays["pos_x"][new] = pos_x
+		self.arrays["pos_y"][new] = pos_y
+		self.arrays["velocity_x"][new] = velocity_x
+		self.arrays["velocity_y"][new] = velocity_y
+		self.arrays["draw_radius"][new] = draw_radius
+		self.arrays["color"][new] = color
+		self.names.extend(names if names is not None else [None] * count)
+		self.handles.extend([None] * count)
+		self.count += count
+
+		return range(new.start, new.stop)
+
+	def copy(self):
+		# independent copy of all bodies (without handles)
+		bodies = BodySystem(self.count)
+		for (field, array) in self.arrays.items():
+			bodies.arrays[field][:self.count] = array[:self.count]
+		bodies.names = list(self.names)
+		bodies.handles = [None] * self.count
+		bodies.count = self.count
+		return bodies
+
+	def remove(self, body):
+		if body.system is not self:
+			raise ValueError(f"body '{body.name}' is not part of this body system")
+
+		index = body.index
+		body.detach()
+		self.remove_index(index)
+
+	def remove_index(self, index):
+		# moves the last body into the gap, a handle of the removed body keeps its state
+		if self.handles[index] is not None and self.handles[index].system is self:
+			self.handles[index].detach()
+
+		last = self.count - 1
+		if index != last:
+			for array in self.arrays.values():
+				array[index] = array[last]
+			self.names[index] = self.names[last]
+			self.handles[index] = self.handles[last]
+			if self.handles[index] is not None:
+				self.handles[index].index = index
+
+		self.names.pop()
+		self.handles.pop()
+		self.count -= 1
+
+	def reserve(self, capacity):
+		# grows the arrays (at least doubling them), so that adding bodies is amortized O(1)
+		if capacity <= self.capacity:
+			return
+
+		self.capacity = max(capacity, 2 * self.capacity)
+		for (field, array) in self.arrays.items():
+			new_array = np.zeros((self.capacity,) + array.shape[1:], dtype=array.dtype)
+			new_array[:self.count] = array[:self.count]
+			self.arrays[field] = new_array
+
+
+	# access
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, index):
+		if index < 0:
+			index += self.count
+		if not 0 <= index < self.count:
+			raise IndexError("body index out of range")
+
+		# create handles lazily
+		if self.handles[index] is None:
+			self.handles[index] = Body.create_handle(self, index)
+		return self.handles[index]
+
+	def __iter__(self):
+		for index in range(self.count):
+			yield self[index]
+
+	def __reversed__(self):
+		for index in reversed(range(self.count)):
+			yield self[index]
+
+	def __contains__(self, body):
+		return body.system is self
+
+	def find(self, name):
+		# first body with the name or None
+		if name not in self.names:
+			return None
+		return self[self.names.index(name)]
@@ -0,0 +1,154 @@
+import json
+import os
+
+import numpy as np
+
+from body import Body
+from body_system import BodySystem
+from collisions import CollisionHandler
+from force_engine import create_force_engine, get_force_engine_name
+from integrator import create_integrator, get_integrator_name
+from simulation import Simulation
+
+# A checkpoint is an uncompressed .npz file: all arrays are stored bit for bit, everything else is
+# stored as JSON (in the array "metadata"). Python writes floats in JSON so that they are read back exactly.
+# Nested states are flattened, the key of an array is its path with "." as separator.
+
+VERSION = 2 # 2: all inactive bodies are saved (1 only had the inactive special bodies)
+SPECIAL_BODIES = ("sun", "sun1", "sun2", "moon")
+
+def save_checkpoint(path, simulation: Simulation, extra_state = None):
+	# extra_state can hold anything else that should be restored (e.g. the view of the app)
+	bodies = simulation.bodies
+	inactive_bodies = simulation.inactive_bodies
+	state = {
+		"version": VERSION,
+		"simulation": {
+			"time": simulation.time,
+			"time_accumulator": simulation.time_accumulator,
+			"step_count": simulation.step_count,
+			"step_size": simulation.step_size,
+			"force_engine": get_force_engine_name(simulation.force_engine),
+			"force_engine_options": simulation.force_engine.get_options(),
+			"integrator": get_integrator_name(simulation.integrator),
+			"integrator_options": simulation.integrator.get_options(),
+			"collisions": simulation.collisions.get_options() if simulation.collisions is not None else None,
+		},
+		"integrator": simulation.integrator.get_state(),
+		"bodies": {field: array[:bodies.count] for (field, array) in bodies.arrays.items()},
+		"body_names": list(bodies.names),
+		"inactive_bodies": {
+			**{field: np.array([body.state[field] for body in inactive_bodies], dtype=np.float64) for field in BodySystem.FLOAT_FIELDS},
+			"color": np.array([body.color for body in inactive_bodies], dtype=np.uint8).reshape(-1, 3),
+		},
+		"inactive_body_names": [body.name for body in inactive_bodies],
+		"special_bodies": {name: save_body_reference(getattr(simulation, name), inactive_bodies) for name in SPECIAL_BODIES},
+		"extra": extra_state if extra_state is not None else {},
+	}
+
+	arrays = {}
+	metadata = split_state(state, "", arrays)
+
+	# write to a temporary file first, so that a crash while saving doesn't destroy the last checkpoint
+	temporary_path = path + ".tmp"
+	with open(temporary_path, "wb") as file:
+		np.savez(file, metadata=np.frombuffer(json.dumps(metadata).encode("utf-8"), dtype=np.uint8), **arrays)
+	os.replace(temporary_path, path)
+
+def load_checkpoint(path):
+	# returns the simulation and the extra state
+	with np.load(path, allow_pickle=False) as data:
+		metadata = json.loads(data["metadata"].tobytes().decode("utf-8"))
+		arrays = {key: data[key] for key in data.files if key != "metadata"}
+
+	if metadata.get("version", 0) > VERSION:
+		raise ValueError(f"checkpoint version {metadata['version']} is not supported (supported up to version {VERSION})")
+	state = join_state(metadata, "", arrays)
+
+	saved_bodies = state["bodies"]
+	bodies = BodySystem(len(saved_bodies["mass"]))
+	bodies.add_many(
+		mass = saved_bodies["mass"],
+		pos_x = saved_bodies["pos_x"], pos_y = saved_bodies["pos_y"],
+		velocity_x = saved_bodies["velocity_x"], velocity_y = saved_bodies["velocity_y"],
+		draw_radius = saved_bodies["draw_radius"],
+		color = saved_bodies["color"],
+		names = state["body_names"],
+	)
+
+	# inactive bodies keep their state themselves (there are only a few)
+	saved_inactive_bodies = state.get("inactive_bodies", {})
+	inactive_bodies = [
+		Body(name, *(saved_inactive_bodies[field][i] for field in BodySystem.FLOAT_FIELDS), tuple(saved_inactive_bodies["color"][i].tolist()))
+		for (i, name) in enumerate(state.get("inactive_body_names", []))
+	]
+
+	saved_simulation = state["simulation"]
+	simulation = Simulation(
+		force_engine = create_force_engine(saved_simulation["force_engine"], **saved_simulation["force_engine_options"]),
+		integrator = create_integrator(saved_simulation["integrator"], **saved_simulation["integrator_options"]),
+		step_size = saved_simulation["step_size"],
+		bodies = bodies,
+		inactive_bodies = inactive_bodies,
+	)
+	simulation.time = saved_simulation["time"]
+	simulation.time_accumulator = saved_simulation["time_accumulator"]
+	simulation.step_count = saved_simulation["step_count"]
+	simulation.integrator.set_state(state["integrator"])
+	if saved_simulation.get("collisions") is not None:
+		simulation.collisions = CollisionHandler(**saved_simulation["collisions"])
+
+	for name in SPECIAL_BODIES:
+		body = load_body_reference(state["special_bodies"][name], bodies, inactive_bodies)
+		setattr(simulation, name, body)
+		if body is not None and body.system is None and body not in inactive_bodies:
+			inactive_bodies.append(body) # version 1
+
+	return (simulation, state["extra"])
+
+
+# helpers
+
+def save_body_reference(body: Body, inactive_bodies):
+	# bodies in the system are saved by their index, inactive ones (like the sun while there are 2 suns) by their index
+	# in the inactive bodies, others with their state
+	if body is None:
+		return None
+	if body.system is not None:
+		return {"index": body.index}
+	if body in inactive_bodies:
+		return {"inactive_index": inactive_bodies.index(body)}
+	return {"name": body.name, "state": body.state}
+
+def load_body_reference(reference, bodies: BodySystem, inactive_bodies):
+	if reference is None:
+		return None
+	if "index" in reference:
+		return bodies[reference["index"]]
+	if "inactive_index" in reference:
+		return inactive_bodies[reference["inactive_index"]]
+
+	state = reference["state"]
+	return Body(reference["name"], state["mass"], state["pos_x"], state["pos_y"], state["velocity_x"], state["velocity_y"], state["draw_radius"], tuple(state["color"]))
+
+def split_state(state, prefix, arrays):
+	# moves the arrays out of a nested dict into arrays (with their path as key) and returns the rest
+	rest = {}
+	for (key, value) in state.items():
+		if isinstance(value, np.ndarray):
+			arrays[prefix + key] = value
+		elif isinstance(value, dict):
+			rest[key] = split_state(value, prefix + key + ".", arrays)
+		elif isinstance(value, np.generic):
+			rest[key] = value.item()
+		else:
+			rest[key] = value
+	return rest
+
+def join_state(rest, prefix, arrays):
+	# inverse of split_state
+	state = {key: join_state(value, prefix + key + ".", arrays) if isinstance(value, dict) else value for (key, value) in rest.items()}
+	for (key, array) in arrays.items():
+		if key.startswith(prefix) and "." not in key[len(prefix):]:
+			state[key[len(prefix):]] = array
+	return state
@@ -0,0 +1,45 @@
+import time
+
+class FrameClock:
+	# Measures the real time between frames with the monotonic perf_counter_ns (changes of the wall clock don't matter)
+	# and paces the frames to a target frame rate, so that the app doesn't use a whole CPU core for frames nobody sees.
+	# The time of a frame is clamped, so that a stall (e.g. dragging the window) doesn't become one huge physics step.
+
+	MAX_DELTA = 100.0 # in ms, longer frames count as this long
+	SPIN_NS = 1_000_000 # the last part of waiting is busy, because sleep may wake up too late
+
+	def __init__(self, target_fps = 0, max_delta = MAX_DELTA):
+		self.target_fps = target_fps # 0 = no limit
+		self.max_delta = max_delta
+		self.last_ns = None
+		self.next_frame_ns = None # when the next frame should start
+
+	def reset(self):
+		# the next tick measures from now (e.g. after loading or unpausing something slow)
+		self.last_ns = time.perf_counter_ns()
+		self.next_frame_ns = self.last_ns
+
+	def tick(self):
+		# waits until the next frame should start, returns the time since the last tick in ms
+		if self.last_ns is None:
+			self.reset()
+
+		if self.target_fps > 0:
+			frame_ns = int(1e9 / self.target_fps)
+			self.next_frame_ns += frame_ns
+			self.wait_until(self.next_frame_ns)
+			# after a slow frame the frames don't hurry to catch up
+			if time.perf_counter_ns() - self.next_frame_ns > frame_ns:
+				self.next_frame_ns = time.perf_counter_ns()
+
+		now = time.perf_counter_ns()
+		delta = (now - self.last_ns) / 1e6 # in ms
+		self.last_ns = now
+		return min(delta, self.max_delta)
+
+	def wait_until(self, deadline_ns):
+		remaining = deadline_ns - time.perf_counter_ns()
+		if remaining > FrameClock.SPIN_NS:
+			time.sleep((remaining - FrameClock.SPIN_NS) / 1e9)
+		while time.perf_counter_ns() < deadline_ns:
+			pass
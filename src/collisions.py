@@ -0,0 +1,99 @@
+import numpy as np
+
+from body_system import BodySystem
+from force_engine import ForceEngine
+from spatial_index import SpatialGrid
+
+class CollisionHandler:
+	# Merges bodies that touch each other after a step (perfectly inelastic: mass and momentum are conserved).
+	# Bodies are spheres with a radius that follows from their mass and the density.
+	# Broad phase: the spatial grid of the simulation (updated after every step). Bodies that are small compared with a cell
+	# are only checked against the bodies in the neighbouring cells, the few large ones (like a sun) with a radius query each.
+	# A group of bodies that touch each other becomes the heaviest body of the group, the others get removed.
+
+	DEFAULT_DENSITY = 5.5 # in g / cm^3 (like the earth)
+	LARGE_RADIUS = 0.5 # in cells, larger bodies are checked with radius queries
+
+	def __init__(self, density = DEFAULT_DENSITY):
+		self.density = density
+		self.merge_count = 0 # bodies removed so far
+
+	def get_options(self):
+		# arguments for the constructor
+		return {"density": self.density}
+
+	def calc_radii(self, mass):
+		# in km, g / cm^3 = 10^12 kg / km^3
+		return np.cbrt(3.0 * mass / (4.0 * np.pi * self.density * 1e12))
+
+	def merge(self, bodies: BodySystem, spatial_index: SpatialGrid):
+		# merges all bodies that touch each other, returns the number of removed bodies (spatial_index has to be up to date)
+		(first, second) = self.find_pairs(spatial_index, bodies.pos_x, bodies.pos_y, self.calc_radii(bodies.mass))
+		if len(first) == 0:
+			return 0
+
+		# groups of touching bodies (connected components), every body gets the smallest index of its group
+		members = np.unique(np.concatenate((first, second)))
+		group = np.arange(len(bodies))
+		while True:
+			new_group = group.copy()
+			smallest = np.minimum(group[first], group[second])
+			np.minimum.at(new_group, first, smallest)
+			np.minimum.at(new_group, second, smallest)
+			new_group = new_group[new_group] # pointer jumping
+			if np.array_equal(new_group, group):
+				break
+			group = new_group
+		(groups, group_index) = np.unique(group[members], return_inverse=True)
+
+		# the heaviest body of a group survives and gets the mass, the center of mass and the momentum of the whole group
+		mass = bodies.mass[members]
+		by_group_and_mass = np.lexsort((mass, group_index))
+		last_of_group = np.r_[group_index[by_group_and_mass][1:] != group_index[by_group_and_mass][:-1], True]
+		survivors = members[by_group_and_mass[last_of_group]]
+
+		total_mass = np.bincount(group_index, mass, len(groups))
+		weight = np.where(total_mass > 0, total_mass, 1.0) # a group of massless bodies just stays where the survivor is
+		for field in ("pos_x", "pos_y", "velocity_x", "velocity_y"):
+			values = bodies.arrays[field][:bodies.count]
+			weighted_sum = np.bincount(group_index, mass * values[members], len(groups))
+			values[survivors] = np.where(total_mass > 0, weighted_sum / weight, values[survivors])
+		bodies.mass[survivors] = total_mass
+
+		# removing the bodies with the highest index first never moves a body that still has to be removed
+		removed = np.setdiff1d(members, survivors)
+		for index in removed[::-1].tolist():
+			bodies.remove_index(index)
+		self.merge_count += len(removed)
+		return len(removed)
+
+	def find_pairs(self, spatial_index: SpatialGrid, pos_x, pos_y, radius):
+		# all pairs of touching bodies as 2 arrays of indices
+		(all_first, all_second) = ([], [])
+		if len(radius) < 2:
+			return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+		large = radius > CollisionHandler.LARGE_RADIUS * spatial_index.cell_size
+		has_large = large.any()
+
+		# small bodies: pairs from neighbouring cells (pairs with a large body are found below)
+		small_radius = radius[~large].max() if not large.all() else 0.0
+		for (first, second) in spatial_index.find_pairs(2.0 * small_radius, ForceEngine.BLOCK_SIZE):
+			if has_large:
+				candidate = ~large[first] & ~large[second]
+				(first, second) = (first[candidate], second[candidate])
+			touching = (pos_x[first] - pos_x[second]) ** 2 + (pos_y[first] - pos_y[second]) ** 2 <= (radius[first] + radius[second]) ** 2
+			all_first.append(first[touching])
+			all_second.append(second[touching])
+
+		# large bodies: everything within their radius plus the largest radius, pairs of 2 large bodies only once
+		max_radius = radius.max()
+		for index in np.flatnonzero(large).tolist():
+			near = spatial_index.query_radius(pos_x[index], pos_y[index], radius[index] + max_radius)
+			near = near[~large[near] | (near > index)]
+			touching = (pos_x[near] - pos_x[index]) ** 2 + (pos_y[near] - pos_y[index]) ** 2 <= (radius[near] + radius[index]) ** 2
+			all_second.append(near[touching])
+			all_first.append(np.full(len(all_second[-1]), index))
+
+		if not all_first:
+			return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+		return (np.concatenate(all_first), np.concatenate(all_second))
@@ -1,36 +1,56 @@
 import random
 from types import MethodType
 
+import numpy as np
 import pygame
 from pygame import Rect, draw
 
 from utility import Rectangle
 
 class DynamicBackground:
+	# The stars are stored in arrays (one entry per star), so that they can be transformed to the screen all at once.
+	# Every combination of draw radius and brightness is drawn once into a small sprite, drawing the stars is one batched blit.
+	# Stars that leave the view are moved into the newly visible area with array operations. Panning still checks every star,
+	# but only with 2 comparisons, so its cost grows slowly with the number of stars (about 2 ns per star).
 
-	class Star:
-		def __init__(self, pos_x, pos_y, brightness, draw_radius):
-			self.pos_x = pos_x
-			self.pos_y = pos_y
-			self.brightness = brightness
-			self.draw_radius = draw_radius
+	MIN_STAR_COUNT = 400
+	MAX_STAR_COUNT = 900
 
-	def __init__(self, view_width, view_start_x, view_start_y, screen_ratio, pos_to_screen_pos: MethodType):
+	def __init__(self, view_width, view_start_x, view_start_y, screen_ratio, pos_to_screen_pos: MethodType, seed = None, star_count = None):
+		self.seed = seed if seed is not None else random.randrange(1 << 32) # the seed is kept, so that the stars can be reproduced
+		self.random = np.random.default_rng(self.seed)
 		self.view_width = view_width
 		self.view_start_x = view_start_x
 		self.view_start_y = view_start_y
 		self.screen_ratio = screen_ratio # width / height
-		self.stars = []
+		self.pos_x = np.zeros(0)
+		self.pos_y = np.zeros(0)
+		self.brightness = np.zeros(0, dtype=np.int64)
+		self.draw_radius = np.zeros(0, dtype=np.int64)
+		self.sprites = {} # (draw_radius, brightness) -> surface
 		self.pos_to_screen_pos: MethodType = pos_to_screen_pos
 
-		self.generate()
+		self.generate(star_count)
 
 
 	# functions to generate or update the stars
 
-	def generate(self):
-		for i in range(0, random.randint(400, 900)):
-			self.stars.append(self.generate_star())
+	def generate(self, star_count = None):
+		if star_count is None:
+			star_count = int(self.random.integers(DynamicBackground.MIN_STAR_COUNT, DynamicBackground.MAX_STAR_COUNT + 1))
+
+		self.pos_x = np.zeros(0)
+		self.pos_y = np.zeros(0)
+		self.brightness = np.zeros(0, dtype=np.int64)
+		self.draw_radius = np.zeros(0, dtype=np.int64)
+		self.add_stars(star_count, [self.get_view()])
+
+	def get_star_count(self):
+		return len(self.pos_x)
+
+	def get_out_of_view(self, view_start_x, view_end_x, view_start_y, view_end_y):
+		# indices of the stars outside of the view
+		return np.flatnonzero((self.pos_x < view_start_x) | (self.pos_x > view_end_x) | (self.pos_y < view_start_y) | (self.pos_y > view_end_y))
 
 	def zoom_in(self, new_view_width, new_view_start_x, new_view_start_y):
 		# Expects that the new view width is smaller than the old one
@@ -44,9 +64,7 @@ class DynamicBackground:
 		new_view = Rectangle(new_view_start_x, new_view_end_x, new_view_start_y, new_view_end_y)
 
 		# Move all stars that got out of sight back into sight
-		for star in self.stars:
-			if star.pos_x < new_view_start_x or star.pos_x > new_view_end_x or star.pos_y < new_view_start_y or star.pos_y > new_view_end_y:
-				(star.pos_x, star.pos_y) = DynamicBackground.random_pos_in_rect(new_view)
+		self.move_stars(self.get_out_of_view(new_view_start_x, new_view_end_x, new_view_start_y, new_view_end_y), [new_view])
 
 		# Update
 		self.view_width = new_view_width
@@ -72,34 +90,11 @@ class DynamicBackground:
 		# Calculate number of stars to move
 		new_area = new_view_width * new_view_width / self.screen_ratio
 		old_area = self.view_width * self.view_width / self.screen_ratio
-		keep_stars_count = int((old_area / new_area) * len(self.stars))
-
-		# Calculate probability for each rectangle
-		total_rect_area = new_area - old_area
-		rect_left_prabability = rect_left.get_area() / total_rect_area
-		rect_right_probability = rect_right.get_area() / total_rect_area
-		rect_top_probability = rect_top.get_area() / total_rect_area
-		rect_bottom_probability = rect_bottom.get_area() / total_rect_area
-		rect_probabilities = [rect_left_prabability, rect_right_probability, rect_top_probability, rect_bottom_probability]
-
-		# Create a list of stars that will be moved
-		move_stars_list = random.sample(self.stars, len(self.stars) - keep_stars_count)
-
-		# Move every star in the previously created list
-		for star in move_stars_list:
-			# Select one of the rects and set star to a random position in this rect
-			rect_num = DynamicBackground.random_num_with_probability(rect_probabilities)
-			if rect_num == 0:
-				(star.pos_x, star.pos_y) = DynamicBackground.random_pos_in_rect(rect_left)
-			elif rect_num == 1:
-				(star.pos_x, star.pos_y) = DynamicBackground.random_pos_in_rect(rect_right)
-			elif rect_num == 2:
-				(star.pos_x, star.pos_y) = DynamicBackground.random_pos_in_rect(rect_top)
-			else:
-				(star.pos_x, star.pos_y) = DynamicBackground.random_pos_in_rect(rect_bottom)
-			
-		new_view = Rectangle(new_view_start_x, new_view_end_x, new_view_start_y, new_view_end_y)
-		old_view = Rectangle(self.view_start_x, old_view_end_x, self.view_start_y, old_view_end_y)
+		keep_stars_count = int((old_area / new_area) * self.get_star_count())
+
+		# Move randomly chosen stars into the rectangles, so that the density stays the same
+		move_stars = self.random.choice(self.get_star_count(), self.get_star_count() - keep_stars_count, replace=False)
+		self.move_stars(move_stars, [rect_left, rect_right, rect_top, rect_bottom])
 
 		# Update
 		self.view_width = new_view_width
@@ -107,41 +102,63 @@ class DynamicBackground:
 		self.view_start_y = new_view_start_y
 
 	def change_view_starts(self, new_view_start_x, new_view_start_y):
-		new_view_end_x = DynamicBackground.get_end_x(new_view_start_x, self.view_width)
-		old_view_end_x = DynamicBackground.get_end_x(self.view_start_x, self.view_width)
-		new_view_end_y = self.get_end_y(new_view_start_y, self.view_width)
-		old_view_end_y = self.get_end_y(self.view_start_y, self.view_width)
+		old_view = self.get_view()
+		new_view = Rectangle(new_view_start_x, DynamicBackground.get_end_x(new_view_start_x, self.view_width), new_view_start_y, self.get_end_y(new_view_start_y, self.view_width))
 
-		# Calculate both rectangles where stars have to be moved to
-		if new_view_start_x < self.view_start_x:
-			rect_horizontal = Rectangle(new_view_start_x, self.view_start_x, new_view_start_y, new_view_end_y)
-		else:
-			rect_horizontal = Rectangle(old_view_end_x, new_view_end_x, new_view_start_y, new_view_end_y)
-
-		if new_view_start_y < self.view_start_y:
-			rect_vertical = Rectangle(self.view_start_x, old_view_end_x, new_view_start_y, self.view_start_y)
-		else:
-			rect_vertical = Rectangle(self.view_start_x, old_view_end_x, old_view_end_y, new_view_end_y)
-
-		# Calculate probability for each rectangle
-		total_new_area = rect_horizontal.get_area() + rect_vertical.get_area()
-		rect_horizontal_probability = rect_horizontal.get_area() / total_new_area
-		rect_vertical_probability = rect_vertical.get_area() / total_new_area
-		rect_probabilities = [rect_horizontal_probability, rect_vertical_probability]
-
-		# Move every star that is out of sight to one of the new rectangles
-		for star in self.stars:
-			if star.pos_x < new_view_start_x or star.pos_x > new_view_end_x or star.pos_y < new_view_start_y or star.pos_y > new_view_end_y:
-				rand = DynamicBackground.random_num_with_probability(rect_probabilities)
-				if rand == 0:
-					(star.pos_x, star.pos_y) = DynamicBackground.random_pos_in_rect(rect_horizontal)
-				else:
-					(star.pos_x, star.pos_y) = DynamicBackground.random_pos_in_rect(rect_vertical)
+		# Move every star that is out of sight into the newly visible part of the view, all stars were in the old view,
+		# so they can only have left it on the 2 sides the view moved away from
+		out_of_view_x = self.pos_x < new_view.start_x if new_view.start_x > old_view.start_x else self.pos_x > new_view.end_x
+		out_of_view_y = self.pos_y < new_view.start_y if new_view.start_y > old_view.start_y else self.pos_y > new_view.end_y
+		self.move_stars(np.flatnonzero(out_of_view_x | out_of_view_y), DynamicBackground.get_exposed_rects(old_view, new_view))
 
 		# Update
 		self.view_start_x = new_view_start_x
 		self.view_start_y = new_view_start_y
 
+	def resize(self, new_view_start_x, new_view_start_y, new_screen_ratio):
+		# The width of the view stays the same, only its height (and a bit its position) changes.
+		# Stars that are still visible stay where they are, only the newly visible strips get new stars (with the same density).
+		old_view = self.get_view()
+		old_area = self.view_width * self.view_width / self.screen_ratio
+
+		self.view_start_x = new_view_start_x
+		self.view_start_y = new_view_start_y
+		self.screen_ratio = new_screen_ratio
+		new_view = self.get_view()
+
+		# Stars that aren't visible anymore get reused for the new strips, so that the arrays rarely change their size
+		out_of_view = self.get_out_of_view(new_view.start_x, new_view.end_x, new_view.start_y, new_view.end_y)
+		exposed_rects = DynamicBackground.get_exposed_rects(old_view, new_view)
+		exposed_area = sum(rect.get_area() for rect in exposed_rects)
+		new_star_count = int(self.random.poisson(self.get_star_count() / old_area * exposed_area)) if old_area > 0 else 0
+
+		self.move_stars(out_of_view[:new_star_count], exposed_rects)
+		if new_star_count > len(out_of_view):
+			self.add_stars(new_star_count - len(out_of_view), exposed_rects)
+		else:
+			self.remove_stars(out_of_view[new_star_count:])
+
+	def add_stars(self, count, rects):
+		(pos_x, pos_y) = self.random_pos_in_rects(rects, count)
+		self.pos_x = np.concatenate((self.pos_x, pos_x))
+		self.pos_y = np.concatenate((self.pos_y, pos_y))
+		self.brightness = np.concatenate((self.brightness, self.generate_brightness(count)))
+		self.draw_radius = np.concatenate((self.draw_radius, self.generate_draw_radius(count)))
+
+	def remove_stars(self, indices):
+		if len(indices) == 0:
+			return
+		self.pos_x = np.delete(self.pos_x, indices)
+		self.pos_y = np.delete(self.pos_y, indices)
+		self.brightness = np.delete(self.brightness, indices)
+		self.draw_radius = np.delete(self.draw_radius, indices)
+
+	def move_stars(self, indices, rects):
+		# moves the stars with the indices to random positions in the rectangles
+		if len(indices) == 0:
+			return
+		(self.pos_x[indices], self.pos_y[indices]) = self.random_pos_in_rects(rects, len(indices))
+
 
 	# helpers
 
@@ -151,73 +168,104 @@ class DynamicBackground:
 	def get_end_y(self, view_start_y, view_width):
 		return view_start_y + view_width / self.screen_ratio
 
-	def generate_star_pos(self):
-		pos_x = random.randint(int(self.view_start_x), int(self.view_start_x + self.view_width))
-		pos_y = random.randint(int(self.view_start_y), int(self.view_start_y + self.view_width / self.screen_ratio))
-		return (pos_x, pos_y)
-
-	def generate_brightness():
-		return random.randint(100, 255)
-
-	def generate_draw_radius():
-		random_num = random.randint(0, 29)
-		if random_num == 29:
-			return 3 # p = 1/30
-		elif random_num < 6:
-			return 2 # p = 1/5 
-		else:
-			return 1
-
-	def generate_star_pos_x(self, start_x_diff, new_view_start_x, end_x_diff, new_view_end_x, old_view_end_x):
-		if start_x_diff > 0 and end_x_diff > 0:
-			if random.randint(0, 1) == 0:
-				pos_x = random.randint(new_view_start_x, self.view_start_x) # generate new position on the left side
-			else:
-				pos_x = random.randint(old_view_end_x, new_view_end_x) # generate new position on the right side
-		elif end_x_diff <= 0:
-			pos_x = random.randint(new_view_start_x, self.view_start_x) # generate new position on the left side
-		else:
-			pos_x = random.randint(old_view_end_x, new_view_end_x) # generate new position on the right side
-
-		return pos_x
-
-	def generate_star_pos_y(self, start_y_diff, new_view_start_y, end_y_diff, new_view_end_y, old_view_end_y):
-		if start_y_diff > 0 and end_y_diff > 0:
-			if random.randint(0, 1) == 0:
-				pos_y = random.randint(new_view_start_y, self.view_start_y) # generate new position on top
-			else:
-				pos_y = random.randint(old_view_end_y, new_view_end_y) # generate new position on bottom
-		elif end_y_diff <= 0:
-			pos_y = random.randint(new_view_start_y, self.view_start_y) # generate new position on top
-		else:
-			pos_y = random.randint(old_view_end_y, new_view_end_y) # generate new position on bottom
-
-		return pos_y
-
-	def generate_star(self) -> Star:
-		(pos_x, pos_y) = self.generate_star_pos()
-		brightness = DynamicBackground.generate_brightness()
-		draw_radius = DynamicBackground.generate_draw_radius()
-
-		return DynamicBackground.Star(pos_x, pos_y, brightness, draw_radius)
+	def get_view(self):
+		return Rectangle(self.view_start_x, DynamicBackground.get_end_x(self.view_start_x, self.view_width), self.view_start_y, self.get_end_y(self.view_start_y, self.view_width))
+
+	def get_exposed_rects(old_view: Rectangle, new_view: Rectangle):
+		# up to 4 rectangles that cover the part of the new view that isn't part of the old view
+		start_x = max(old_view.start_x, new_view.start_x)
+		end_x = min(old_view.end_x, new_view.end_x)
+		start_y = max(old_view.start_y, new_view.start_y)
+		end_y = min(old_view.end_y, new_view.end_y)
+		if start_x >= end_x or start_y >= end_y:
+			return [new_view] # the views don't overlap
+
+		return [
+			Rectangle(new_view.start_x, start_x, new_view.start_y, new_view.end_y), # left
+			Rectangle(end_x, new_view.end_x, new_view.start_y, new_view.end_y), # right
+			Rectangle(start_x, end_x, new_view.start_y, start_y), # top
+			Rectangle(start_x, end_x, end_y, new_view.end_y), # bottom
+		]
+
+	def generate_brightness(self, count):
+		return self.random.integers(100, 256, count)
+
+	def generate_draw_radius(self, count):
+		random_num = self.random.integers(0, 30, count)
+		draw_radius = np.ones(count, dtype=np.int64)
+		draw_radius[random_num < 6] = 2 # p = 1/5
+		draw_radius[random_num == 29] = 3 # p = 1/30
+		return draw_radius
+
+	def get_state(self):
+		return {
+			"seed": self.seed,
+			"random_state": self.random.bit_generator.state,
+			"view_width": self.view_width,
+			"view_start_x": self.view_start_x,
+			"view_start_y": self.view_start_y,
+			"screen_ratio": self.screen_ratio,
+			"pos_x": self.pos_x.copy(),
+			"pos_y": self.pos_y.copy(),
+			"brightness": self.brightness.copy(),
+			"draw_radius": self.draw_radius.copy(),
+		}
+
+	def set_state(self, state):
+		self.seed = state["seed"]
+		self.view_width = state["view_width"]
+		self.view_start_x = state["view_start_x"]
+		self.view_start_y = state["view_start_y"]
+		self.screen_ratio = state["screen_ratio"]
+
+		# the state of a TiledBackground doesn't have any stars
+		if "random_state" not in state:
+			self.random = np.random.default_rng(self.seed)
+			self.generate()
+			return
+
+		self.random.bit_generator.state = state["random_state"]
+		self.pos_x = np.array(state["pos_x"], dtype=np.float64)
+		self.pos_y = np.array(state["pos_y"], dtype=np.float64)
+		self.brightness = np.array(state["brightness"], dtype=np.int64)
+		self.draw_radius = np.array(state["draw_radius"], dtype=np.int64)
 
 	def draw(self, screen):
-		for star in self.stars:
-			pygame.draw.circle(screen, (star.brightness, star.brightness, star.brightness), self.pos_to_screen_pos(star.pos_x, star.pos_y), star.draw_radius)
+		# transform all stars at once (pos_to_screen_pos works with arrays, too)
+		(screen_x, screen_y) = self.pos_to_screen_pos(self.pos_x, self.pos_y)
+		radius = self.draw_radius
+
+		# only stars that touch the screen get drawn
+		(screen_width, screen_height) = screen.get_size()
+		visible = np.flatnonzero((screen_x + radius >= 0) & (screen_x - radius < screen_width) & (screen_y + radius >= 0) & (screen_y - radius < screen_height))
+
+		# top left corners of the sprites
+		left = (screen_x[visible] - radius[visible]).astype(np.int64).tolist()
+		top = (screen_y[visible] - radius[visible]).astype(np.int64).tolist()
+		sprites = [self.get_sprite(r, b) for (r, b) in zip(radius[visible].tolist(), self.brightness[visible].tolist())]
+		screen.blits(list(zip(sprites, zip(left, top))), doreturn=False)
+
+	def get_sprite(self, draw_radius, brightness):
+		# sprites are only created when they are needed the first time
+		key = (draw_radius, brightness)
+		sprite = self.sprites.get(key)
+		if sprite is None:
+			sprite = pygame.Surface((2 * draw_radius + 1, 2 * draw_radius + 1))
+			sprite.set_colorkey((0, 0, 0), pygame.RLEACCEL) # the corners are transparent
+			pygame.draw.circle(sprite, (brightness, brightness, brightness), (draw_radius, draw_radius), draw_radius)
+			self.sprites[key] = sprite
+		return sprite
 
 
 	# random generator functions
-	
-	def random_num_with_probability(probability_list):
-		rand = random.randint(0, 999_999)
-		for i in range(0, len(probability_list)):
-			absolute_probability = probability_list[i] * 999_999
-			if rand < absolute_probability:
-				return i
-			else:
-				rand -= absolute_probability
-	
-	def random_pos_in_rect(rect: Rectangle):
-		x = random.randint(rect.start_x, rect.end_x)
-		y = random.randint(rect.start_y, rect.end_y)
-		return (x, y)
\ No newline at end of file
+
+	def random_pos_in_rects(self, rects, count):
+		# count uniformly distributed positions in the rectangles, a rectangle is chosen with a probability proportional to its area
+		bounds = np.array([(rect.start_x, rect.end_x, rect.start_y, rect.end_y) for rect in rects], dtype=np.float64)
+		if len(rects) > 1:
+			cumulative_areas = np.cumsum((bounds[:, 1] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 2]))
+			rect_nums = np.searchsorted(cumulative_areas, cumulative_areas[-1] * self.random.random(count), side="right")
+			bounds = bounds[np.minimum(rect_nums, len(rects) - 1)]
+
+		(start_x, end_x, start_y, end_y) = bounds.T
+		return (start_x + (end_x - start_x) * self.random.random(count), start_y + (end_y - start_y) * self.random.random(count))
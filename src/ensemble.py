@@ -0,0 +1,200 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from force_engine import ForceEngine
+from headless import MS_PER_DAY, relative_drift
+import simulation as simulation_module
+
+# Runs many variants (members) of a scenario without a window on a pool of processes.
+# The spec is a JSON file like
+#	{
+#		"simulation": {"integrator": "yoshida", "step_size": 3600, "collisions": true},
+#		"days": 3650,
+#		"swap_suns": true,
+#		"grid": {"sun1.mass": [1e30, 1.5e30], "sun2.mass": [1e30, 1.5e30]},
+#		"perturb": {"earth.velocity_y": 100},
+#		"members": 10,
+#		"seed": 0
+#	}
+# "simulation" holds the options of main.py / headless.py (without dashes), "grid" values for every combination
+# and "perturb" the standard deviation of normally distributed changes (members variants of every combination),
+# a parameter can be in both (the grid value gets perturbed).
+# Parameters are "<body name>.<field>", the body may also be inactive (like sun1 and sun2 at the start).
+# The first line of the results file is the spec, then there is one line of JSON per finished member (in the order they finish).
+# A restarted ensemble skips the members that are in the results file already, every member gets its own random numbers,
+# so the results are the same as without the restart.
+
+PARAMETER_FIELDS = ("mass", "pos_x", "pos_y", "velocity_x", "velocity_y")
+ESCAPE_DISTANCE_FACTOR = 2.0 # bodies further away from the center of mass than this times the initial size of the system can escape
+
+def create_members(spec):
+	# parameters of every member as (index, grid values)
+	grid = spec.get("grid", {})
+	keys = list(grid.keys())
+	members = []
+	for values in itertools.product(*(grid[key] for key in keys)):
+		for i in range(spec.get("members", 1)):
+			members.append((len(members), dict(zip(keys, values))))
+	return members
+
+def create_simulation(spec, index, grid_values):
+	# the simulation of a member and the parameters it got
+	parser = argparse.ArgumentParser()
+	simulation_module.add_arguments(parser)
+	args = parser.parse_args([])
+	for (option, value) in spec.get("simulation", {}).items():
+		if not hasattr(args, option):
+			raise ValueError(f"unknown simulation option '{option}'")
+		setattr(args, option, value)
+	args.workers = 1 # the members already run in parallel
+	simulation = simulation_module.create_simulation(args)
+
+	# the perturbations change the values of the grid (or of the scenario if the grid doesn't have the parameter)
+	parameters = dict(grid_values)
+	for (key, value) in grid_values.items():
+		set_parameter(simulation, key, value)
+	rng = np.random.default_rng([spec.get("seed", 0), index])
+	for (key, sigma) in spec.get("perturb", {}).items():
+		parameters[key] = get_parameter(simulation, key) + sigma * rng.normal()
+		set_parameter(simulation, key, parameters[key])
+	if spec.get("swap_suns", False):
+		simulation.swap_suns()
+	return (simulation, parameters)
+
+def get_parameter(simulation, key):
+	(body, field) = find_parameter(simulation, key)
+	return float(getattr(body, field))
+
+def set_parameter(simulation, key, value):
+	(body, field) = find_parameter(simulation, key)
+	setattr(body, field, value)
+
+def find_parameter(simulation, key):
+	(name, _, field) = key.rpartition(".")
+	body = simulation.find_body(name)
+	if body is None:
+		raise ValueError(f"unknown body '{name}' in parameter '{key}'")
+	if field not in PARAMETER_FIELDS:
+		raise ValueError(f"unknown field '{field}' in parameter '{key}' (available: {', '.join(PARAMETER_FIELDS)})")
+	return (body, field)
+
+def run_member(spec, index, grid_values):
+	# runs one member and returns its summary (in a worker process)
+	start_time = time.perf_counter()
+	(simulation, parameters) = create_simulation(spec, index, grid_values)
+	bodies = simulation.bodies
+	start_names = set(name for name in bodies.names if name is not None)
+	start_energy = simulation.calc_energy()
+	start_angular_momentum = simulation.calc_angular_momentum()
+	start_size = get_size(simulation)
+
+	step_count = max(1, round(spec.get("days", 365) * MS_PER_DAY / simulation.step_size))
+	simulation.step(step_count)
+
+	bodies = simulation.bodies
+	return {
+		"member": index,
+		"parameters": parameters,
+		"steps": step_count,
+		"seconds": time.perf_counter() - start_time,
+		"energy_drift": float(relative_drift(start_energy, simulation.calc_energy())),
+		"angular_momentum_drift": float(relative_drift(start_angular_momentum, simulation.calc_angular_momentum())),
+		"body_count": len(bodies),
+		"merged": simulation.collisions.merge_count if simulation.collisions is not None else 0,
+		"merged_names": sorted(start_names - set(bodies.names)), # named bodies that were merged into others
+		"escaped": find_escapes(simulation, start_size),
+		"final": {name: [float(bodies.pos_x[i]), float(bodies.pos_y[i]), float(bodies.velocity_x[i]), float(bodies.velocity_y[i])] for (i, name) in enumerate(bodies.names) if name is not None},
+	}
+
+def get_center(simulation):
+	bodies = simulation.bodies
+	total_mass = bodies.mass.sum()
+	return [np.sum(bodies.mass * values) / total_mass for values in (bodies.pos_x, bodies.pos_y, bodies.velocity_x, bodies.velocity_y)]
+
+def get_size(simulation):
+	# largest distance of a body from the center of mass in km
+	(center_x, center_y, _, _) = get_center(simulation)
+	return float(np.sqrt(np.max((simulation.bodies.pos_x - center_x) ** 2 + (simulation.bodies.pos_y - center_y) ** 2)))
+
+def find_escapes(simulation, start_size):
+	# named bodies that are far away and faster than the escape velocity of the whole system (seen from the center of mass)
+	bodies = simulation.bodies
+	(center_x, center_y, center_velocity_x, center_velocity_y) = get_center(simulation)
+	distance = np.sqrt((bodies.pos_x - center_x) ** 2 + (bodies.pos_y - center_y) ** 2)
+	speed_squared = ((bodies.velocity_x - center_velocity_x) / 1000) ** 2 + ((bodies.velocity_y - center_velocity_y) / 1000) ** 2 # in km^2 / s^2
+	energy = 0.5 * speed_squared - ForceEngine.GRAVITATIONAL_CONSTANT * bodies.mass.sum() / np.maximum(distance, 1.0)
+	escaped = (distance > ESCAPE_DISTANCE_FACTOR * start_size) & (energy > 0)
+	return sorted(bodies.names[i] for i in np.flatnonzero(escaped).tolist() if bodies.names[i] is not None)
+
+def run_member_task(task):
+	return run_member(*task)
+
+def read_results(path, spec):
+	# the finished members of an earlier run, a line that was cut off by a crash gets dropped
+	if not os.path.exists(path):
+		return []
+
+	lines = []
+	with open(path, "r") as file:
+		for line in file:
+			try:
+				lines.append(json.loads(line))
+			except json.JSONDecodeError:
+				break
+	if not lines:
+		return []
+	if lines[0].get("spec") != spec:
+		raise ValueError(f"'{path}' belongs to an ensemble with another spec")
+	return lines[1:]
+
+def write_results(path, spec, results):
+	# writes the spec and the results again (without a cut off line)
+	temporary_path = path + ".tmp"
+	with open(temporary_path, "w") as file:
+		file.write(json.dumps({"spec": spec}) + "\n")
+		for result in results:
+			file.write(json.dumps(result) + "\n")
+	os.replace(temporary_path, path)
+
+def main():
+	parser = argparse.ArgumentParser(description="Run many variants of a scenario on a pool of processes")
+	parser.add_argument("spec", help="JSON file with the simulation options, the parameter grid and the perturbations")
+	parser.add_argument("results", help="file the summary of every member gets written to (one JSON object per line), a restarted ensemble continues it")
+	parser.add_argument("--workers", type=int, default=0, help="number of processes (default: 0 = one per CPU)")
+	args = parser.parse_args()
+
+	with open(args.spec, "r") as file:
+		spec = json.load(file)
+	members = create_members(spec)
+	if not members:
+		parser.error("the spec has no members")
+	create_simulation(spec, *members[0]) # checks the spec before anything is started
+
+	results = read_results(args.results, spec)
+	write_results(args.results, spec, results)
+	finished = set(result["member"] for result in results)
+	tasks = [(spec, index, grid_values) for (index, grid_values) in members if index not in finished]
+	print(f"{len(members)} members, {len(finished)} finished already")
+
+	workers = args.workers if args.workers > 0 else os.cpu_count()
+	with open(args.results, "a") as file, multiprocessing.Pool(workers) as pool:
+		for result in pool.imap_unordered(run_member_task, tasks):
+			file.write(json.dumps(result) + "\n")
+			file.flush()
+			finished.add(result["member"])
+
+			events = []
+			if result["merged_names"]:
+				events.append(f"merged: {', '.join(result['merged_names'])}")
+			if result["escaped"]:
+				events.append(f"escaped: {', '.join(result['escaped'])}")
+			print(f"{len(finished)} / {len(members)}: member {result['member']}, energy drift {result['energy_drift']:.2e}" + (f", {'; '.join(events)}" if events else ""))
+
+if __name__ == "__main__":
+	main()
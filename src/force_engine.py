@@ -0,0 +1,430 @@
+import multiprocessing
+import os
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+class ForceEngine:
+	GRAVITATIONAL_CONSTANT = 6.67384e-20 # for calculating force in kg * km / s^2
+	BLOCK_SIZE = 1 << 22 # maximum number of pairs handled at once (bounds temporary memory)
+
+	# Positions in km, masses in kg, accelerations in km / s^2, forces in kg * km / s^2.
+	# All arrays are contiguous float64 arrays with one entry per body.
+	# If targets (an array of body indices) is given, only the accelerations of these bodies are calculated.
+	# With Plummer softening the distance d is replaced by sqrt(d^2 + softening^2), so that close encounters don't give huge forces.
+
+	softening = 0.0 # in km
+
+	def calc_accelerations(self, pos_x, pos_y, mass, targets = None):
+		raise NotImplementedError
+
+	def get_options(self):
+		# arguments for the constructor
+		return {}
+
+	def calc_forces(self, pos_x, pos_y, mass, targets = None):
+		(acc_x, acc_y) = self.calc_accelerations(pos_x, pos_y, mass, targets)
+		target_mass = mass if targets is None else mass[targets]
+		return (acc_x * target_mass, acc_y * target_mass)
+
+	def calc_strongest_pair_forces(self, pos_x, pos_y, mass, targets, count):
+		# the count strongest single forces that other bodies exert on each target body, exact for every engine
+		# force_x[i, k] is the x-component of the k-th of them on body targets[i] (in no particular order)
+		body_count = len(mass)
+		count = min(count, body_count - 1)
+		force_x = np.zeros((len(targets), max(count, 0)))
+		force_y = np.zeros((len(targets), max(count, 0)))
+		if count <= 0:
+			return (force_x, force_y)
+
+		block_rows = max(1, ForceEngine.BLOCK_SIZE // body_count)
+		for start in range(0, len(targets), block_rows):
+			end = min(start + block_rows, len(targets))
+			block_targets = targets[start:end]
+			rows = np.arange(end - start)[:, np.newaxis]
+
+			vec_x = pos_x[np.newaxis, :] - pos_x[block_targets, np.newaxis]
+			vec_y = pos_y[np.newaxis, :] - pos_y[block_targets, np.newaxis]
+			distance_squared = vec_x * vec_x + vec_y * vec_y + self.softening * self.softening
+			distance_squared[rows[:, 0], block_targets] = np.inf # no force between a body and itself
+
+			# the strength m_i * m_j / d^2 only depends on m_j / d^2 within a row
+			strongest = np.argpartition(mass / distance_squared, body_count - count, axis=1)[:, body_count - count:]
+			distance_squared = distance_squared[rows, strongest]
+			scale_factor = ForceEngine.GRAVITATIONAL_CONSTANT * mass[block_targets, np.newaxis] * mass[strongest] / (distance_squared * np.sqrt(distance_squared))
+			force_x[start:end] = vec_x[rows, strongest] * scale_factor
+			force_y[start:end] = vec_y[rows, strongest] * scale_factor
+
+		return (force_x, force_y)
+
+	def calc_potential_energy(self, pos_x, pos_y, mass):
+		# -G * m_i * m_j / d (with softening) summed over all pairs in kg * km^2 / s^2, exact for every engine
+		count = len(mass)
+		potential_energy = 0.0
+
+		block_rows = max(1, ForceEngine.BLOCK_SIZE // max(1, count))
+		for start in range(0, count, block_rows):
+			end = min(start + block_rows, count)
+
+			# only pairs (i, j) with i < j
+			vec_x = pos_x[np.newaxis, start + 1:] - pos_x[start:end, np.newaxis]
+			vec_y = pos_y[np.newaxis, start + 1:] - pos_y[start:end, np.newaxis]
+			upper = np.arange(start + 1, count)[np.newaxis, :] > np.arange(start, end)[:, np.newaxis]
+
+			distance = np.sqrt(vec_x * vec_x + vec_y * vec_y + self.softening * self.softening)
+			potential_energy -= np.sum(np.where(upper, mass[start:end, np.newaxis] * mass[np.newaxis, start + 1:] / np.where(upper, distance, 1.0), 0.0))
+
+		return ForceEngine.GRAVITATIONAL_CONSTANT * potential_energy
+
+
+class DirectForceEngine(ForceEngine):
+	# Sums up the forces between all pairs of bodies, O(N^2)
+
+	def __init__(self, softening = 0.0):
+		self.softening = softening
+
+	def get_options(self):
+		return {"softening": self.softening}
+
+	def calc_accelerations(self, pos_x, pos_y, mass, targets = None):
+		count = len(mass)
+		if targets is None:
+			targets = np.arange(count)
+		acc_x = np.zeros(len(targets))
+		acc_y = np.zeros(len(targets))
+
+		# handle the target bodies in blocks of rows, so that the temporary matrices stay small
+		block_rows = max(1, ForceEngine.BLOCK_SIZE // max(1, count))
+		for start in range(0, len(targets), block_rows):
+			end = min(start + block_rows, len(targets))
+			block_targets = targets[start:end]
+
+			# vectors from the target bodies to all other bodies
+			vec_x = pos_x[np.newaxis, :] - pos_x[block_targets, np.newaxis]
+			vec_y = pos_y[np.newaxis, :] - pos_y[block_targets, np.newaxis]
+
+			distance_squared = vec_x * vec_x + vec_y * vec_y + self.softening * self.softening
+			distance_squared[np.arange(end - start), block_targets] = np.inf # no force between a body and itself
+
+			# G * m_j / d^2 in the direction of the unit vector => G * m_j * vec / d^3
+			scale_factor = mass / (distance_squared * np.sqrt(distance_squared))
+			acc_x[start:end] = (vec_x * scale_factor).sum(axis=1)
+			acc_y[start:end] = (vec_y * scale_factor).sum(axis=1)
+
+		acc_x *= ForceEngine.GRAVITATIONAL_CONSTANT
+		acc_y *= ForceEngine.GRAVITATIONAL_CONSTANT
+		return (acc_x, acc_y)
+
+
+class QuadTree:
+	# A quadtree over the bodies, built level by level with array operations.
+	# The bodies are sorted along a Morton (z-order) curve, so every node covers a contiguous range
+	# [start, end) of the sorted bodies and the children of a node are stored next to each other.
+
+	MAX_DEPTH = 21 # cells per axis on the deepest level = 2^MAX_DEPTH
+
+	def __init__(self, pos_x, pos_y, mass):
+		count = len(mass)
+
+		# square root cell around all bodies
+		min_x = pos_x.min()
+		min_y = pos_y.min()
+		self.root_size = max(pos_x.max() - min_x, pos_y.max() - min_y, 1.0) * (1.0 + 1e-9)
+
+		# sort the bodies along the z-order curve
+		resolution = 1 << QuadTree.MAX_DEPTH
+		cell_x = np.minimum(((pos_x - min_x) * (resolution / self.root_size)).astype(np.uint64), resolution - 1)
+		cell_y = np.minimum(((pos_y - min_y) * (resolution / self.root_size)).astype(np.uint64), resolution - 1)
+		keys = QuadTree.spread_bits(cell_x) | (QuadTree.spread_bits(cell_y) << np.uint64(1))
+
+		self.order = np.argsort(keys, kind="stable")
+		self.rank = np.empty(count, dtype=np.int64) # position of every body in the sorted order
+		self.rank[self.order] = np.arange(count)
+		keys = keys[self.order]
+
+		# append a 0, so that np.add.reduceat also accepts end indices
+		sorted_mass = np.append(mass[self.order], 0.0)
+		sorted_moment_x = np.append(mass[self.order] * pos_x[self.order], 0.0)
+		sorted_moment_y = np.append(mass[self.order] * pos_y[self.order], 0.0)
+
+		# every level is stored as arrays, they get concatenated at the end
+		starts = [np.array([0])]
+		ends = [np.array([count])]
+		levels = [np.array([0])]
+		first_children = []
+		child_counts = []
+		node_count = 1
+
+		level_starts = starts[0]
+		level_ends = ends[0]
+		for level in range(1, QuadTree.MAX_DEPTH + 1):
+			# only nodes with more than one body get split
+			split = (level_ends - level_starts) > 1
+			child_count = np.zeros(len(level_starts), dtype=np.int64)
+			if not split.any():
+				first_children.append(np.zeros(len(level_starts), dtype=np.int64))
+				child_counts.append(child_count)
+				break
+
+			# indices of all bodies inside the split nodes
+			split_starts = level_starts[split]
+			lengths = level_ends[split] - split_starts
+			body_ranges = QuadTree.concat_ranges(split_starts, lengths)
+
+			# a new child starts wherever the cell on this level changes
+			cells = keys[body_ranges] >> np.uint64(2 * (QuadTree.MAX_DEPTH - level))
+			boundaries = np.flatnonzero(np.concatenate(([True], cells[1:] != cells[:-1])))
+			child_starts = body_ranges[boundaries]
+			child_ends = body_ranges[np.append(boundaries[1:], len(body_ranges)) - 1] + 1
+
+			# link the parents to their children
+			parents = np.searchsorted(split_starts, child_starts, side="right") - 1
+			child_count[split] = np.bincount(parents, minlength=len(split_starts))
+			first_children.append(node_count + np.cumsum(child_count) - child_count)
+			child_counts.append(child_count)
+
+			starts.append(child_starts)
+			ends.append(child_ends)
+			levels.append(np.full(len(child_starts), level))
+			node_count += len(child_starts)
+			level_starts = child_starts
+			level_ends = child_ends
+		else:
+			first_children.append(np.zeros(len(level_starts), dtype=np.int64))
+			child_counts.append(np.zeros(len(level_starts), dtype=np.int64))
+
+		self.start = np.concatenate(starts)
+		self.end = np.concatenate(ends)
+		self.first_child = np.concatenate(first_children)
+		self.child_count = np.concatenate(child_counts)
+		self.size = self.root_size / (2.0 ** np.concatenate(levels))
+		self.is_leaf = self.child_count == 0
+
+		# total mass and center of mass of every node
+		bounds = np.column_stack((self.start, self.end)).ravel()
+		self.mass = np.add.reduceat(sorted_mass, bounds)[::2]
+		self.com_x = np.add.reduceat(sorted_moment_x, bounds)[::2] / self.mass
+		self.com_y = np.add.reduceat(sorted_moment_y, bounds)[::2] / self.mass
+
+	def spread_bits(values):
+		# inserts a 0 bit between every bit of the (up to 32 bit) values
+		values = values & np.uint64(0x00000000FFFFFFFF)
+		values = (values | (values << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+		values = (values | (values << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+		values = (values | (values << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+		values = (values | (values << np.uint64(2))) & np.uint64(0x3333333333333333)
+		values = (values | (values << np.uint64(1))) & np.uint64(0x5555555555555555)
+		return values
+
+	def concat_ranges(starts, lengths):
+		# concatenation of the ranges [start, start + length) without a Python loop
+		offsets = np.cumsum(lengths) - lengths
+		return np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+
+
+class BarnesHutForceEngine(ForceEngine):
+	# Approximates groups of distant bodies by their center of mass, O(N log N).
+	# A node gets opened if size / distance > theta, so theta = 0 opens every node. That is close to the direct sum
+	# but slower than DirectForceEngine, and not exact: bodies in the same cell of the deepest level still see each other through
+	# the center of mass of the rest of the cell.
+
+	TARGETS_PER_BLOCK = 1 << 14
+	PAIRS_PER_BLOCK = 1 << 19 # (body, node) pairs handled at once, more pairs wait on a stack (bounds temporary memory)
+
+	def __init__(self, theta = 0.5, softening = 0.0):
+		self.theta = theta
+		self.softening = softening
+
+	def get_options(self):
+		return {"theta": self.theta, "softening": self.softening}
+
+	def calc_accelerations(self, pos_x, pos_y, mass, targets = None):
+		count = len(mass)
+		if targets is None:
+			targets = np.arange(count)
+		acc_x = np.zeros(len(targets))
+		acc_y = np.zeros(len(targets))
+		if count < 2:
+			return (acc_x, acc_y)
+
+		tree = QuadTree(pos_x, pos_y, mass)
+		for start in range(0, len(targets), BarnesHutForceEngine.TARGETS_PER_BLOCK):
+			end = min(start + BarnesHutForceEngine.TARGETS_PER_BLOCK, len(targets))
+			(acc_x[start:end], acc_y[start:end]) = self.walk_tree(tree, targets[start:end], pos_x, pos_y, mass)
+
+		return (acc_x, acc_y)
+
+	def walk_tree(self, tree: QuadTree, targets, pos_x, pos_y, mass):
+		# all target bodies walk down the tree at the same time as a list of (body, node) pairs
+		# the pairs are handled in blocks of at most PAIRS_PER_BLOCK, the children of a block are handled before the rest
+		# (depth first), so the waiting pairs stay bounded by a few blocks per level of the tree
+		acc_x = np.zeros(len(targets))
+		acc_y = np.zeros(len(targets))
+		theta_squared = self.theta * self.theta
+
+		pair_targets = np.arange(len(targets)) # index into targets
+		pair_nodes = np.zeros(len(targets), dtype=np.int64) # start at the root
+		waiting = [(pair_targets, pair_nodes)]
+
+		while waiting:
+			(pair_targets, pair_nodes) = waiting.pop()
+			if len(pair_nodes) > BarnesHutForceEngine.PAIRS_PER_BLOCK:
+				waiting.append((pair_targets[BarnesHutForceEngine.PAIRS_PER_BLOCK:], pair_nodes[BarnesHutForceEngine.PAIRS_PER_BLOCK:]))
+				(pair_targets, pair_nodes) = (pair_targets[:BarnesHutForceEngine.PAIRS_PER_BLOCK], pair_nodes[:BarnesHutForceEngine.PAIRS_PER_BLOCK])
+			bodies = targets[pair_targets]
+			vec_x = tree.com_x[pair_nodes] - pos_x[bodies]
+			vec_y = tree.com_y[pair_nodes] - pos_y[bodies]
+			distance_squared = vec_x * vec_x + vec_y * vec_y
+			node_size = tree.size[pair_nodes]
+
+			# nodes that contain the body itself always get opened, leaves can't be opened
+			rank = tree.rank[bodies]
+			inside = (tree.start[pair_nodes] <= rank) & (rank < tree.end[pair_nodes])
+			opened = ~tree.is_leaf[pair_nodes] & (inside | (node_size * node_size > theta_squared * distance_squared))
+
+			# use accepted nodes as point masses
+			accepted = ~opened
+			node_mass = tree.mass[pair_nodes[accepted]]
+			vec_x = vec_x[accepted]
+			vec_y = vec_y[accepted]
+			distance_squared = distance_squared[accepted]
+
+			# remove the body itself from a leaf that contains it
+			self_leaf = inside[accepted]
+			if self_leaf.any():
+				own_mass = mass[bodies[accepted][self_leaf]]
+				rest_mass = node_mass[self_leaf] - own_mass
+				rest_mass_safe = np.where(rest_mass > 0, rest_mass, 1.0)
+				vec_x[self_leaf] = np.where(rest_mass > 0, node_mass[self_leaf] * vec_x[self_leaf] / rest_mass_safe, 0.0)
+				vec_y[self_leaf] = np.where(rest_mass > 0, node_mass[self_leaf] * vec_y[self_leaf] / rest_mass_safe, 0.0)
+				distance_squared[self_leaf] = np.where(rest_mass > 0, vec_x[self_leaf] ** 2 + vec_y[self_leaf] ** 2, np.inf)
+				node_mass[self_leaf] = rest_mass
+
+			distance_squared += self.softening * self.softening
+			scale_factor = node_mass / (distance_squared * np.sqrt(distance_squared))
+			acc_x += np.bincount(pair_targets[accepted], vec_x * scale_factor, len(targets))
+			acc_y += np.bincount(pair_targets[accepted], vec_y * scale_factor, len(targets))
+
+			# replace every opened node by its children
+			opened_nodes = pair_nodes[opened]
+			if len(opened_nodes) > 0:
+				child_count = tree.child_count[opened_nodes]
+				waiting.append((np.repeat(pair_targets[opened], child_count), QuadTree.concat_ranges(tree.first_child[opened_nodes], child_count)))
+
+		acc_x *= ForceEngine.GRAVITATIONAL_CONSTANT
+		acc_y *= ForceEngine.GRAVITATIONAL_CONSTANT
+		return (acc_x, acc_y)
+
+
+class ParallelForceEngine(ForceEngine):
+	# Splits the target bodies into one chunk per worker process, every worker uses another force engine for its chunk.
+	# Positions, masses and results are exchanged through shared memory, so per call only the chunk bounds get pickled.
+	# The processes are started when they are needed the first time and stopped when the engine gets garbage collected.
+
+	MIN_PARALLEL_TARGETS = 1024 # fewer targets are calculated in this process (starting the work would take longer)
+	SHARED_FIELDS = ("pos_x", "pos_y", "mass", "targets", "acc_x", "acc_y") # 8 bytes per entry each
+
+	def __init__(self, workers = 0, engine = "direct", engine_options = None):
+		self.workers = workers if workers > 0 else os.cpu_count() # 0 = one worker per CPU
+		self.engine_name = engine
+		self.engine_options = engine_options if engine_options is not None else {}
+		self.engine = create_force_engine(engine, **self.engine_options) # used for small calculations
+		self.softening = self.engine.softening
+
+		self.capacity = 0 # bodies that fit into the shared memory
+		self.resources = {"pool": None, "memory": None}
+		weakref.finalize(self, ParallelForceEngine.release, self.resources)
+
+	def get_options(self):
+		return {"workers": self.workers, "engine": self.engine_name, "engine_options": self.engine_options}
+
+	def calc_accelerations(self, pos_x, pos_y, mass, targets = None):
+		count = len(mass)
+		if targets is None:
+			targets = np.arange(count)
+		if self.workers <= 1 or len(targets) < ParallelForceEngine.MIN_PARALLEL_TARGETS:
+			return self.engine.calc_accelerations(pos_x, pos_y, mass, targets)
+
+		self.reserve(count)
+		shared = ParallelForceEngine.get_shared_arrays(self.resources["memory"], self.capacity)
+		shared["pos_x"][:count] = pos_x
+		shared["pos_y"][:count] = pos_y
+		shared["mass"][:count] = mass
+		shared["targets"][:len(targets)] = targets
+
+		bounds = np.linspace(0, len(targets), self.workers + 1).astype(np.int64).tolist()
+		tasks = [
+			(self.resources["memory"].name, self.capacity, count, start, end, self.engine_name, self.engine_options)
+			for (start, end) in zip(bounds[:-1], bounds[1:]) if start < end
+		]
+		self.resources["pool"].starmap(calc_parallel_chunk, tasks)
+
+		return (shared["acc_x"][:len(targets)].copy(), shared["acc_y"][:len(targets)].copy())
+
+	def reserve(self, count):
+		# (re)allocates the shared memory when more bodies are simulated and starts the processes
+		if count > self.capacity:
+			if self.resources["memory"] is not None:
+				self.resources["memory"].close()
+				self.resources["memory"].unlink()
+			self.capacity = max(count, 2 * self.capacity)
+			self.resources["memory"] = shared_memory.SharedMemory(create=True, size=8 * len(ParallelForceEngine.SHARED_FIELDS) * self.capacity)
+
+		# the processes are started after the shared memory exists, so that they share the resource tracker of this process
+		# (otherwise every process would remove the shared memory when it ends)
+		if self.resources["pool"] is None:
+			self.resources["pool"] = multiprocessing.Pool(self.workers)
+
+	def get_shared_arrays(memory, capacity):
+		arrays = {}
+		for (i, field) in enumerate(ParallelForceEngine.SHARED_FIELDS):
+			dtype = np.int64 if field == "targets" else np.float64
+			arrays[field] = np.ndarray(capacity, dtype=dtype, buffer=memory.buf, offset=8 * i * capacity)
+		return arrays
+
+	def release(resources):
+		if resources["pool"] is not None:
+			resources["pool"].terminate()
+			resources["pool"] = None
+		if resources["memory"] is not None:
+			resources["memory"].close()
+			resources["memory"].unlink()
+			resources["memory"] = None
+
+
+# state of a worker process of ParallelForceEngine
+WORKER_STATE = {"memory": None, "arrays": None, "engines": {}}
+
+def calc_parallel_chunk(memory_name, capacity, count, start, end, engine_name, engine_options):
+	# attach to the shared memory only when it changed
+	if WORKER_STATE["memory"] is None or WORKER_STATE["memory"].name != memory_name:
+		if WORKER_STATE["memory"] is not None:
+			WORKER_STATE["memory"].close()
+		memory = shared_memory.SharedMemory(name=memory_name) # the main process unlinks it
+		WORKER_STATE["memory"] = memory
+		WORKER_STATE["arrays"] = ParallelForceEngine.get_shared_arrays(memory, capacity)
+	arrays = WORKER_STATE["arrays"]
+
+	key = (engine_name, tuple(sorted(engine_options.items())))
+	if key not in WORKER_STATE["engines"]:
+		WORKER_STATE["engines"][key] = create_force_engine(engine_name, **engine_options)
+
+	(arrays["acc_x"][start:end], arrays["acc_y"][start:end]) = WORKER_STATE["engines"][key].calc_accelerations(
+		arrays["pos_x"][:count], arrays["pos_y"][:count], arrays["mass"][:count], arrays["targets"][start:end]
+	)
+
+
+FORCE_ENGINES = {
+	"direct": DirectForceEngine,
+	"barnes-hut": BarnesHutForceEngine,
+	"parallel": ParallelForceEngine,
+}
+
+def create_force_engine(name, **kwargs) -> ForceEngine:
+	if name not in FORCE_ENGINES:
+		raise ValueError(f"unknown force engine '{name}' (available: {', '.join(FORCE_ENGINES)})")
+	return FORCE_ENGINES[name](**kwargs)
+
+def get_force_engine_name(force_engine: ForceEngine):
+	return next(name for (name, engine_class) in FORCE_ENGINES.items() if type(force_engine) is engine_class)
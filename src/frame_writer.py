@@ -0,0 +1,86 @@
+import os
+import queue
+import subprocess
+import threading
+
+import pygame
+
+class FrameWriter:
+	# Writes the frames of an export on its own thread, so that rendering the next frame and encoding the last ones overlap.
+	# The renderer copies every frame into bytes (a surface shouldn't be used by 2 threads) and puts it into a queue,
+	# when the queue is full the renderer waits for the writer.
+	# A path ending in .png is written as a numbered sequence of images (frame.png -> frame_000000.png, frame_000001.png, ...),
+	# any other path gets encoded by ffmpeg (the raw frames are piped to it, the extension chooses the format).
+
+	QUEUE_SIZE = 8 # frames that can wait for the writer
+	PNG_DIGITS = 6
+
+	def __init__(self, path, width, height, fps, encoder = "ffmpeg"):
+		self.path = path
+		self.size = (width, height)
+		self.frame_count = 0 # frames given to the writer
+		self.queue = queue.Queue(FrameWriter.QUEUE_SIZE)
+		self.error = None # set by the writer thread, raised by the renderer
+
+		if path.lower().endswith(".png"):
+			self.process = None
+			os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+		else:
+			command = [
+				encoder, "-loglevel", "error", "-y",
+				"-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", f"{fps:g}", "-i", "-",
+				"-pix_fmt", "yuv420p", path,
+			]
+			try:
+				self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+			except FileNotFoundError:
+				raise RuntimeError(f"the encoder '{encoder}' wasn't found, install ffmpeg or export a .png sequence")
+
+		self.thread = threading.Thread(target=self.run, name="frame writer", daemon=True)
+		self.thread.start()
+
+	def write(self, surface):
+		# called by the renderer for every frame (the surface can be drawn on again right after)
+		if self.error is not None:
+			raise RuntimeError(f"writing the frames to '{self.path}' failed") from self.error
+		if surface.get_size() != self.size:
+			raise ValueError(f"the frame has the size {surface.get_size()}, the export {self.size}")
+		self.queue.put(pygame.image.tobytes(surface, "RGB"))
+		self.frame_count += 1
+
+	def close(self):
+		# waits until all frames are written
+		self.queue.put(None)
+		self.thread.join()
+		if self.process is not None:
+			self.process.stdin.close()
+			if self.process.wait() != 0 and self.error is None:
+				self.error = RuntimeError(f"the encoder stopped with exit code {self.process.returncode}")
+		if self.error is not None:
+			raise RuntimeError(f"writing the frames to '{self.path}' failed") from self.error
+
+	def get_png_path(self, index):
+		(start, extension) = os.path.splitext(self.path)
+		return f"{start}_{index:0{FrameWriter.PNG_DIGITS}d}{extension}"
+
+
+	# writer thread
+
+	def run(self):
+		index = 0
+		while True:
+			data = self.queue.get()
+			if data is None:
+				return
+			if self.error is not None:
+				continue # the renderer only stops at the next frame, until then the frames are dropped
+
+			# pipe writes and zlib compression release the GIL, so this runs while the next frame is rendered
+			try:
+				if self.process is not None:
+					self.process.stdin.write(data)
+				else:
+					pygame.image.save(pygame.image.frombuffer(data, self.size, "RGB"), self.get_png_path(index))
+			except Exception as error:
+				self.error = error
+			index += 1
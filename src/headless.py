@@ -0,0 +1,133 @@
+import argparse
+import json
+import time
+
+import os
+
+from checkpoint import load_checkpoint, save_checkpoint
+from profiler import Profiler
+import simulation as simulation_module
+from recording import TrajectoryFile, TrajectoryRecorder
+from simulation import Simulation
+
+MS_PER_DAY = 86_400_000
+
+STEPS_PER_CHUNK = 100 # steps between two checks for snapshots and reports
+
+def run(simulation: Simulation, step_count, snapshot_file = None, snapshot_every = 0, report_every = 5.0, checkpoint_path = None, checkpoint_every = 0, start_values = None, profiler: Profiler = None):
+	# advances the simulation as fast as possible until it has done step_count steps (in total, so a resumed run ends at the same step)
+	if start_values is None:
+		start_values = {"energy": simulation.calc_energy(), "angular_momentum": simulation.calc_angular_momentum()}
+	first_step = simulation.step_count
+	start_time = time.perf_counter()
+	last_report_time = start_time
+	last_report_step = first_step
+
+	while simulation.step_count < step_count:
+		# stop at every step where something has to be written
+		chunk = min(STEPS_PER_CHUNK, step_count - simulation.step_count)
+		for every in (snapshot_every if snapshot_file is not None else 0, checkpoint_every if checkpoint_path is not None else 0):
+			if every > 0:
+				chunk = min(chunk, every - simulation.step_count % every)
+
+		simulation.step(chunk)
+		step = simulation.step_count
+
+		output_start = time.perf_counter_ns()
+		if snapshot_file is not None and snapshot_every > 0 and step % snapshot_every == 0:
+			write_state(snapshot_file, simulation)
+
+		if checkpoint_path is not None and checkpoint_every > 0 and step % checkpoint_every == 0:
+			save_checkpoint(checkpoint_path, simulation, {"start_values": start_values})
+
+		# every chunk is a frame of the profiler
+		if profiler is not None:
+			profiler.end("output", output_start)
+			profiler.end_frame()
+
+		# report progress from time to time
+		now = time.perf_counter()
+		if report_every > 0 and now - last_report_time >= report_every:
+			print(f"step {step} / {step_count}: {(step - last_report_step) / (now - last_report_time):.1f} steps/s")
+			last_report_time = now
+			last_report_step = step
+
+	elapsed = time.perf_counter() - start_time
+	done_steps = simulation.step_count - first_step
+	steps_per_second = done_steps / elapsed if elapsed > 0 else float("inf")
+	print(f"{done_steps} steps in {elapsed:.3f} s: {steps_per_second:.1f} steps/s, simulated {simulation.time / MS_PER_DAY:.2f} days")
+
+	# conserved quantities show how accurate the simulation is
+	energy_drift = relative_drift(start_values["energy"], simulation.calc_energy())
+	angular_momentum_drift = relative_drift(start_values["angular_momentum"], simulation.calc_angular_momentum())
+	print(f"relative energy drift: {energy_drift:.3e}, relative angular momentum drift: {angular_momentum_drift:.3e}")
+
+	if profiler is not None:
+		print(f"time per chunk of up to {STEPS_PER_CHUNK} steps (last {min(profiler.frame_count, profiler.history)} chunks):")
+		print("\n".join(profiler.format_summary()))
+	return steps_per_second
+
+def relative_drift(start_value, end_value):
+	return abs(end_value - start_value) / abs(start_value) if start_value != 0 else abs(end_value)
+
+def write_state(file, simulation: Simulation):
+	# one JSON object per line
+	file.write(json.dumps(simulation.get_state()) + "\n")
+
+def main():
+	parser = argparse.ArgumentParser(description="Gravity simulation without a window")
+	duration = parser.add_mutually_exclusive_group(required=True)
+	duration.add_argument("--steps", type=int, help="number of steps to simulate")
+	duration.add_argument("--days", type=float, help="amount of simulated time in days")
+	simulation_module.add_arguments(parser)
+	parser.add_argument("--output", help="file the final state gets written to (JSON)")
+	parser.add_argument("--snapshots", help="file periodic states get written to (one JSON object per line)")
+	parser.add_argument("--snapshot-every", type=int, default=100, help="number of steps between two snapshots (default: 100)")
+	parser.add_argument("--record", help="file the trajectory gets recorded to (binary, can be replayed with main.py --replay)")
+	parser.add_argument("--record-every", type=int, default=1, help="record only every n-th step (default: 1)")
+	parser.add_argument("--record-dtype", choices=TrajectoryFile.DTYPES.keys(), default="float32", help="precision of the recorded values (default: float32)")
+	parser.add_argument("--checkpoint", help="file the whole simulation state gets saved to periodically")
+	parser.add_argument("--checkpoint-every", type=int, default=10_000, help="number of steps between two checkpoints (default: 10000)")
+	parser.add_argument("--resume", action="store_true", help="continue from the checkpoint file if it exists (the simulation options are taken from the checkpoint)")
+	parser.add_argument("--profile", help="file the time of the force calculations, the integration and the output gets saved to (.csv or .json)")
+	parser.add_argument("--report-every", type=float, default=5.0, help="seconds between two progress reports, 0 disables them (default: 5)")
+	args = parser.parse_args()
+
+	resumed = args.resume and args.checkpoint is not None and os.path.exists(args.checkpoint)
+	if resumed:
+		(simulation, extra_state) = load_checkpoint(args.checkpoint)
+		start_values = extra_state.get("start_values")
+		print(f"Resuming from step {simulation.step_count}")
+	else:
+		simulation = simulation_module.create_simulation(args)
+		start_values = None
+	step_count = args.steps if args.steps is not None else round(args.days * MS_PER_DAY / simulation.step_size)
+
+	if args.record is not None and simulation.collisions is not None:
+		parser.error("--record can't be used with --collisions (a recording needs a fixed number of bodies)")
+	if args.record is not None:
+		simulation.recorder = TrajectoryRecorder(args.record, simulation.bodies, simulation.step_size, args.record_every, args.record_dtype, resume_time = simulation.time if resumed else None)
+		if simulation.recorder.frame_count == 0:
+			simulation.recorder.write_frame(simulation) # initial state
+
+	profiler = Profiler() if args.profile is not None else None
+	simulation.profiler = profiler
+
+	snapshot_file = open(args.snapshots, "a" if resumed else "w") if args.snapshots is not None else None
+	try:
+		run(simulation, step_count, snapshot_file, args.snapshot_every, args.report_every, args.checkpoint, args.checkpoint_every, start_values, profiler)
+	finally:
+		if snapshot_file is not None:
+			snapshot_file.close()
+		if simulation.recorder is not None:
+			simulation.recorder.close()
+
+	if profiler is not None:
+		profiler.save(args.profile)
+
+	if args.output is not None:
+		with open(args.output, "w") as file:
+			json.dump(simulation.get_state(), file, indent=4)
+
+if __name__ == "__main__":
+	main()
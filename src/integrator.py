@@ -0,0 +1,258 @@
+import numpy as np
+
+class Integrator:
+	# Advances positions (km) and velocities (m/s) in place by delta_time (ms of simulated time).
+	# calc_accelerations(pos_x, pos_y, targets = None) has to return the accelerations in km / s^2
+	# (of all bodies or only of the bodies with the indices in targets).
+
+	def step(self, pos_x, pos_y, vel_x, vel_y, delta_time, calc_accelerations):
+		raise NotImplementedError
+
+	def reset(self):
+		# called when the bodies change, so that nothing cached from the previous steps gets used
+		pass
+
+	def get_options(self):
+		# arguments for the constructor
+		return {}
+
+	def get_state(self):
+		# everything that is needed to continue exactly where the integrator stopped (JSON values or arrays)
+		return {}
+
+	def set_state(self, state):
+		pass
+
+	def kick(vel_x, vel_y, acc_x, acc_y, delta_time):
+		# km / s^2 * ms = m / s
+		vel_x += acc_x * delta_time
+		vel_y += acc_y * delta_time
+
+	def drift(pos_x, pos_y, vel_x, vel_y, delta_time):
+		# need conversion because velocity is in m/s and not in km/ms
+		pos_x += vel_x * (delta_time / 1_000_000)
+		pos_y += vel_y * (delta_time / 1_000_000)
+
+
+class EulerIntegrator(Integrator):
+	# Semi-implicit Euler, first order
+
+	def step(self, pos_x, pos_y, vel_x, vel_y, delta_time, calc_accelerations):
+		(acc_x, acc_y) = calc_accelerations(pos_x, pos_y)
+		Integrator.kick(vel_x, vel_y, acc_x, acc_y, delta_time)
+		Integrator.drift(pos_x, pos_y, vel_x, vel_y, delta_time)
+
+
+class LeapfrogIntegrator(Integrator):
+	# Velocity Verlet (kick-drift-kick leapfrog), second order and symplectic.
+	# The accelerations at the end of a step are reused at the beginning of the next one,
+	# so there is only one force calculation per step.
+
+	def __init__(self):
+		self.acc = None
+
+	def step(self, pos_x, pos_y, vel_x, vel_y, delta_time, calc_accelerations):
+		if self.acc is None or len(self.acc[0]) != len(pos_x):
+			self.acc = calc_accelerations(pos_x, pos_y)
+
+		Integrator.kick(vel_x, vel_y, self.acc[0], self.acc[1], 0.5 * delta_time)
+		Integrator.drift(pos_x, pos_y, vel_x, vel_y, delta_time)
+		self.acc = calc_accelerations(pos_x, pos_y)
+		Integrator.kick(vel_x, vel_y, self.acc[0], self.acc[1], 0.5 * delta_time)
+
+	def reset(self):
+		self.acc = None
+
+	def get_state(self):
+		if self.acc is None:
+			return {}
+		return {"acc_x": self.acc[0], "acc_y": self.acc[1]}
+
+	def set_state(self, state):
+		self.acc = (state["acc_x"].copy(), state["acc_y"].copy()) if "acc_x" in state else None
+
+
+class YoshidaIntegrator(Integrator):
+	# Fourth order symplectic integrator (Yoshida 1990), three force calculations per step
+
+	W1 = 1.0 / (2.0 - 2.0 ** (1.0 / 3.0))
+	W0 = 1.0 - 2.0 * W1
+	DRIFT_COEFFICIENTS = (W1 / 2.0, (W0 + W1) / 2.0, (W0 + W1) / 2.0, W1 / 2.0)
+	KICK_COEFFICIENTS = (W1, W0, W1)
+
+	def step(self, pos_x, pos_y, vel_x, vel_y, delta_time, calc_accelerations):
+		for i in range(3):
+			Integrator.drift(pos_x, pos_y, vel_x, vel_y, YoshidaIntegrator.DRIFT_COEFFICIENTS[i] * delta_time)
+			(acc_x, acc_y) = calc_accelerations(pos_x, pos_y)
+			Integrator.kick(vel_x, vel_y, acc_x, acc_y, YoshidaIntegrator.KICK_COEFFICIENTS[i] * delta_time)
+		Integrator.drift(pos_x, pos_y, vel_x, vel_y, YoshidaIntegrator.DRIFT_COEFFICIENTS[3] * delta_time)
+
+
+class RK4Integrator(Integrator):
+	# Classic Runge-Kutta, fourth order but not symplectic, four force calculations per step
+
+	def step(self, pos_x, pos_y, vel_x, vel_y, delta_time, calc_accelerations):
+		scale = delta_time / 1_000_000 # velocity in m/s to change of position in km
+
+		(k1_vel_x, k1_vel_y) = (vel_x.copy(), vel_y.copy())
+		(k1_acc_x, k1_acc_y) = calc_accelerations(pos_x, pos_y)
+
+		k2_vel_x = vel_x + 0.5 * delta_time * k1_acc_x
+		k2_vel_y = vel_y + 0.5 * delta_time * k1_acc_y
+		(k2_acc_x, k2_acc_y) = calc_accelerations(pos_x + 0.5 * scale * k1_vel_x, pos_y + 0.5 * scale * k1_vel_y)
+
+		k3_vel_x = vel_x + 0.5 * delta_time * k2_acc_x
+		k3_vel_y = vel_y + 0.5 * delta_time * k2_acc_y
+		(k3_acc_x, k3_acc_y) = calc_accelerations(pos_x + 0.5 * scale * k2_vel_x, pos_y + 0.5 * scale * k2_vel_y)
+
+		k4_vel_x = vel_x + delta_time * k3_acc_x
+		k4_vel_y = vel_y + delta_time * k3_acc_y
+		(k4_acc_x, k4_acc_y) = calc_accelerations(pos_x + scale * k3_vel_x, pos_y + scale * k3_vel_y)
+
+		pos_x += scale / 6.0 * (k1_vel_x + 2.0 * k2_vel_x + 2.0 * k3_vel_x + k4_vel_x)
+		pos_y += scale / 6.0 * (k1_vel_y + 2.0 * k2_vel_y + 2.0 * k3_vel_y + k4_vel_y)
+		vel_x += delta_time / 6.0 * (k1_acc_x + 2.0 * k2_acc_x + 2.0 * k3_acc_x + k4_acc_x)
+		vel_y += delta_time / 6.0 * (k1_acc_y + 2.0 * k2_acc_y + 2.0 * k3_acc_y + k4_acc_y)
+
+
+class BlockTimestepIntegrator(Integrator):
+	# Hierarchical (block) timesteps with kick-drift-kick leapfrog.
+	# delta_time is the largest step. Every body gets a step of delta_time / 2^level, chosen from its
+	# acceleration and jerk (dt = ETA * |a| / |jerk|). All bodies drift on the smallest step in use, but only
+	# the bodies whose step ends get new accelerations, so a close pair doesn't make the whole system expensive.
+
+	ETA = 0.02
+	MAX_LEVEL = 24
+
+	def __init__(self, eta = ETA, max_level = MAX_LEVEL):
+		self.eta = eta
+		self.max_level = max_level
+		self.force_evaluations = 0 # number of accelerations of single bodies calculated so far
+		self.reset()
+
+	def reset(self):
+		self.level = None # level of every body
+		self.acc = None
+		self.jerk = None
+
+	def get_options(self):
+		return {"eta": self.eta, "max_level": self.max_level}
+
+	def get_state(self):
+		state = {"force_evaluations": self.force_evaluations}
+		if self.level is not None:
+			state.update({
+				"level": self.level,
+				"acc_x": self.acc[0], "acc_y": self.acc[1],
+				"jerk_x": self.jerk[0], "jerk_y": self.jerk[1],
+			})
+		return state
+
+	def set_state(self, state):
+		self.force_evaluations = state["force_evaluations"]
+		if "level" in state:
+			self.level = state["level"].copy()
+			self.acc = (state["acc_x"].copy(), state["acc_y"].copy())
+			self.jerk = (state["jerk_x"].copy(), state["jerk_y"].copy())
+		else:
+			self.reset()
+
+	def step(self, pos_x, pos_y, vel_x, vel_y, delta_time, calc_accelerations):
+		count = len(pos_x)
+		if self.level is None or len(self.level) != count:
+			self.start(pos_x, pos_y, vel_x, vel_y, delta_time, calc_accelerations)
+
+		# the base step is divided into 2^max_level ticks
+		tick_count = 1 << self.max_level
+		tick_time = delta_time / tick_count
+		step_ticks = np.left_shift(1, self.max_level - self.level) # ticks per step of every body
+
+		# opening half kick, all bodies are synchronized at the beginning of a base step
+		Integrator.kick(vel_x, vel_y, self.acc[0], self.acc[1], 0.5 * step_ticks * tick_time)
+
+		tick = 0
+		while tick < tick_count:
+			# drift everything to the end of the smallest step
+			substep_ticks = int(step_ticks.min())
+			Integrator.drift(pos_x, pos_y, vel_x, vel_y, substep_ticks * tick_time)
+			tick += substep_ticks
+
+			# new accelerations only for the bodies whose step ends now
+			active = np.flatnonzero(tick % step_ticks == 0)
+			(acc_x, acc_y) = calc_accelerations(pos_x, pos_y, active)
+			self.force_evaluations += len(active)
+
+			# closing half kick
+			active_step_time = step_ticks[active] * tick_time
+			vel_x[active] += acc_x * (0.5 * active_step_time)
+			vel_y[active] += acc_y * (0.5 * active_step_time)
+
+			# estimate the jerk from the change of the acceleration
+			self.jerk[0][active] = (acc_x - self.acc[0][active]) / active_step_time
+			self.jerk[1][active] = (acc_y - self.acc[1][active]) / active_step_time
+			self.acc[0][active] = acc_x
+			self.acc[1][active] = acc_y
+
+			# choose the next step of the active bodies
+			self.level[active] = self.calc_levels(active, delta_time, tick)
+			step_ticks[active] = np.left_shift(1, self.max_level - self.level[active])
+
+			# opening half kick of the next step (the one at the end of the base step happens in the next call)
+			if tick < tick_count:
+				active_step_time = step_ticks[active] * tick_time
+				vel_x[active] += acc_x * (0.5 * active_step_time)
+				vel_y[active] += acc_y * (0.5 * active_step_time)
+
+	def start(self, pos_x, pos_y, vel_x, vel_y, delta_time, calc_accelerations):
+		# the first jerk is estimated from the accelerations after a tiny drift
+		count = len(pos_x)
+		self.acc = calc_accelerations(pos_x, pos_y)
+
+		small_time = delta_time / (1 << self.max_level)
+		(acc_x, acc_y) = calc_accelerations(pos_x + vel_x * (small_time / 1_000_000), pos_y + vel_y * (small_time / 1_000_000))
+		self.force_evaluations += 2 * count
+		self.jerk = ((acc_x - self.acc[0]) / small_time, (acc_y - self.acc[1]) / small_time)
+
+		self.level = np.zeros(count, dtype=np.int64)
+		self.level = self.calc_levels(np.arange(count), delta_time, 0)
+
+	def calc_levels(self, bodies, delta_time, tick):
+		acc = np.hypot(self.acc[0][bodies], self.acc[1][bodies])
+		jerk = np.hypot(self.jerk[0][bodies], self.jerk[1][bodies])
+
+		# dt = ETA * |a| / |jerk| rounded down to delta_time / 2^level
+		# without an acceleration or a jerk (e.g. a single body) nothing limits the step, so the largest step is used
+		limited = (acc > 0) & (jerk > 0) & np.isfinite(acc) & np.isfinite(jerk)
+		wanted_time = self.eta * np.where(limited, acc, 1.0) / np.where(limited, jerk, 1.0)
+		with np.errstate(divide="ignore", over="ignore"):
+			wanted_level = np.ceil(np.log2(delta_time / np.maximum(wanted_time, np.finfo(np.float64).tiny)))
+		wanted_level = np.where(limited, np.clip(np.nan_to_num(wanted_level, nan=0), 0, self.max_level), 0).astype(np.int64)
+
+		# a step may only get bigger by one level at a time and only if the new step starts at this tick
+		current_level = self.level[bodies]
+		aligned_level = self.max_level - BlockTimestepIntegrator.trailing_zeros(tick, self.max_level)
+		return np.where(wanted_level < current_level, np.maximum(wanted_level, np.maximum(current_level - 1, aligned_level)), wanted_level)
+
+	def trailing_zeros(tick, max_level):
+		# number of trailing zero bits of tick (max_level for tick 0 or the end of the base step)
+		tick = tick % (1 << max_level)
+		if tick == 0:
+			return max_level
+		return (tick & -tick).bit_length() - 1
+
+
+INTEGRATORS = {
+	"euler": EulerIntegrator,
+	"leapfrog": LeapfrogIntegrator,
+	"yoshida": YoshidaIntegrator,
+	"rk4": RK4Integrator,
+	"block": BlockTimestepIntegrator,
+}
+
+def create_integrator(name, **kwargs) -> Integrator:
+	if name not in INTEGRATORS:
+		raise ValueError(f"unknown integrator '{name}' (available: {', '.join(INTEGRATORS)})")
+	return INTEGRATORS[name](**kwargs)
+
+def get_integrator_name(integrator: Integrator):
+	return next(name for (name, integrator_class) in INTEGRATORS.items() if type(integrator) is integrator_class)
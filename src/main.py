@@ -1,6 +1,65 @@
-from app import App
+import argparse
 
-print("Starting gravity simulation")
+from app import App, BACKGROUNDS
+from headless import MS_PER_DAY
+from recording import TrajectoryReplay
+import simulation
 
-app = App()
-app.run()
+def main():
+	parser = argparse.ArgumentParser(description="Gravity simulation")
+	simulation.add_arguments(parser)
+	parser.add_argument("--checkpoint", default="checkpoint.npz", help="file Ctrl + s saves the whole state to (default: checkpoint.npz)")
+	parser.add_argument("--resume", action="store_true", help="start from the checkpoint file (also works with checkpoints of headless.py)")
+	parser.add_argument("--background", choices=BACKGROUNDS.keys(), default="dynamic", help="how the stars in the background are generated (default: dynamic)")
+	parser.add_argument("--threaded", action="store_true", help="run the simulation in its own thread, so that drawing doesn't wait for it")
+	parser.add_argument("--max-steps-per-second", type=float, default=0, help="limit of the simulation thread (default: 0 = no limit)")
+	parser.add_argument("--fps", type=float, default=120, help="limit of the frame rate (default: 120, 0 = no limit)")
+	parser.add_argument("--vsync", action="store_true", help="wait for the vertical sync of the display when showing a frame")
+	parser.add_argument("--profile", help="save the time of every phase of a frame into this file at the end (.csv or .json), Ctrl + p shows it")
+	parser.add_argument("--replay", help="play a recorded trajectory (see headless.py --record) instead of simulating")
+	parser.add_argument("--export", help="render a video (e.g. .mp4, needs ffmpeg) or a .png sequence without a window instead of showing the app")
+	parser.add_argument("--export-seconds", type=float, default=20, help="length of the exported video (default: 20)")
+	parser.add_argument("--export-fps", type=float, default=60, help="frame rate of the exported video (default: 60)")
+	parser.add_argument("--export-size", type=int, nargs=2, default=[1280, 720], metavar=("WIDTH", "HEIGHT"), help="size of the exported frames (default: 1280 720)")
+	parser.add_argument("--export-days-per-second", type=float, help="simulated days per second of the exported video (default: the speed of the app, 1 year = 20 s)")
+	parser.add_argument("--export-follow", help="name of the body the view of the export is locked to")
+	parser.add_argument("--encoder", default="ffmpeg", help="encoder program for exported videos (default: ffmpeg)")
+	args = parser.parse_args()
+
+	if args.export is not None:
+		export(args)
+		return
+
+	print("Starting gravity simulation")
+
+	if args.replay is not None:
+		app = App(replay=TrajectoryReplay(args.replay), background=args.background, profile_path=args.profile, target_fps=args.fps, vsync=args.vsync)
+	else:
+		app = App(simulation.create_simulation(args), checkpoint_path=args.checkpoint, background=args.background, threaded=args.threaded, max_steps_per_second=args.max_steps_per_second, profile_path=args.profile, target_fps=args.fps, vsync=args.vsync)
+		if args.resume:
+			app.load_checkpoint(args.checkpoint)
+	app.run()
+
+def export(args):
+	# the frames are drawn off-screen with a fixed simulated time per frame, the simulation runs in the same thread to be reproducible
+	options = {"background": args.background, "profile_path": args.profile, "window_size": args.export_size, "offscreen": True}
+	if args.replay is not None:
+		app = App(replay=TrajectoryReplay(args.replay), **options)
+	else:
+		app = App(simulation.create_simulation(args), **options)
+		if args.resume:
+			app.load_checkpoint(args.checkpoint)
+
+	if args.export_days_per_second is not None:
+		app.time_factor = args.export_days_per_second * MS_PER_DAY / 1000
+	if args.export_follow is not None:
+		app.fixed_body = app.get_bodies().find(args.export_follow)
+		if app.fixed_body is None:
+			raise ValueError(f"there is no body named '{args.export_follow}'")
+
+	print(f"Exporting to {args.export}")
+	app.export(args.export, max(1, round(args.export_seconds * args.export_fps)), args.export_fps, args.encoder)
+
+if __name__ == "__main__":
+	# worker processes (see ParallelForceEngine) import this file without running the app
+	main()
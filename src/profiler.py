@@ -0,0 +1,115 @@
+import csv
+import json
+import time
+
+import numpy as np
+import pygame
+
+class Profiler:
+	# Measures how long the phases of a frame take (with perf_counter_ns).
+	# Times of the same phase within a frame are added up. end_frame stores them in a ring buffer of the last HISTORY frames
+	# (for the overlay) and in a histogram over all frames with power-of-2 bins (for exporting long runs).
+
+	HISTORY = 600 # frames
+	HISTOGRAM_EDGES = 2 ** np.arange(10, 35, dtype=np.int64) # in ns, from about 1 µs to 17 s
+	OVERLAY_REFRESH = 15 # frames between two updates of the overlay text
+	OVERLAY_COLOR = (0, 255, 0)
+
+	def __init__(self, history = HISTORY):
+		self.history = history
+		self.frame_count = 0
+		self.phases = [] # in the order they were measured first
+		self.current = {} # phase -> ns in the current frame
+		self.samples = {} # phase -> ring buffer of the last frames in ns
+		self.histograms = {} # phase -> number of frames per bin
+		self.overlay_lines = []
+		self.font = None
+
+
+	# measuring
+
+	def begin(self):
+		return time.perf_counter_ns()
+
+	def end(self, phase, start):
+		self.add(phase, time.perf_counter_ns() - start)
+
+	def add(self, phase, duration):
+		if phase not in self.current:
+			self.phases.append(phase)
+			self.current[phase] = 0
+			self.samples[phase] = np.zeros(self.history, dtype=np.int64)
+			self.histograms[phase] = np.zeros(len(Profiler.HISTOGRAM_EDGES) + 1, dtype=np.int64)
+		self.current[phase] += duration
+
+	def end_frame(self):
+		index = self.frame_count % self.history
+		for phase in self.phases:
+			duration = self.current[phase]
+			self.samples[phase][index] = duration
+			self.histograms[phase][np.searchsorted(Profiler.HISTOGRAM_EDGES, duration, side="right")] += 1
+			self.current[phase] = 0
+		self.frame_count += 1
+
+
+	# results
+
+	def get_summary(self):
+		# statistics of the last frames in ms for every phase
+		frame_count = min(self.frame_count, self.history)
+		summary = {}
+		if frame_count == 0:
+			return summary
+
+		total = sum(self.samples[phase][:frame_count].sum() for phase in self.phases)
+		for phase in self.phases:
+			samples = self.samples[phase][:frame_count] / 1e6
+			summary[phase] = {
+				"mean_ms": float(samples.mean()),
+				"p50_ms": float(np.percentile(samples, 50)),
+				"p95_ms": float(np.percentile(samples, 95)),
+				"max_ms": float(samples.max()),
+				"share": float(samples.sum() * 1e6 / total) if total > 0 else 0.0,
+			}
+		return summary
+
+	def save(self, path):
+		# .json with the summary and the histograms, otherwise .csv with one row per phase
+		summary = self.get_summary()
+		if path.lower().endswith(".json"):
+			data = {
+				"frames": self.frame_count,
+				"histogram_edges_ns": Profiler.HISTOGRAM_EDGES.tolist(), # bin i counts frames with edges[i - 1] <= time < edges[i]
+				"phases": {phase: {**summary[phase], "histogram": self.histograms[phase].tolist()} for phase in self.phases},
+			}
+			with open(path, "w") as file:
+				json.dump(data, file, indent=4)
+		else:
+			with open(path, "w", newline="") as file:
+				writer = csv.writer(file)
+				writer.writerow(["phase", "mean_ms", "p50_ms", "p95_ms", "max_ms", "share"])
+				for phase in self.phases:
+					values = summary[phase]
+					writer.writerow([phase] + [f"{values[key]:.6f}" for key in ("mean_ms", "p50_ms", "p95_ms", "max_ms", "share")])
+
+	def format_summary(self):
+		lines = [f"{'phase':<12} {'mean ms':>8} {'p95 ms':>8} {'max ms':>8} {'share':>6}"]
+		for (phase, values) in self.get_summary().items():
+			lines.append(f"{phase:<12} {values['mean_ms']:>8.3f} {values['p95_ms']:>8.3f} {values['max_ms']:>8.3f} {values['share'] * 100:>5.1f}%")
+		return lines
+
+
+	# overlay
+
+	def draw_overlay(self, screen):
+		if self.font is None:
+			self.font = pygame.font.SysFont("monospace", 14)
+
+		# rendering text is slow, so the text only changes from time to time
+		if self.frame_count % Profiler.OVERLAY_REFRESH == 0 or not self.overlay_lines:
+			self.overlay_lines = [self.font.render(line, True, Profiler.OVERLAY_COLOR) for line in self.format_summary()]
+
+		y = 5
+		for line in self.overlay_lines:
+			screen.blit(line, (5, y))
+			y += line.get_height()
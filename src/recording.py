@@ -0,0 +1,156 @@
+import json
+import os
+
+import numpy as np
+
+from body_system import BodySystem
+
+class TrajectoryFile:
+	# Layout of a trajectory file:
+	#   MAGIC, header length (uint32, little endian), header (JSON, padded to ALIGNMENT bytes)
+	#   frames: simulated time in ms (float64), then pos_x, pos_y, velocity_x, velocity_y of all bodies
+	# All frames have the same size, so a frame can be found without reading the ones before it.
+
+	MAGIC = b"GRAVTRJ\0"
+	VERSION = 1
+	ALIGNMENT = 64
+	DTYPES = {"float32": np.float32, "float64": np.float64}
+
+	def frame_dtype(body_count, dtype):
+		value_type = np.dtype(TrajectoryFile.DTYPES[dtype]).newbyteorder("<")
+		return np.dtype([
+			("time", "<f8"),
+			("pos_x", value_type, (body_count,)),
+			("pos_y", value_type, (body_count,)),
+			("velocity_x", value_type, (body_count,)),
+			("velocity_y", value_type, (body_count,)),
+		])
+
+
+class TrajectoryRecorder:
+	# Appends a frame every `decimation` steps of the simulation.
+	# With resume_time an existing recording is continued: frames after that time get dropped.
+
+	def __init__(self, path, bodies: BodySystem, step_size, decimation = 1, dtype = "float32", resume_time = None):
+		if dtype not in TrajectoryFile.DTYPES:
+			raise ValueError(f"unknown dtype '{dtype}' (available: {', '.join(TrajectoryFile.DTYPES)})")
+
+		self.decimation = max(1, decimation)
+		self.body_count = len(bodies)
+		self.frame_dtype = TrajectoryFile.frame_dtype(self.body_count, dtype)
+		self.frame = np.zeros(1, dtype=self.frame_dtype)
+		self.frame_count = 0
+
+		if resume_time is not None and os.path.exists(path):
+			self.resume(path, dtype, resume_time)
+			return
+
+		header = {
+			"version": TrajectoryFile.VERSION,
+			"dtype": dtype,
+			"body_count": self.body_count,
+			"names": list(bodies.names),
+			"masses": bodies.mass.tolist(),
+			"colors": bodies.color.tolist(),
+			"draw_radius": bodies.draw_radius.tolist(),
+			"step_size": step_size,
+			"decimation": self.decimation,
+		}
+		header_bytes = json.dumps(header).encode("utf-8")
+		header_end = len(TrajectoryFile.MAGIC) + 4 + len(header_bytes)
+		header_bytes += b" " * (-header_end % TrajectoryFile.ALIGNMENT)
+
+		self.file = open(path, "wb")
+		self.file.write(TrajectoryFile.MAGIC)
+		self.file.write(len(header_bytes).to_bytes(4, "little"))
+		self.file.write(header_bytes)
+
+	def resume(self, path, dtype, resume_time):
+		replay = TrajectoryReplay(path)
+		if replay.body_count != self.body_count or replay.header["dtype"] != dtype or replay.header["decimation"] != self.decimation:
+			raise ValueError(f"'{path}' was recorded with other settings and can't be continued")
+
+		self.frame_count = int(np.searchsorted(replay.times, resume_time, side="right"))
+		end = replay.offset + self.frame_count * self.frame_dtype.itemsize
+		del replay # release the memory map before truncating the file
+
+		self.file = open(path, "r+b")
+		self.file.truncate(end)
+		self.file.seek(end)
+
+	def record(self, simulation):
+		# called after every step, only every decimation-th step gets written
+		if simulation.step_count % self.decimation == 0:
+			self.write_frame(simulation)
+
+	def write_frame(self, simulation):
+		bodies = simulation.bodies
+		if len(bodies) != self.body_count:
+			raise ValueError("the number of bodies changed while recording")
+
+		self.frame["time"] = simulation.time
+		self.frame["pos_x"] = bodies.pos_x
+		self.frame["pos_y"] = bodies.pos_y
+		self.frame["velocity_x"] = bodies.velocity_x
+		self.frame["velocity_y"] = bodies.velocity_y
+		self.file.write(self.frame.tobytes())
+		self.frame_count += 1
+
+	def close(self):
+		self.file.close()
+
+
+class TrajectoryReplay:
+	# Memory-maps a trajectory file, so any frame can be loaded instantly without simulating
+
+	def __init__(self, path):
+		with open(path, "rb") as file:
+			if file.read(len(TrajectoryFile.MAGIC)) != TrajectoryFile.MAGIC:
+				raise ValueError(f"'{path}' is not a trajectory file")
+			header_length = int.from_bytes(file.read(4), "little")
+			self.header = json.loads(file.read(header_length).decode("utf-8"))
+
+		if self.header["version"] > TrajectoryFile.VERSION:
+			raise ValueError(f"trajectory file version {self.header['version']} is not supported")
+
+		self.body_count = self.header["body_count"]
+		frame_dtype = TrajectoryFile.frame_dtype(self.body_count, self.header["dtype"])
+		self.offset = len(TrajectoryFile.MAGIC) + 4 + header_length
+
+		# a frame that was only partly written (e.g. the recording process died) is ignored
+		file_size = np.memmap(path, dtype=np.uint8, mode="r").size
+		frame_count = (file_size - self.offset) // frame_dtype.itemsize
+		if frame_count <= 0:
+			raise ValueError(f"'{path}' doesn't contain any frames")
+
+		self.frames = np.memmap(path, dtype=frame_dtype, mode="r", offset=self.offset, shape=(frame_count,))
+		self.times = np.ascontiguousarray(self.frames["time"])
+
+	def __len__(self):
+		return len(self.frames)
+
+	def create_bodies(self) -> BodySystem:
+		# all bodies at once, with the state of the first frame
+		frame = self.frames[0]
+		bodies = BodySystem(self.body_count)
+		bodies.add_many(
+			mass = self.header["masses"],
+			pos_x = frame["pos_x"], pos_y = frame["pos_y"],
+			velocity_x = frame["velocity_x"], velocity_y = frame["velocity_y"],
+			draw_radius = self.header["draw_radius"],
+			color = np.array(self.header["colors"], dtype=np.uint8).reshape(-1, 3),
+			names = self.header["names"],
+		)
+		return bodies
+
+	def frame_at(self, time):
+		# index of the last frame at or before the simulated time
+		return int(np.clip(np.searchsorted(self.times, time, side="right") - 1, 0, len(self.frames) - 1))
+
+	def load_frame(self, index, bodies: BodySystem):
+		frame = self.frames[index]
+		bodies.pos_x[:] = frame["pos_x"]
+		bodies.pos_y[:] = frame["pos_y"]
+		bodies.velocity_x[:] = frame["velocity_x"]
+		bodies.velocity_y[:] = frame["velocity_y"]
+		return frame["time"]
@@ -0,0 +1,245 @@
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+
+from body import Body
+from body_system import BodySystem
+from force_engine import ForceEngine
+from utility import GREY
+
+# Scenarios describe the bodies at the start of a simulation.
+#   .json / .toml: a list of "bodies" (with "active": false for bodies that can be switched in later, like sun1 and sun2)
+#                  and a list of "generators" that add many bodies with a fixed seed
+#   .npz: one array per column (mass, pos_x, pos_y, velocity_x, velocity_y and optionally draw_radius, color, names)
+#   .npy: a structured array with the same columns, it is memory-mapped and copied in chunks
+# Units like everywhere else: mass in kg, positions in km, velocities in m / s, draw radius in pixels.
+
+SCENARIO_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+DEFAULT_SCENARIO = os.path.join(SCENARIO_DIRECTORY, "solar_system.json")
+CHUNK_SIZE = 1 << 16 # bodies copied at once from memory-mapped files
+
+PARTICLE_MASS = 1e15
+PARTICLE_DRAW_RADIUS = 1
+PARTICLE_COLOR = GREY
+
+def load_scenario(path):
+	# returns the body system and a list of inactive bodies
+	extension = os.path.splitext(path)[1].lower()
+	if extension == ".json":
+		with open(path, "r") as file:
+			return create_bodies(json.load(file))
+	elif extension == ".toml":
+		try:
+			import tomllib # only in python 3.11 and newer, the other formats work without it
+		except ImportError:
+			raise ValueError("loading .toml scenarios needs python 3.11 or newer, use a .json scenario instead")
+		with open(path, "rb") as file:
+			return create_bodies(tomllib.load(file))
+	elif extension == ".npz":
+		return (load_columns(path), [])
+	elif extension == ".npy":
+		return (stream_columns(path), [])
+	raise ValueError(f"unknown scenario format '{extension}' (supported: .json, .toml, .npz, .npy)")
+
+def create_bodies(description):
+	bodies = BodySystem(len(description.get("bodies", [])))
+	inactive_bodies = []
+
+	for entry in description.get("bodies", []):
+		body = Body(
+			name = entry["name"],
+			mass = entry["mass"],
+			pos_x = entry.get("pos_x", 0), pos_y = entry.get("pos_y", 0),
+			velocity_x = entry.get("velocity_x", 0), velocity_y = entry.get("velocity_y", 0),
+			draw_radius = entry.get("draw_radius", PARTICLE_DRAW_RADIUS),
+			color = tuple(entry.get("color", PARTICLE_COLOR)),
+		)
+		if entry.get("active", True):
+			bodies.append(body)
+		else:
+			inactive_bodies.append(body)
+
+	for entry in description.get("generators", []):
+		options = dict(entry)
+		generator = options.pop("type")
+		if generator not in GENERATORS:
+			raise ValueError(f"unknown generator '{generator}' (available: {', '.join(GENERATORS)})")
+		bodies.add_many(**GENERATORS[generator](**options))
+
+	return (bodies, inactive_bodies)
+
+def load_columns(path):
+	# every column is read on its own and copied straight into the arrays of the body system
+	with np.load(path, allow_pickle=False) as data:
+		count = len(data["mass"])
+		bodies = BodySystem(count)
+		bodies.add_many(
+			mass = data["mass"],
+			pos_x = data["pos_x"], pos_y = data["pos_y"],
+			velocity_x = data["velocity_x"], velocity_y = data["velocity_y"],
+			draw_radius = data["draw_radius"] if "draw_radius" in data.files else PARTICLE_DRAW_RADIUS,
+			color = data["color"] if "color" in data.files else PARTICLE_COLOR,
+			names = [str(name) or None for name in data["names"]] if "names" in data.files else None,
+		)
+	return bodies
+
+def stream_columns(path):
+	records = np.load(path, mmap_mode="r", allow_pickle=False)
+	fields = records.dtype.names
+	bodies = BodySystem(len(records))
+
+	for start in range(0, len(records), CHUNK_SIZE):
+		chunk = records[start:start + CHUNK_SIZE]
+		bodies.add_many(
+			mass = chunk["mass"],
+			pos_x = chunk["pos_x"], pos_y = chunk["pos_y"],
+			velocity_x = chunk["velocity_x"], velocity_y = chunk["velocity_y"],
+			draw_radius = chunk["draw_radius"] if "draw_radius" in fields else PARTICLE_DRAW_RADIUS,
+			color = chunk["color"] if "color" in fields else PARTICLE_COLOR,
+		)
+	return bodies
+
+def save_scenario(path, bodies: BodySystem):
+	# saves the active bodies in a columnar format (.npz or .npy)
+	columns = {
+		"mass": bodies.mass, "pos_x": bodies.pos_x, "pos_y": bodies.pos_y,
+		"velocity_x": bodies.velocity_x, "velocity_y": bodies.velocity_y,
+		"draw_radius": bodies.draw_radius, "color": bodies.color,
+	}
+
+	if path.lower().endswith(".npy"):
+		records = np.zeros(len(bodies), dtype=[(key, value.dtype, value.shape[1:]) for (key, value) in columns.items()])
+		for (key, value) in columns.items():
+			records[key] = value
+		np.save(path, records)
+	else:
+		if any(name is not None for name in bodies.names):
+			columns["names"] = np.array([name or "" for name in bodies.names])
+		np.savez(path, **columns)
+
+
+# generators, all of them are reproducible with the same seed
+
+def circular_speed(central_mass, radius):
+	# speed of a circular orbit in m / s
+	return np.sqrt(ForceEngine.GRAVITATIONAL_CONSTANT * central_mass / radius) * 1000
+
+def make_columns(mass, pos_x, pos_y, velocity_x, velocity_y, draw_radius = PARTICLE_DRAW_RADIUS, color = PARTICLE_COLOR):
+	count = len(mass)
+	return {
+		"mass": mass,
+		"pos_x": pos_x, "pos_y": pos_y,
+		"velocity_x": velocity_x, "velocity_y": velocity_y,
+		"draw_radius": np.broadcast_to(np.asarray(draw_radius, dtype=np.float64), (count,)),
+		"color": np.broadcast_to(np.asarray(color, dtype=np.uint8), (count, 3)),
+	}
+
+def concat_columns(*column_sets):
+	return {key: np.concatenate([columns[key] for columns in column_sets]) for key in column_sets[0]}
+
+def center_columns(central_mass, center_x, center_y, center_velocity_x, center_velocity_y, draw_radius, color):
+	return make_columns(np.array([central_mass]), np.array([center_x]), np.array([center_y]), np.array([center_velocity_x]), np.array([center_velocity_y]), draw_radius, color)
+
+def generate_disk(count, inner_radius, outer_radius, central_mass, particle_mass = PARTICLE_MASS, velocity_spread = 0.0, seed = 0, add_center = True,
+		center_x = 0.0, center_y = 0.0, center_velocity_x = 0.0, center_velocity_y = 0.0, clockwise = False):
+	# bodies on (almost) circular orbits around a central mass, uniformly distributed over the area of the annulus
+	rng = np.random.default_rng(seed)
+	radius = np.sqrt(rng.uniform(inner_radius * inner_radius, outer_radius * outer_radius, count))
+	angle = rng.uniform(0.0, 2.0 * math.pi, count)
+
+	speed = circular_speed(central_mass, radius) * (1.0 + velocity_spread * rng.standard_normal(count))
+	direction = -1.0 if clockwise else 1.0
+	columns = make_columns(
+		np.full(count, float(particle_mass)),
+		center_x + radius * np.cos(angle), center_y + radius * np.sin(angle),
+		center_velocity_x - direction * speed * np.sin(angle), center_velocity_y + direction * speed * np.cos(angle),
+	)
+
+	if add_center:
+		columns = concat_columns(center_columns(central_mass, center_x, center_y, center_velocity_x, center_velocity_y, 20, (255, 140, 0)), columns)
+	return columns
+
+def generate_ring(count, radius, central_mass, particle_mass = PARTICLE_MASS, seed = 0, add_center = True, **options):
+	# a thin ring, e.g. around a planet or the sun
+	return generate_disk(count, radius, radius, central_mass, particle_mass, seed = seed, add_center = add_center, **options)
+
+def generate_belt(count, inner_radius, outer_radius, central_mass, particle_mass = PARTICLE_MASS, velocity_spread = 0.02, seed = 0, add_center = False, **options):
+	# an asteroid belt, by default around a central mass that is already part of the scenario (like the sun)
+	return generate_disk(count, inner_radius, outer_radius, central_mass, particle_mass, velocity_spread, seed, add_center, **options)
+
+def generate_plummer(count, total_mass, scale_radius, seed = 0, center_x = 0.0, center_y = 0.0):
+	# Plummer sphere (Aarseth, Henon & Wielen 1974) projected onto the plane of the simulation
+	rng = np.random.default_rng(seed)
+
+	radius = scale_radius / np.sqrt(rng.uniform(1e-10, 1.0, count) ** (-2.0 / 3.0) - 1.0)
+	(direction_x, direction_y) = random_projected_directions(rng, count)
+
+	# speed in units of the escape speed, sampled from q^2 * (1 - q^2)^3.5 by rejection
+	q = np.empty(0)
+	while len(q) < count:
+		candidates = rng.uniform(0.0, 1.0, 2 * count)
+		accepted = rng.uniform(0.0, 0.1, 2 * count) < candidates ** 2 * (1.0 - candidates ** 2) ** 3.5
+		q = np.concatenate((q, candidates[accepted]))
+	escape_speed = np.sqrt(2.0 * ForceEngine.GRAVITATIONAL_CONSTANT * total_mass / np.sqrt(radius * radius + scale_radius * scale_radius)) * 1000
+	speed = q[:count] * escape_speed
+	(velocity_direction_x, velocity_direction_y) = random_projected_directions(rng, count)
+
+	columns = make_columns(
+		np.full(count, total_mass / count),
+		center_x + radius * direction_x, center_y + radius * direction_y,
+		speed * velocity_direction_x, speed * velocity_direction_y,
+	)
+
+	# centre of mass at the centre and no drift of the whole cluster
+	for (key, center) in (("pos_x", center_x), ("pos_y", center_y), ("velocity_x", 0.0), ("velocity_y", 0.0)):
+		columns[key] += center - np.average(columns[key], weights=columns["mass"])
+	return columns
+
+def random_projected_directions(rng, count):
+	# x and y components of isotropic 3D unit vectors
+	cos_theta = rng.uniform(-1.0, 1.0, count)
+	phi = rng.uniform(0.0, 2.0 * math.pi, count)
+	sin_theta = np.sqrt(1.0 - cos_theta * cos_theta)
+	return (sin_theta * np.cos(phi), sin_theta * np.sin(phi))
+
+def generate_colliding_disks(count, disk_radius, central_mass, separation, approach_speed, impact_parameter = 0.0, particle_mass = PARTICLE_MASS, seed = 0):
+	# two disks (count bodies each) that move towards each other
+	first = generate_disk(count, 0.1 * disk_radius, disk_radius, central_mass, particle_mass, seed = seed,
+		center_x = -0.5 * separation, center_y = -0.5 * impact_parameter, center_velocity_x = 0.5 * approach_speed)
+	second = generate_disk(count, 0.1 * disk_radius, disk_radius, central_mass, particle_mass, seed = seed + 1,
+		center_x = 0.5 * separation, center_y = 0.5 * impact_parameter, center_velocity_x = -0.5 * approach_speed, clockwise = True)
+	return concat_columns(first, second)
+
+GENERATORS = {
+	"ring": generate_ring,
+	"belt": generate_belt,
+	"disk": generate_disk,
+	"plummer": generate_plummer,
+	"colliding_disks": generate_colliding_disks,
+}
+
+
+# command line: write generated scenarios into files
+
+def main():
+	parser = argparse.ArgumentParser(description="Generate a scenario file")
+	parser.add_argument("generator", choices=GENERATORS.keys())
+	parser.add_argument("output", help="scenario file (.npz, .npy or .json)")
+	parser.add_argument("options", help="options of the generator as JSON, e.g. '{\"count\": 100000, \"total_mass\": 1e36, \"scale_radius\": 1e10, \"seed\": 1}'")
+	args = parser.parse_args()
+
+	options = json.loads(args.options)
+	if args.output.lower().endswith(".json"):
+		with open(args.output, "w") as file:
+			json.dump({"generators": [{"type": args.generator, **options}]}, file, indent="\t")
+	else:
+		bodies = BodySystem()
+		bodies.add_many(**GENERATORS[args.generator](**options))
+		save_scenario(args.output, bodies)
+		print(f"Wrote {len(bodies)} bodies to {args.output}")
+
+if __name__ == "__main__":
+	main()
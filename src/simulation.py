@@ -0,0 +1,231 @@
+import numpy as np
+
+from body_system import BodySystem
+from collisions import CollisionHandler
+from force_engine import FORCE_ENGINES, ForceEngine, DirectForceEngine, create_force_engine
+from integrator import INTEGRATORS, Integrator, LeapfrogIntegrator, create_integrator
+from scenario import DEFAULT_SCENARIO, load_scenario
+from spatial_index import SpatialGrid
+
+class Simulation:
+	# The physical model without anything that is needed for drawing it.
+	# Time is measured in ms of simulated time.
+
+	STEP_SIZE = 3_600_000 # 1 hour
+	MAX_STEPS_PER_ADVANCE = 1000 # if advance would need more steps, the simulation runs slower than requested
+
+	def __init__(self, force_engine: ForceEngine = None, integrator: Integrator = None, step_size = STEP_SIZE, bodies: BodySystem = None, inactive_bodies = None):
+		self.force_engine: ForceEngine = force_engine if force_engine is not None else DirectForceEngine()
+		self.integrator: Integrator = integrator if integrator is not None else LeapfrogIntegrator()
+		self.step_size = step_size # fixed simulated time per step in ms
+		self.time = 0.0 # simulated time in ms
+		self.time_accumulator = 0.0 # simulated time that still has to be simulated, but is less than a step
+		self.step_count = 0
+		self.recorder = None # gets called after every step
+		self.profiler = None # measures the time of the force calculations and the integration
+		self.collisions: CollisionHandler = None # merges bodies that touch each other after every step
+
+		if bodies is None:
+			(bodies, inactive_bodies) = load_scenario(DEFAULT_SCENARIO)
+		self.bodies = bodies
+		self.inactive_bodies = inactive_bodies if inactive_bodies is not None else [] # bodies of the scenario that can be swapped in later
+
+		# bodies with a special meaning, all of them are optional
+		self.sun = self.find_body("sun")
+		self.sun1 = self.find_body("sun1")
+		self.sun2 = self.find_body("sun2")
+		self.moon = self.find_body("moon")
+
+		# finds bodies near a point or near each other (clicks and collisions), updated after the steps
+		self.spatial_index = SpatialGrid()
+		self.update_spatial_index()
+
+	def find_body(self, name):
+		body = self.bodies.find(name)
+		if body is not None:
+			return body
+		return next((body for body in self.inactive_bodies if body.name == name), None)
+
+
+	# simulation
+
+	def advance(self, delta_time, drop_time = True):
+		# runs as many fixed steps as fit into delta_time, the rest is simulated later
+		self.time_accumulator += delta_time
+		step_count = int(self.time_accumulator // self.step_size)
+
+		if drop_time and step_count > Simulation.MAX_STEPS_PER_ADVANCE:
+			step_count = Simulation.MAX_STEPS_PER_ADVANCE
+			self.time_accumulator = step_count * self.step_size # drop the time that can't be simulated
+
+		self.time_accumulator -= step_count * self.step_size
+		self.step(step_count)
+
+	def step(self, step_count = 1):
+		if step_count <= 0:
+			return
+
+		# the integrator works directly on the arrays of the body system
+		(pos_x, pos_y, vel_x, vel_y, _) = self.get_arrays()
+
+		def calc_accelerations(pos_x, pos_y, targets = None):
+			return self.force_engine.calc_accelerations(pos_x, pos_y, self.bodies.mass, targets)
+
+		if self.profiler is not None:
+			self.profile_steps(step_count, pos_x, pos_y, vel_x, vel_y, calc_accelerations)
+			return
+
+		for i in range(step_count):
+			self.integrator.step(pos_x, pos_y, vel_x, vel_y, self.step_size, calc_accelerations)
+			self.time += self.step_size
+			self.step_count += 1
+
+			# merging bodies makes the arrays shorter
+			if self.collisions is not None and self.collide():
+				(pos_x, pos_y, vel_x, vel_y, _) = self.get_arrays()
+
+			if self.recorder is not None:
+				self.recorder.record(self)
+
+		# collide already updated the spatial index after every step
+		if self.collisions is None:
+			self.update_spatial_index()
+
+	def profile_steps(self, step_count, pos_x, pos_y, vel_x, vel_y, calc_accelerations):
+		# like step, but the time of the force calculations, the rest of the integration and the recording are measured separately
+		profiler = self.profiler
+		forces_time = 0
+
+		def profiled_calc_accelerations(pos_x, pos_y, targets = None):
+			nonlocal forces_time
+			start = profiler.begin()
+			accelerations = calc_accelerations(pos_x, pos_y, targets)
+			forces_time += profiler.begin() - start
+			return accelerations
+
+		for i in range(step_count):
+			start = profiler.begin()
+			self.integrator.step(pos_x, pos_y, vel_x, vel_y, self.step_size, profiled_calc_accelerations)
+			self.time += self.step_size
+			self.step_count += 1
+			profiler.end("integration", start)
+
+			if self.collisions is not None:
+				start = profiler.begin()
+				if self.collide():
+					(pos_x, pos_y, vel_x, vel_y, _) = self.get_arrays()
+				profiler.end("collisions", start)
+
+			if self.recorder is not None:
+				start = profiler.begin()
+				self.recorder.record(self)
+				profiler.end("recording", start)
+
+		if self.collisions is None:
+			start = profiler.begin()
+			self.update_spatial_index()
+			profiler.end("spatial index", start)
+
+		profiler.add("forces", forces_time)
+		profiler.add("integration", -forces_time)
+
+	def collide(self):
+		# returns whether bodies got merged
+		self.update_spatial_index()
+		if self.collisions.merge(self.bodies, self.spatial_index) == 0:
+			return False
+		self.update_spatial_index()
+
+		# special bodies that got merged into others don't exist anymore
+		for name in ("sun", "sun1", "sun2", "moon"):
+			body = getattr(self, name)
+			if body is not None and body.system is None and body not in self.inactive_bodies:
+				setattr(self, name, None)
+		self.integrator.reset()
+		return True
+
+	def swap_suns(self):
+		# replace the sun with 2 suns or the other way round
+		if self.sun is None or self.sun1 is None or self.sun2 is None:
+			return
+
+		if self.sun in self.bodies:
+			(removed, added) = ([self.sun], [self.sun1, self.sun2])
+		else:
+			(removed, added) = ([self.sun1, self.sun2], [self.sun])
+
+		for body in removed:
+			self.bodies.remove(body)
+			self.inactive_bodies.append(body)
+		for body in added:
+			self.inactive_bodies.remove(body)
+			self.bodies.append(body)
+
+		self.integrator.reset()
+		self.update_spatial_index()
+
+
+	# utility
+
+	def update_spatial_index(self):
+		# has to be called whenever the bodies moved or changed
+		self.spatial_index.update(self.bodies.pos_x, self.bodies.pos_y)
+
+	def get_arrays(self):
+		return (self.bodies.pos_x, self.bodies.pos_y, self.bodies.velocity_x, self.bodies.velocity_y, self.bodies.mass)
+
+	def calc_energy(self):
+		# total (kinetic + potential) energy in kg * km^2 / s^2
+		(pos_x, pos_y, vel_x, vel_y, mass) = self.get_arrays()
+		kinetic_energy = 0.5 * np.sum(mass * ((vel_x / 1000) ** 2 + (vel_y / 1000) ** 2)) # velocity in km / s
+		return kinetic_energy + self.force_engine.calc_potential_energy(pos_x, pos_y, mass)
+
+	def calc_angular_momentum(self):
+		# total angular momentum around the origin in kg * km^2 / s
+		(pos_x, pos_y, vel_x, vel_y, mass) = self.get_arrays()
+		return np.sum(mass * (pos_x * vel_y - pos_y * vel_x)) / 1000 # velocity in km / s
+
+	def get_state(self):
+		bodies = [
+			{
+				"name": body.name,
+				"mass": body.mass,
+				"pos_x": float(body.pos_x), "pos_y": float(body.pos_y),
+				"velocity_x": float(body.velocity_x), "velocity_y": float(body.velocity_y),
+			}
+			for body in self.bodies
+		]
+		return {"time": self.time, "step": self.step_count, "bodies": bodies}
+
+
+# command line
+
+def add_arguments(parser):
+	parser.add_argument("--force-engine", choices=[name for name in FORCE_ENGINES if name != "parallel"], default="direct", help="algorithm that calculates the gravitational forces")
+	parser.add_argument("--theta", type=float, default=0.5, help="opening angle of the barnes-hut force engine (smaller = more accurate, 0 opens every node)")
+	parser.add_argument("--softening", type=float, default=0.0, help="Plummer softening length in km, limits the forces of close encounters (default: 0)")
+	parser.add_argument("--collisions", action="store_true", help="merge bodies that touch each other (conserves mass and momentum)")
+	parser.add_argument("--density", type=float, default=CollisionHandler.DEFAULT_DENSITY, help=f"density of the bodies in g / cm^3, gives their radius for --collisions (default: {CollisionHandler.DEFAULT_DENSITY})")
+	parser.add_argument("--workers", type=int, default=1, help="number of processes that calculate the forces (0 = one per CPU, default: 1)")
+	parser.add_argument("--integrator", choices=INTEGRATORS.keys(), default="leapfrog", help="algorithm that moves the bodies (default: leapfrog)")
+	parser.add_argument("--scenario", default=DEFAULT_SCENARIO, help="file with the bodies at the start (.json, .toml, .npz or .npy, default: the solar system)")
+	parser.add_argument("--step-size", type=float, default=Simulation.STEP_SIZE / 1000, help=f"simulated time per step in seconds (default: {Simulation.STEP_SIZE // 1000})")
+
+def create_simulation(args) -> Simulation:
+	(bodies, inactive_bodies) = load_scenario(args.scenario)
+	force_engine_options = {"theta": args.theta, "softening": args.softening} if args.force_engine == "barnes-hut" else {"softening": args.softening}
+	if args.workers != 1:
+		force_engine = create_force_engine("parallel", workers=args.workers, engine=args.force_engine, engine_options=force_engine_options)
+	else:
+		force_engine = create_force_engine(args.force_engine, **force_engine_options)
+
+	simulation = Simulation(
+		force_engine = force_engine,
+		integrator = create_integrator(args.integrator),
+		step_size = args.step_size * 1000,
+		bodies = bodies,
+		inactive_bodies = inactive_bodies,
+	)
+	if args.collisions:
+		simulation.collisions = CollisionHandler(args.density)
+	return simulation
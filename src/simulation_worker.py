@@ -0,0 +1,175 @@
+import threading
+import time
+
+import numpy as np
+
+from body_system import BodySystem
+from simulation import Simulation
+
+class SimulationWorker:
+	# Runs the simulation in its own thread, so that slow physics steps don't block drawing and input.
+	# After every chunk of steps the worker publishes a snapshot of the positions. There are 3 snapshot buffers:
+	# the 2 newest ones are read by the renderer, the third one gets written by the worker.
+	# The renderer draws a copy of the bodies (bodies) with positions interpolated between the 2 newest snapshots.
+	# Anything that changes the simulation from the outside has to hold simulation_lock.
+
+	MAX_STEPS_PER_CHUNK = 100 # steps between two snapshots (at most)
+	MAX_LAG_STEPS = Simulation.MAX_STEPS_PER_ADVANCE # if the simulation falls further behind, the missing time is dropped
+
+	class Snapshot:
+		def __init__(self):
+			self.time = 0.0
+			self.structure = -1 # changes whenever bodies get added or removed
+			self.pos_x = np.zeros(0)
+			self.pos_y = np.zeros(0)
+			self.spatial_index = None # the spatial index of the simulation over these positions
+
+		def write(self, simulation: Simulation, structure):
+			self.time = simulation.time
+			self.structure = structure
+			if len(self.pos_x) != len(simulation.bodies):
+				self.pos_x = np.empty(len(simulation.bodies))
+				self.pos_y = np.empty(len(simulation.bodies))
+			self.pos_x[:] = simulation.bodies.pos_x
+			self.pos_y[:] = simulation.bodies.pos_y
+			self.spatial_index = simulation.spatial_index.copy(self.pos_x, self.pos_y)
+
+	def __init__(self, simulation: Simulation, max_steps_per_second = 0):
+		self.simulation = simulation
+		self.max_steps_per_second = max_steps_per_second # 0 = as fast as possible
+		self.simulation_lock = threading.RLock() # held by the worker while it steps
+		self.condition = threading.Condition() # guards everything below
+		self.thread = None
+		self.running = False
+
+		self.target_time = simulation.time # simulated time the renderer wants to show
+		self.display_delay = simulation.step_size # the renderer shows the time this much before target_time
+		self.structure = 0
+		self.snapshots = [SimulationWorker.Snapshot() for i in range(3)] # previous, latest, free
+		for snapshot in self.snapshots[:2]:
+			snapshot.write(simulation, self.structure)
+
+		self.bodies: BodySystem = simulation.bodies.copy()
+		self.bodies_structure = self.structure
+		self.merged_bodies = None # (structure, copy of the bodies) made by the worker after bodies got merged
+
+
+	# control (called by the renderer)
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name="simulation", daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		with self.condition:
+			self.running = False
+			self.condition.notify()
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+
+	def advance(self, delta_time):
+		# the simulation should run delta_time further
+		with self.condition:
+			latest_time = self.snapshots[1].time
+			self.target_time = min(self.target_time + delta_time, latest_time + SimulationWorker.MAX_LAG_STEPS * self.simulation.step_size)
+			self.display_delay = max(delta_time, self.simulation.step_size)
+			self.condition.notify()
+
+	def modify(self, function):
+		# runs function while the worker doesn't step, afterwards the bodies get copied again
+		with self.simulation_lock:
+			result = function()
+			with self.condition:
+				self.structure += 1
+				self.target_time = self.simulation.time
+				self.publish()
+				self.snapshots[0].write(self.simulation, self.structure)
+				self.merged_bodies = None
+			self.bodies = self.simulation.bodies.copy()
+			self.bodies_structure = self.structure
+		return result
+
+	def query_radius(self, x, y, radius):
+		# indices of the bodies that may be drawn within radius of (x, y) (none while the drawn bodies get replaced)
+		with self.condition:
+			(previous, latest) = self.snapshots[:2]
+			if latest.structure != self.bodies_structure:
+				return np.zeros(0, dtype=np.int64)
+
+			# the drawn bodies are between the 2 snapshots, so at most as far from the latest one as they moved in between
+			if previous.structure == latest.structure:
+				radius += np.sqrt(np.max((latest.pos_x - previous.pos_x) ** 2 + (latest.pos_y - previous.pos_y) ** 2, initial=0.0))
+			return latest.spatial_index.query_radius(x, y, radius)
+
+	def update_bodies(self):
+		# moves the drawn bodies to the interpolated positions
+		with self.condition:
+			(previous, latest) = self.snapshots[:2]
+			if latest.structure != self.bodies_structure:
+				if self.merged_bodies is None or self.merged_bodies[0] != latest.structure:
+					return # the bodies get replaced by modify
+				(self.bodies_structure, self.bodies) = self.merged_bodies
+				self.merged_bodies = None
+
+			display_time = self.target_time - self.display_delay
+			if previous.structure == latest.structure and previous.time < display_time < latest.time:
+				fraction = (display_time - previous.time) / (latest.time - previous.time)
+				np.multiply(previous.pos_x, 1.0 - fraction, out=self.bodies.pos_x)
+				self.bodies.pos_x += fraction * latest.pos_x
+				np.multiply(previous.pos_y, 1.0 - fraction, out=self.bodies.pos_y)
+				self.bodies.pos_y += fraction * latest.pos_y
+			else:
+				self.bodies.pos_x[:] = latest.pos_x
+				self.bodies.pos_y[:] = latest.pos_y
+
+
+	# worker thread
+
+	def run(self):
+		allowed_steps = 0.0 # steps the cap allows right now
+		last_time = time.perf_counter()
+
+		while True:
+			with self.condition:
+				while self.running and self.target_time - self.simulation.time < self.simulation.step_size:
+					self.condition.wait()
+				if not self.running:
+					return
+				step_count = min(SimulationWorker.MAX_STEPS_PER_CHUNK, int((self.target_time - self.simulation.time) // self.simulation.step_size))
+
+			# limit the number of steps per second
+			if self.max_steps_per_second > 0:
+				now = time.perf_counter()
+				allowed_steps = min(allowed_steps + (now - last_time) * self.max_steps_per_second, max(1.0, 0.1 * self.max_steps_per_second))
+				last_time = now
+				if allowed_steps < 1.0:
+					time.sleep((1.0 - allowed_steps) / self.max_steps_per_second)
+					continue
+				step_count = min(step_count, int(allowed_steps))
+				allowed_steps -= step_count
+
+			with self.simulation_lock:
+				# modify may have changed the simulation in the meantime
+				with self.condition:
+					step_count = min(step_count, int((self.target_time - self.simulation.time) // self.simulation.step_size))
+				if step_count <= 0:
+					continue
+
+				self.simulation.step(step_count)
+
+				# bodies got merged, the renderer needs a new copy
+				merged = len(self.simulation.bodies) != len(self.snapshots[1].pos_x)
+				bodies = self.simulation.bodies.copy() if merged else None
+				with self.condition:
+					if merged:
+						self.structure += 1
+						self.merged_bodies = (self.structure, bodies)
+					self.publish()
+
+	def publish(self):
+		# the free buffer becomes the latest snapshot, the previous one becomes free (needs the condition)
+		(previous, latest, free) = self.snapshots
+		free.write(self.simulation, self.structure)
+		self.snapshots = [latest, free, previous]
@@ -0,0 +1,206 @@
+import math
+
+import numpy as np
+
+class SpatialGrid:
+	# A uniform grid over the positions of the bodies (in km) for finding bodies near a point or near each other without checking all of them.
+	# The bodies are sorted by the key of their cell, so the bodies of a cell are a contiguous range of order.
+	# update keeps the order of the last update and sorts again from there: bodies only move a little between two steps,
+	# so the keys are almost sorted and the (stable) sort is close to O(N).
+	# The cells start with BODIES_PER_CELL bodies on average over the bounding box, in clustered systems (like a disk with a dense center)
+	# most bodies would be in crowded cells, so the cells get smaller until a body shares its cell with about BODIES_PER_CELL bodies.
+	# The simulation updates its grid after the steps, the arrays of a grid are never changed in place (only replaced),
+	# so copies of a grid can share them.
+
+	BODIES_PER_CELL = 2 # on average, if the bodies were evenly spread over their bounding box
+	MAX_QUERY_CELLS = 4096 # bigger queries check all bodies instead
+	MAX_RESIZES = 4 # of the cells per update
+	KEY_OFFSET = 1 << 31 # cell coordinates are stored as 32 bit unsigned numbers in the key
+
+	def __init__(self):
+		self.count = 0
+		self.base_cell_size = 0.0 # in km, for BODIES_PER_CELL bodies per cell in the bounding box
+		self.cell_size = 0.0 # in km
+		self.pos_x = np.zeros(0)
+		self.pos_y = np.zeros(0)
+		self.order = np.zeros(0, dtype=np.int64) # body indices sorted by the key of their cell
+		self.keys = np.zeros(0, dtype=np.int64) # key of the cell of order[i]
+		self.cell_x = np.zeros(0, dtype=np.int64) # cell of order[i]
+		self.cell_y = np.zeros(0, dtype=np.int64)
+
+	def update(self, pos_x, pos_y):
+		# has to be called after the bodies moved and before the next query
+		count = len(pos_x)
+		self.pos_x = pos_x
+		self.pos_y = pos_y
+		if count == 0:
+			self.count = 0
+			self.order = np.zeros(0, dtype=np.int64)
+			self.keys = np.zeros(0, dtype=np.int64)
+			self.cell_x = np.zeros(0, dtype=np.int64)
+			self.cell_y = np.zeros(0, dtype=np.int64)
+			return
+
+		# the cells are made new when the bodies changed or spread out a lot
+		extent = max(np.ptp(pos_x), np.ptp(pos_y), 1.0)
+		base_cell_size = extent / max(1.0, np.sqrt(count / SpatialGrid.BODIES_PER_CELL))
+		if count != self.count or not 0.5 * self.base_cell_size <= base_cell_size <= 2.0 * self.base_cell_size:
+			self.count = count
+			self.base_cell_size = base_cell_size
+			self.cell_size = base_cell_size
+			self.order = np.arange(count)
+
+		for i in range(SpatialGrid.MAX_RESIZES + 1):
+			(cell_x, cell_y) = self.calc_cells(pos_x[self.order], pos_y[self.order])
+			keys = SpatialGrid.calc_keys(cell_x, cell_y)
+			resort = np.argsort(keys, kind="stable")
+			self.order = self.order[resort]
+			self.keys = keys[resort]
+			self.cell_x = cell_x[resort]
+			self.cell_y = cell_y[resort]
+
+			# the number of bodies in the cell of an average body grows with the area of the cells
+			factor = np.sqrt(self.calc_occupancy() / SpatialGrid.BODIES_PER_CELL)
+			if 0.5 <= factor <= 2.0 or (factor < 0.5 and self.cell_size >= self.base_cell_size) or i == SpatialGrid.MAX_RESIZES:
+				break
+			self.cell_size = min(self.cell_size / factor, self.base_cell_size)
+
+	def copy(self, pos_x, pos_y):
+		# the same grid over a copy of the positions it was updated with (e.g. a snapshot for another thread)
+		grid = SpatialGrid.__new__(SpatialGrid)
+		grid.__dict__.update(self.__dict__)
+		grid.pos_x = pos_x
+		grid.pos_y = pos_y
+		return grid
+
+
+	# queries
+
+	def query_radius(self, x, y, radius):
+		# indices of all bodies with a distance of at most radius (in km) to (x, y), sorted
+		candidates = self.get_candidates(x - radius, y - radius, x + radius, y + radius)
+		distance_squared = (self.pos_x[candidates] - x) ** 2 + (self.pos_y[candidates] - y) ** 2
+		return np.sort(candidates[distance_squared <= radius * radius])
+
+	def nearest(self, x, y, max_distance = np.inf):
+		# index of the body closest to (x, y) or -1 if there is none within max_distance
+		if self.count == 0:
+			return -1
+
+		# search in growing squares until one contains a body, the closest of them is the closest of all
+		radius = self.cell_size
+		while True:
+			radius = min(radius, max_distance)
+			candidates = self.query_radius(x, y, radius)
+			if len(candidates) > 0:
+				distance_squared = (self.pos_x[candidates] - x) ** 2 + (self.pos_y[candidates] - y) ** 2
+				return int(candidates[np.argmin(distance_squared)])
+			if radius >= max_distance or self.get_cell_count(x - radius, y - radius, x + radius, y + radius) > SpatialGrid.MAX_QUERY_CELLS:
+				break
+			radius *= 2.0
+
+		# far away from all bodies
+		distance_squared = (self.pos_x - x) ** 2 + (self.pos_y - y) ** 2
+		closest = int(np.argmin(distance_squared))
+		return closest if distance_squared[closest] <= max_distance * max_distance else -1
+
+	def find_pairs(self, max_distance, block_size):
+		# candidate pairs of bodies that may be at most max_distance apart (their cells are close enough), every pair once
+		# yields blocks of about block_size pairs as 2 arrays of body indices, max_distance should only be a few cells
+		if self.count < 2:
+			return
+
+		# every body is paired with the bodies after it in its own cell and with all bodies in the neighbouring cells
+		# in one half of the neighbourhood (the other half finds the same pairs the other way round) that are at most max_distance
+		# away from it (bodies that are small compared with a cell are only paired with other cells near the edges of their cell)
+		reach = math.ceil(max_distance / self.cell_size)
+		cell_ends = np.flatnonzero(np.r_[self.keys[1:] != self.keys[:-1], True]) + 1
+		ends = np.repeat(cell_ends, np.diff(np.r_[0, cell_ends]))
+		shared = np.flatnonzero(ends > np.arange(self.count) + 1) # bodies that aren't the last in their cell
+		(owners, starts, ends) = ([shared], [shared + 1], [ends[shared]])
+
+		# positions inside the cells and distances in cells (like calc_cells), only bodies near the edges that face
+		# the half of the neighbourhood can have a pair there
+		(local_x, local_y) = (self.pos_x[self.order] / self.cell_size, self.pos_y[self.order] / self.cell_size)
+		local_x -= np.floor(local_x)
+		local_y -= np.floor(local_y)
+		max_cell_distance = max_distance / self.cell_size
+		near_edge = np.flatnonzero((local_x >= 1.0 - max_cell_distance) | (local_y <= max_cell_distance) | (local_y >= 1.0 - max_cell_distance))
+		(local_x, local_y) = (local_x[near_edge], local_y[near_edge])
+		for offset_x in range(0, reach + 1):
+			for offset_y in range(-reach, reach + 1):
+				if offset_x == 0 and offset_y <= 0:
+					continue
+				gap_x = SpatialGrid.calc_gap(local_x, offset_x)
+				gap_y = SpatialGrid.calc_gap(local_y, offset_y)
+				valid = near_edge[gap_x * gap_x + gap_y * gap_y <= max_cell_distance * max_cell_distance]
+				(cell_x, cell_y) = (self.cell_x[valid] + offset_x, self.cell_y[valid] + offset_y)
+				inside = (cell_x < 1 << 32) & (cell_y >= 0) & (cell_y < 1 << 32)
+				(valid, cell_keys) = (valid[inside], SpatialGrid.calc_keys(cell_x[inside], cell_y[inside]))
+				owners.append(valid)
+				starts.append(np.searchsorted(self.keys, cell_keys, side="left"))
+				ends.append(np.searchsorted(self.keys, cell_keys, side="right"))
+
+		owners = np.concatenate(owners)
+		starts = np.concatenate(starts)
+		lengths = np.concatenate(ends) - starts
+
+		# the ranges are expanded into pairs in blocks, so that the temporary arrays stay small
+		cumulative_length = np.cumsum(lengths)
+		start = 0
+		while start < len(lengths):
+			done = cumulative_length[start - 1] if start > 0 else 0
+			stop = min(len(lengths), max(start + 1, int(np.searchsorted(cumulative_length, done + block_size, side="right"))))
+			block_lengths = lengths[start:stop]
+			first = np.repeat(owners[start:stop], block_lengths)
+			second = np.arange(block_lengths.sum()) + np.repeat(starts[start:stop] - np.cumsum(block_lengths) + block_lengths, block_lengths)
+			yield (self.order[first], self.order[second])
+			start = stop
+
+
+	# utility
+
+	def calc_occupancy(self):
+		# average number of bodies in the cell of a body (including itself)
+		cell_starts = np.flatnonzero(np.r_[True, self.keys[1:] != self.keys[:-1]])
+		cell_counts = np.diff(np.r_[cell_starts, self.count])
+		return np.sum(cell_counts * cell_counts) / self.count
+
+	def calc_gap(local, offset):
+		# distance in cells along one axis from positions inside their cells (0 to 1) to the cells offset cells further
+		if offset > 0:
+			return np.maximum(offset - local, 0.0)
+		if offset < 0:
+			return np.maximum(local - (offset + 1), 0.0)
+		return 0.0
+
+	def calc_keys(cell_x, cell_y):
+		return (cell_x << 32) | cell_y
+
+	def calc_cells(self, pos_x, pos_y):
+		cell_x = np.clip(np.floor(np.asarray(pos_x) / self.cell_size) + SpatialGrid.KEY_OFFSET, 0, (1 << 32) - 1).astype(np.int64)
+		cell_y = np.clip(np.floor(np.asarray(pos_y) / self.cell_size) + SpatialGrid.KEY_OFFSET, 0, (1 << 32) - 1).astype(np.int64)
+		return (cell_x, cell_y)
+
+	def get_cell_count(self, min_x, min_y, max_x, max_y):
+		# with python ints, the count of a huge query would wrap around in int64
+		((first_x, last_x), (first_y, last_y)) = (cells.tolist() for cells in self.calc_cells([min_x, max_x], [min_y, max_y]))
+		return (last_x - first_x + 1) * (last_y - first_y + 1)
+
+	def get_candidates(self, min_x, min_y, max_x, max_y):
+		# all bodies in the cells that touch the rectangle
+		if self.count == 0:
+			return np.zeros(0, dtype=np.int64)
+		if self.get_cell_count(min_x, min_y, max_x, max_y) > SpatialGrid.MAX_QUERY_CELLS:
+			return np.arange(self.count)
+
+		((first_x, last_x), (first_y, last_y)) = self.calc_cells([min_x, max_x], [min_y, max_y])
+		(cell_x, cell_y) = np.meshgrid(np.arange(first_x, last_x + 1), np.arange(first_y, last_y + 1), indexing="ij")
+		cell_keys = SpatialGrid.calc_keys(cell_x, cell_y).ravel() # keys with cell_x >= 2^31 wrap around, but searchsorted only needs self.keys sorted (they wrap the same way)
+
+		# ranges of order that belong to the cells, concatenated
+		starts = np.searchsorted(self.keys, cell_keys, side="left")
+		ends = np.searchsorted(self.keys, cell_keys, side="right")
+		lengths = ends - starts
+		positions = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+		return self.order[positions]
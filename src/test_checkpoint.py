@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from body import Body
+from checkpoint import load_checkpoint, save_checkpoint
+from integrator import create_integrator
+from force_engine import DirectForceEngine
+from scenario import DEFAULT_SCENARIO, load_scenario
+from simulation import Simulation
+from utility import GREY
+
+STEP_COUNT = 200
+
+def create_simulation(integrator_name):
+	# the solar system with 2 suns, so that the sun is inactive too, and an inactive body that isn't special
+	(bodies, inactive_bodies) = load_scenario(DEFAULT_SCENARIO)
+	inactive_bodies.append(Body("comet", 1e14, 5e8, 0.0, 0.0, 2e4, 2, GREY))
+	simulation = Simulation(DirectForceEngine(), create_integrator(integrator_name), 3_600_000, bodies, inactive_bodies)
+	simulation.swap_suns()
+	return simulation
+
+def get_state(simulation):
+	bodies = simulation.bodies
+	arrays = {field: array[:bodies.count].copy() for (field, array) in bodies.arrays.items()}
+	inactive_bodies = [(body.name, body.state) for body in simulation.inactive_bodies]
+	return (simulation.time, simulation.step_count, arrays, list(bodies.names), inactive_bodies)
+
+def assert_same_state(simulation, other):
+	(time, step_count, arrays, names, inactive_bodies) = get_state(simulation)
+	(other_time, other_step_count, other_arrays, other_names, other_inactive_bodies) = get_state(other)
+	assert (time, step_count, names, inactive_bodies) == (other_time, other_step_count, other_names, other_inactive_bodies)
+	for field in arrays:
+		assert np.array_equal(arrays[field], other_arrays[field]), field
+
+@pytest.mark.parametrize("integrator_name", ["leapfrog", "block"])
+def test_resumed_run_matches_uninterrupted_run(tmp_path, integrator_name):
+	uninterrupted = create_simulation(integrator_name)
+	uninterrupted.step(STEP_COUNT)
+
+	interrupted = create_simulation(integrator_name)
+	interrupted.step(STEP_COUNT // 2)
+	save_checkpoint(str(tmp_path / "checkpoint.npz"), interrupted)
+	(resumed, extra_state) = load_checkpoint(str(tmp_path / "checkpoint.npz"))
+	resumed.step(STEP_COUNT - STEP_COUNT // 2)
+	assert_same_state(resumed, uninterrupted)
+
+	# the inactive sun comes back as the special body it was
+	assert [body.name for body in resumed.inactive_bodies] == ["comet", "sun"]
+	assert resumed.sun is resumed.inactive_bodies[1]
+	resumed.swap_suns()
+	uninterrupted.swap_suns()
+	assert_same_state(resumed, uninterrupted)
@@ -0,0 +1,17 @@
+import numpy as np
+
+from force_engine import BarnesHutForceEngine, DirectForceEngine
+from scenario import DEFAULT_SCENARIO, load_scenario
+
+def calc_relative_errors(force_engine):
+	# error of the acceleration of every body of the solar system relative to direct summation
+	(bodies, inactive_bodies) = load_scenario(DEFAULT_SCENARIO)
+	(direct_x, direct_y) = DirectForceEngine().calc_accelerations(bodies.pos_x, bodies.pos_y, bodies.mass)
+	(x, y) = force_engine.calc_accelerations(bodies.pos_x, bodies.pos_y, bodies.mass)
+	return np.hypot(x - direct_x, y - direct_y) / np.hypot(direct_x, direct_y)
+
+def test_barnes_hut_without_approximation_matches_direct_summation():
+	assert calc_relative_errors(BarnesHutForceEngine(theta=0)).max() < 1e-12
+
+def test_barnes_hut_approximation_is_close_to_direct_summation():
+	assert calc_relative_errors(BarnesHutForceEngine(theta=0.5)).max() < 1e-3
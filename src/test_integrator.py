@@ -0,0 +1,27 @@
+import numpy as np
+
+from body_system import BodySystem
+from force_engine import DirectForceEngine
+from integrator import BlockTimestepIntegrator
+from simulation import Simulation
+from utility import GREY
+
+def create_simulation(mass, pos_x, pos_y, velocity_x, velocity_y):
+	bodies = BodySystem(len(mass))
+	bodies.add_many(np.array(mass), np.array(pos_x), np.array(pos_y), np.array(velocity_x), np.array(velocity_y), np.ones(len(mass), dtype=np.int64), np.array([GREY] * len(mass)))
+	return Simulation(DirectForceEngine(), BlockTimestepIntegrator(), 3_600_000, bodies)
+
+def test_block_step_of_a_single_body_uses_the_largest_step():
+	# no acceleration and no jerk, which used to mean 2^MAX_LEVEL substeps
+	simulation = create_simulation([1e24], [0.0], [0.0], [1000.0], [0.0])
+	simulation.step()
+	assert simulation.integrator.level.tolist() == [0]
+	assert simulation.integrator.force_evaluations <= 4
+	assert abs(simulation.bodies.pos_x[0] - 3600.0) < 1e-9 # 1 km / s for an hour
+
+def test_block_step_with_a_body_without_net_force():
+	# the center of a symmetric system feels no force
+	simulation = create_simulation([1e24, 1e30, 1e30], [0.0, -1e8, 1e8], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 1e4, -1e4])
+	simulation.step()
+	assert simulation.integrator.level[0] == 0
+	assert simulation.integrator.force_evaluations < 1000
@@ -0,0 +1,17 @@
+from force_engine import DirectForceEngine
+from headless import MS_PER_DAY, relative_drift
+from integrator import create_integrator
+from scenario import DEFAULT_SCENARIO, load_scenario
+from simulation import Simulation
+
+def test_solar_system_conserves_energy_and_angular_momentum_over_a_year():
+	# leapfrog with 10 minute steps, measured drift: 6.5e-12 (energy) and 3.1e-14 (angular momentum)
+	(bodies, inactive_bodies) = load_scenario(DEFAULT_SCENARIO)
+	simulation = Simulation(DirectForceEngine(), create_integrator("leapfrog"), 600_000, bodies, inactive_bodies)
+	start_energy = simulation.calc_energy()
+	start_angular_momentum = simulation.calc_angular_momentum()
+
+	simulation.step(round(365 * MS_PER_DAY / simulation.step_size))
+
+	assert relative_drift(start_energy, simulation.calc_energy()) < 2e-11
+	assert relative_drift(start_angular_momentum, simulation.calc_angular_momentum()) < 1e-13
@@ -0,0 +1,178 @@
+import math
+import random
+from collections import OrderedDict
+from types import MethodType
+
+import numpy as np
+import pygame
+
+class TiledBackground:
+	# The model plane is divided into square tiles, the size of a tile is a power of 2 (in km) that depends on the zoom.
+	# The stars of a tile only depend on (seed, tile x, tile y, level), so they are the same every time a region is visible again
+	# and nothing has to be updated when the view changes. The stars of a tile are generated once per level and the tiles
+	# rendered at a zoom are kept in bounded LRU caches. While the zoom stays the same, drawing the background is one batched
+	# blit of the visible tiles. A frame with a new zoom draws the cached stars of the visible tiles as sprites instead
+	# (one batched blit, too), tiles only get rendered once the zoom stopped changing.
+
+	TILE_PIXELS = 128 # tiles are between TILE_PIXELS and 2 * TILE_PIXELS wide on the screen
+	STARS_PER_TILE = 40 # mean number of stars in a tile
+	MAX_CACHED_TILES = 128
+	MAX_CACHED_STARS = 1024 # tiles whose stars are kept
+	PADDING = 3 # in pixels around a rendered tile (the largest star radius), so that stars at the edge aren't cut off
+
+	def __init__(self, view_width, view_start_x, view_start_y, screen_ratio, pos_to_screen_pos: MethodType, seed = None):
+		self.seed = seed if seed is not None else random.randrange(1 << 32)
+		self.view_width = view_width
+		self.view_start_x = view_start_x
+		self.view_start_y = view_start_y
+		self.screen_ratio = screen_ratio # width / height
+		self.pos_to_screen_pos: MethodType = pos_to_screen_pos
+		self.tiles = OrderedDict() # (tile_x, tile_y, level, tile_pixels) -> surface, the least recently used tile comes first
+		self.stars = OrderedDict() # (tile_x, tile_y, level) -> (pos_x, pos_y, draw_radius, sprites), least recently used first
+		self.sprites = {} # (draw_radius, brightness) -> surface
+		self.last_zoom = None # (level, tile_pixels) of the last frame
+
+
+	# view changes only need to be remembered
+
+	def zoom_in(self, new_view_width, new_view_start_x, new_view_start_y):
+		self.set_view(new_view_width, new_view_start_x, new_view_start_y)
+
+	def zoom_out(self, new_view_width, new_view_start_x, new_view_start_y):
+		self.set_view(new_view_width, new_view_start_x, new_view_start_y)
+
+	def change_view_starts(self, new_view_start_x, new_view_start_y):
+		self.set_view(self.view_width, new_view_start_x, new_view_start_y)
+
+	def resize(self, new_view_start_x, new_view_start_y, new_screen_ratio):
+		self.screen_ratio = new_screen_ratio
+		self.set_view(self.view_width, new_view_start_x, new_view_start_y)
+
+	def set_view(self, view_width, view_start_x, view_start_y):
+		self.view_width = view_width
+		self.view_start_x = view_start_x
+		self.view_start_y = view_start_y
+
+	def get_state(self):
+		return {
+			"seed": self.seed,
+			"view_width": self.view_width,
+			"view_start_x": self.view_start_x,
+			"view_start_y": self.view_start_y,
+			"screen_ratio": self.screen_ratio,
+		}
+
+	def set_state(self, state):
+		# also works with the state of a DynamicBackground
+		self.seed = state["seed"]
+		self.screen_ratio = state["screen_ratio"]
+		self.set_view(state["view_width"], state["view_start_x"], state["view_start_y"])
+		self.tiles.clear()
+		self.stars.clear()
+
+
+	# drawing
+
+	def draw(self, screen):
+		(screen_width, screen_height) = screen.get_size()
+		scale = screen_width / self.view_width # pixels per km
+
+		# the level is chosen so that a tile is between TILE_PIXELS and 2 * TILE_PIXELS wide
+		level = math.ceil(math.log2(TiledBackground.TILE_PIXELS / scale))
+		tile_size = 2.0 ** level # in km
+		tile_pixels = math.ceil(tile_size * scale)
+
+		# all tiles that touch the view
+		first_x = math.floor(self.view_start_x / tile_size)
+		first_y = math.floor(self.view_start_y / tile_size)
+		last_x = math.floor((self.view_start_x + self.view_width) / tile_size)
+		last_y = math.floor((self.view_start_y + screen_height / scale) / tile_size)
+		(tile_x, tile_y) = np.meshgrid(np.arange(first_x, last_x + 1), np.arange(first_y, last_y + 1))
+		(tile_x, tile_y) = (tile_x.ravel(), tile_y.ravel())
+
+		(screen_x, screen_y) = self.pos_to_screen_pos(tile_x * tile_size, tile_y * tile_size)
+		screen_x = np.round(screen_x).astype(np.int64)
+		screen_y = np.round(screen_y).astype(np.int64)
+		(tile_x, tile_y) = (tile_x.tolist(), tile_y.tolist())
+
+		# every step of a zoom would need new tiles, which are only worth rendering when they get drawn again
+		zooming = self.last_zoom != (level, tile_pixels)
+		self.last_zoom = (level, tile_pixels)
+		if zooming:
+			self.draw_stars(screen, tile_x, tile_y, screen_x, screen_y, level, tile_pixels)
+			return
+
+		surfaces = [self.get_tile(x, y, level, tile_pixels) for (x, y) in zip(tile_x, tile_y)]
+		padding = TiledBackground.PADDING
+		screen.blits(list(zip(surfaces, zip((screen_x - padding).tolist(), (screen_y - padding).tolist()))), doreturn=False)
+
+	def draw_stars(self, target, tile_x, tile_y, tile_left, tile_top, level, tile_pixels):
+		# draws the stars of the tiles with their top left corners at (tile_left, tile_top) as one batched blit
+		(left, top, sprites) = ([], [], [])
+		for (x, y, start_x, start_y) in zip(tile_x, tile_y, tile_left.tolist(), tile_top.tolist()):
+			(pos_x, pos_y, draw_radius, tile_sprites) = self.get_stars(x, y, level)
+			left.append(np.floor(start_x + pos_x * tile_pixels).astype(np.int64) - draw_radius)
+			top.append(np.floor(start_y + pos_y * tile_pixels).astype(np.int64) - draw_radius)
+			sprites += tile_sprites
+		if sprites:
+			target.blits(list(zip(sprites, zip(np.concatenate(left).tolist(), np.concatenate(top).tolist()))), doreturn=False)
+
+	def get_tile(self, tile_x, tile_y, level, tile_pixels):
+		key = (tile_x, tile_y, level, tile_pixels)
+		surface = self.tiles.get(key)
+		if surface is not None:
+			self.tiles.move_to_end(key)
+			return surface
+
+		surface = self.render_tile(tile_x, tile_y, level, tile_pixels)
+		self.tiles[key] = surface
+		if len(self.tiles) > TiledBackground.MAX_CACHED_TILES:
+			self.tiles.popitem(last=False)
+		return surface
+
+	def render_tile(self, tile_x, tile_y, level, tile_pixels):
+		# the tile with PADDING on every side
+		padding = TiledBackground.PADDING
+		surface = pygame.Surface((tile_pixels + 2 * padding, tile_pixels + 2 * padding))
+		self.draw_stars(surface, [tile_x], [tile_y], np.array([padding]), np.array([padding]), level, tile_pixels)
+		surface.set_colorkey((0, 0, 0), pygame.RLEACCEL) # tiles only cover the screen where they have stars
+		return surface
+
+	def get_stars(self, tile_x, tile_y, level):
+		key = (tile_x, tile_y, level)
+		stars = self.stars.get(key)
+		if stars is not None:
+			self.stars.move_to_end(key)
+			return stars
+
+		(pos_x, pos_y, brightness, draw_radius) = self.generate_tile_stars(tile_x, tile_y, level)
+		stars = (pos_x, pos_y, draw_radius, [self.get_sprite(r, b) for (r, b) in zip(draw_radius.tolist(), brightness.tolist())])
+		self.stars[key] = stars
+		if len(self.stars) > TiledBackground.MAX_CACHED_STARS:
+			self.stars.popitem(last=False)
+		return stars
+
+	def get_sprite(self, draw_radius, brightness):
+		# sprites are only created when they are needed the first time
+		key = (draw_radius, brightness)
+		sprite = self.sprites.get(key)
+		if sprite is None:
+			sprite = pygame.Surface((2 * draw_radius + 1, 2 * draw_radius + 1))
+			sprite.set_colorkey((0, 0, 0), pygame.RLEACCEL) # the corners are transparent
+			pygame.draw.circle(sprite, (brightness, brightness, brightness), (draw_radius, draw_radius), draw_radius)
+			self.sprites[key] = sprite
+		return sprite
+
+	def generate_tile_stars(self, tile_x, tile_y, level):
+		# positions are relative to the tile (0 to 1), the same tile always gets the same stars
+		rng = np.random.default_rng([self.seed, tile_x & 0xFFFF_FFFF_FFFF_FFFF, tile_y & 0xFFFF_FFFF_FFFF_FFFF, level & 0xFFFF_FFFF])
+		count = rng.poisson(TiledBackground.STARS_PER_TILE)
+
+		pos_x = rng.random(count)
+		pos_y = rng.random(count)
+		brightness = rng.integers(100, 256, count)
+		random_num = rng.integers(0, 30, count)
+		draw_radius = np.ones(count, dtype=np.int64)
+		draw_radius[random_num < 6] = 2 # p = 1/5
+		draw_radius[random_num == 29] = 3 # p = 1/30
+		return (pos_x, pos_y, brightness, draw_radius)